@@ -1,14 +1,18 @@
-from io import BytesIO, StringIO
+import os
+import shutil
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED
 from functools import wraps
+from tempfile import mkdtemp
 import logging
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, send_file, redirect, session, g
+from flask import Flask, render_template, request, send_file, redirect, session, g, jsonify
 from flask_oidc import OpenIDConnect, MemoryCredentials
 from domain import BenefitType, Delivery, Money, Benefit, BenefitException, rndDate, getWeekEnds, Summary, SummaryFields
 from domain import PaymentProvider, DonationType
-from infrastructure import StoreFactory, StoreConfig, StoreType, StoreDuplicate, TransactionImporterFactory
+from infrastructure import CachingStore, StoreCache, StoreFactory, StoreConfig, StorePool, StoreType, ImportJobRunner, expandUpload, saveUpload
+from infrastructure import storeMetrics
 from reports import getDonationsReport
-from chardet.universaldetector import UniversalDetector
 import config
 
 BASE_URI = f"https://{config.HOST}:{config.PORT}"
@@ -37,6 +41,18 @@ oidc = OpenIDConnect(app=app, credentials_store=MemoryCredentials())
 
 logging.basicConfig(level=logging.DEBUG)
 
+storeConfig = StoreConfig(StoreType.SQLLITE, config.SQLITE3DB)
+# every store in this process shares one read cache, so a write through any of them invalidates it for all
+storeCache = StoreCache(storeConfig.readCacheItems, storeConfig.readCacheSeconds)
+
+
+def openStore():
+    return CachingStore(StoreFactory(storeConfig), storeCache)
+
+
+storePool = StorePool(openStore, storeConfig.poolSize)
+importJobRunner = ImportJobRunner(openStore)
+
 
 def require_login(view_func):
     """
@@ -58,18 +74,17 @@ def require_login(view_func):
 
 
 def getStore():
-    """create singleton on first call
+    """take a store from the pool on first call, it goes back when the request ends
     """
     if not hasattr(g, 'store'):
-        store = StoreFactory(StoreConfig(StoreType.SQLLITE, config.SQLITE3DB))
-        g.store = store
+        g.store = storePool.acquire()
     return g.store
 
 
 @app.teardown_appcontext
 def teardownContext(error):
     if hasattr(g, 'store'):
-        g.store.close()
+        storePool.release(g.store)
 
 
 @app.route('/benefits/add')
@@ -85,10 +100,7 @@ def benefitsAdd():
 def getQualifyingDonors(storeId):
     store = getStore()
     benefit = store.getBenefit(storeId)
-    output = BytesIO()
-    output.write("Email Address\n".encode("utf8"))
-    output.writelines([(donor+'\n').encode("utf8") for donor in store.getQualifyingDonors(benefit)])
-    output.seek(0)
+    output = BytesIO(benefitDonorsCsv(store.getQualifyingDonors(benefit)).encode("utf8"))
     return send_file(
         output,
         as_attachment=True,
@@ -98,6 +110,40 @@ def getQualifyingDonors(storeId):
     )
 
 
+def benefitDonorsCsv(donors):
+    return "Email Address\n" + ''.join(donor+'\n' for donor in donors)
+
+
+@app.route('/benefits/getDonors')
+@require_login
+def getAllQualifyingDonors():
+    """a zip of the donors csv of every benefit with the status asked for, evaluated together
+    """
+    store = getStore()
+    benefits = getBenefitsByStatus(store, request.args.get("status"))
+    donors = store.evaluateBenefits(benefits)
+    output = BytesIO()
+    with ZipFile(output, 'w', ZIP_DEFLATED) as zipFile:
+        for benefit in benefits:
+            zipFile.writestr(benefit.csvFileName, benefitDonorsCsv(donors[benefit._storeId]))
+    output.seek(0)
+    return send_file(
+        output,
+        as_attachment=True,
+        attachment_filename='benefitDonors.zip',
+        mimetype='application/zip',
+        cache_timeout=-1
+    )
+
+
+def getBenefitsByStatus(store, status):
+    if status == "current":
+        return store.getCurrentBenefits()
+    elif status == "delivered":
+        return store.getDeliveredBenefits()
+    return store.getPendingBenefits()
+
+
 @app.route('/benefits/', methods=['GET'])
 @require_login
 def getBenefits():
@@ -164,34 +210,64 @@ def donationsUpload():
         paymentProvider = request.args["paymentProvider"]
         return render_template('donations/upload.html', active="donations", paymentProvider=paymentProvider)
 
-    try:
-        store = getStore()
-        paymentProvider = PaymentProvider[request.form["paymentProvider"]]
-        file = request.files['file']
+    store = getStore()
+    paymentProvider = PaymentProvider[request.form["paymentProvider"]]
+    files = request.files.getlist('file')
+    for file in files:
         checkFileAllowed(file.filename)
-        # bug in spooledTemporaryFile - AttributeError: 'SpooledTemporaryFile' object has no attribute 'readable'
-        # textWrapper=io.TextIOWrapper(file.stream,encoding='utf-8',write_through=True)
-        # workaround
-        encoding = getEncoding(file)
-        textWrapper = StringIO(file.read().decode(encoding))
-
-        donations = []
-        importer = TransactionImporterFactory(paymentProvider, textWrapper)
-
-        dupes = []
-        added = []
-        for donation in importer:
-            donations.append(donation)
-            try:
-                store.insertDonation(donation)
-                added.append(donation)
-            except StoreDuplicate:
-                dupes.append(donation)
-
-        return render_template('donations/uploadResult.html', active="donations", filename=file.filename, added=added, badRows=importer.badRows, dupes=dupes)
-    except Exception as e:
-        raise e
-        return donationsByWeek()
+
+    # the job removes the directory once it has imported the files
+    directory = mkdtemp(prefix='sdmUpload')
+    try:
+        uploaded = []
+        for index, file in enumerate(files):
+            path = os.path.join(directory, str(index))
+            sha256 = saveUpload(file.stream, path)
+            uploaded += expandUpload(file.filename, path, sha256)
+        job = importJobRunner.submit(store, ', '.join(file.filename for file in files), uploaded, paymentProvider, directory)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    return render_template('donations/uploadResult.html', active="donations", job=job)
+
+
+@app.route('/donations/imports/<storeId>')
+@require_login
+def getImportJob(storeId):
+    store = getStore()
+    return jsonify(store.getImportJob(storeId).toDict())
+
+
+@app.route('/donations/imports/<storeId>/rejects/<int:index>')
+@require_login
+def getImportRejects(storeId, index):
+    store = getStore()
+    job = store.getImportJob(storeId)
+    if index >= len(job.files) or not job.files[index]["rejects"]:
+        return f"no rejected rows for file {index}", 404
+    path = importJobRunner.rejectsPath(job.storeId, index)
+    if not os.path.exists(path):
+        return f"the rejected rows of file {index} have been removed", 404
+    return send_file(
+        path,
+        as_attachment=True,
+        attachment_filename=f"rejects-{os.path.basename(job.files[index]['filename'])}",
+        mimetype='text/csv',
+        cache_timeout=-1
+    )
+
+
+@app.route('/store/cache')
+@require_login
+def getStoreCacheStats():
+    return jsonify(storeCache.stats())
+
+
+@app.route('/store/metrics')
+@require_login
+def getStoreMetrics():
+    return jsonify(storeMetrics.snapshot())
 
 
 @app.route('/donations/<item>')
@@ -204,8 +280,7 @@ def donationsByWeek(item='byWeek'):
     endDate = rndDate(today, "week", "up") - timedelta(days=7)
     startDate = endDate - timedelta(days=(52*7)-1)
     weekEnds = getWeekEnds(startDate, endDate)
-    donations = store.getDonations(startDate, endDate)
-    summary = Summary(donations, [SummaryFields.SOURCE, SummaryFields.WEEK, SummaryFields.TYPE])
+    summary = Summary.fromRollups(store.getRollups(startDate, endDate), [SummaryFields.SOURCE, SummaryFields.WEEK, SummaryFields.TYPE])
     return render_template('donations/'+item+'.html', active="donations", weekEnds=weekEnds, summary=summary, sources=PaymentProvider, types=DonationType)
 
 
@@ -298,20 +373,11 @@ def getBenefitFromRequest():
     return Benefit.Factory(storeId, type, reward, startDate, endDate, delivery, minAmount, completed)
 
 
+UPLOADEXTENSIONS = ["csv", "zip"]
+
+
 def checkFileAllowed(filename):
     if '.' not in filename:
         raise Exception("no . in filename")
-    if filename.rsplit('.', 1)[1].lower() != "csv":
-        raise Exception("extension must be csv")
-
-
-def getEncoding(file):
-    originalPosition = file.tell()
-    detector = UniversalDetector()
-    for line in file.readlines():
-        detector.feed(line)
-        if detector.done:
-            break
-    detector.close()
-    file.seek(originalPosition)
-    return detector.result["encoding"].lower()
+    if filename.rsplit('.', 1)[1].lower() not in UPLOADEXTENSIONS:
+        raise Exception("extension must be csv or zip")
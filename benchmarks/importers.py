@@ -0,0 +1,81 @@
+"""
+rows/sec and peak memory for each TransactionImporter, and for the full upload path
+of encoding detection, streaming decode, parsing and bulk insert into a SQLite store
+
+    python -m benchmarks.importers --rows 100000
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from tempfile import TemporaryDirectory
+from domain import PaymentProvider
+from infrastructure import DecodingReader, EncodingDetector, StoreConfig, StoreFactory, StoreType, TransactionImporterFactory, importDonations
+from .transactionFiles import IMPORTERS, writeTransactionFile
+
+
+def measure(fn):
+    """
+    returns (seconds, peak bytes, result), timed without tracemalloc as it slows python down
+    """
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def parseOnly(path, paymentProvider):
+    def run():
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            importer = TransactionImporterFactory(paymentProvider, csvfile)
+            return sum(1 for _ in importer) + len(importer.badRows)
+    return run
+
+
+def uploadPath(path, paymentProvider, directory):
+    runs = []
+
+    def run():
+        config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, f"upload{len(runs)}.db"))
+        runs.append(config)
+        store = StoreFactory(config)
+        try:
+            with open(path, 'rb') as stream:
+                encoding = EncodingDetector().detect(stream, paymentProvider)
+                importer = TransactionImporterFactory(paymentProvider, DecodingReader(stream, encoding))
+                return importDonations(store, importer).parsed
+        finally:
+            store.close()
+    return run
+
+
+def report(name, rows, seconds, peak):
+    print(f"{name:<32} {rows:>10} rows {seconds:>8.2f}s {rows / seconds:>12,.0f} rows/s {peak / 2**20:>9.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the transaction importers")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--providers", nargs="*", choices=[p.name for p in PaymentProvider], default=[p.name for p in PaymentProvider])
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        for name in args.providers:
+            paymentProvider = PaymentProvider[name]
+            path = os.path.join(directory, f"{name.lower()}.csv")
+            writeTransactionFile(path, paymentProvider, args.rows)
+
+            seconds, peak, rows = measure(parseOnly(path, paymentProvider))
+            report(IMPORTERS[paymentProvider].__name__, rows, seconds, peak)
+
+            seconds, peak, rows = measure(uploadPath(path, paymentProvider, directory))
+            report(f"{name.lower()} upload", rows, seconds, peak)
+
+
+if __name__ == "__main__":
+    main()
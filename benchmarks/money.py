@@ -0,0 +1,61 @@
+"""
+per call cost of building Money while importing rows and reading benefit forms
+
+    python -m benchmarks.money --calls 1000000
+"""
+import argparse
+import re
+import timeit
+from iso4217 import Currency
+from domain import CURRENCYSYMBOLS, Money
+from infrastructure.transactionimporter import moneyFromColumns
+
+CURRENCYFIRST = re.compile(r'(?P<currency>[^\.0-9]+)(?P<amount>[\.0-9]+)')
+CURRENCYLAST = re.compile(r'(?P<amount>[\.0-9]+)(?P<currency>[^\.0-9]*)')
+STRINGS = ["GBP10", "£12.50", "20.00 USD", "EUR250.75", "5$"]
+REPEAT = 3
+
+
+def regexFromString(s):
+    """
+    Money.fromString as it was, with a regex and an uncached currency lookup, kept as the baseline
+    """
+    s = s.replace(" ", "").upper()
+    if str.isnumeric(s[0]):
+        matched = CURRENCYLAST.match(s)
+    else:
+        matched = CURRENCYFIRST.match(s)
+    currency = matched.group('currency').strip()
+    try:
+        currency = Currency(CURRENCYSYMBOLS[currency])
+    except KeyError:
+        currency = Currency(currency)
+    return Money(float(matched.group('amount')), currency)
+
+
+def report(name, calls, seconds, baseline=None):
+    line = f"{name:<24} {seconds / calls * 1e9:>8.0f} ns/call {seconds * 1e6 / calls:>8.2f} s/million rows"
+    if baseline:
+        line += f" {baseline / seconds:>6.1f}x"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark building Money")
+    parser.add_argument("--calls", type=int, default=1000000)
+    args = parser.parse_args()
+    calls = args.calls - args.calls % len(STRINGS)
+    repeats = calls // len(STRINGS)
+
+    def run(statement, fn):
+        # best of a few runs, as the machine's noise only ever adds time
+        return min(timeit.repeat(statement, globals={"fn": fn, "STRINGS": STRINGS}, number=repeats, repeat=REPEAT))
+
+    baseline = run("for s in STRINGS: fn(s)", regexFromString)
+    report("regex fromString", calls, baseline)
+    report("Money.fromString", calls, run("for s in STRINGS: fn(s)", Money.fromString), baseline)
+    report("importer columns", calls, run("for s in STRINGS: fn('gbp', '12.50')", moneyFromColumns), baseline)
+
+
+if __name__ == "__main__":
+    main()
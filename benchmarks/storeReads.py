@@ -0,0 +1,91 @@
+"""
+cost of decoding donation rows read from the store, before and after trusted decoding,
+and of streaming them from a SQLite store and a memory store with iterDonations
+
+    python -m benchmarks.storeReads --rows 200000
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from domain import Currency, Donation, DonationType, Money, PaymentProvider
+from infrastructure import StoreConfig, StoreFactory, StoreType
+from infrastructure.storeSqllite import donationFromRow, donationToRow
+from .transactionFiles import AMOUNTS, DAYS, STARTDATE
+
+REPEAT = 3
+
+
+def validatedDonationFromRow(row):
+    """
+    donationFromRow as it was, validating every field of a row with a text date, kept as the baseline
+    """
+    d = datetime.strptime(row[3], '%Y-%m-%d')
+    return Donation(
+        source=PaymentProvider[row[0]],
+        paymentId=row[1],
+        donor=row[2],
+        paymentDate=date(d.year, d.month, d.day),
+        type=DonationType[row[4]],
+        money=Money(row[5], Currency(row[6].upper()))
+    )
+
+
+def makeDonations(rows, seed=0):
+    r = random.Random(seed)
+    return [Donation(r.choice(list(PaymentProvider)), str(index), f"donor{r.randrange(2000)}@test.com",
+                     STARTDATE + timedelta(days=r.randrange(DAYS)), r.choice(list(DonationType)), Money(r.choice(AMOUNTS), Currency('GBP')))
+            for index in range(rows)]
+
+
+def decodeAll(decode, rows):
+    # results are not kept, so the cost of growing the heap is left out as it is for iterDonations
+    for row in rows:
+        decode(row)
+
+
+def best(fn):
+    # best of a few runs, as the machine's noise only ever adds time
+    times = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def report(name, rows, seconds, baseline=None):
+    line = f"{name:<24} {seconds / rows * 1e9:>8.0f} ns/row {seconds * 1e6 / rows:>8.2f} s/million rows"
+    if baseline:
+        line += f" {baseline / seconds:>6.1f}x"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark decoding donations read from the store")
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    donations = makeDonations(args.rows)
+    rows = [donationToRow(donation) for donation in donations]
+    textRows = [row[:3] + (date.fromordinal(row[3]).isoformat(), row[4], row[5] / 100, row[6]) for row in rows]
+    assert [validatedDonationFromRow(row) for row in textRows[:100]] == [donationFromRow(row) for row in rows[:100]]
+
+    baseline = best(lambda: decodeAll(validatedDonationFromRow, textRows))
+    report("validated decode", args.rows, baseline)
+    report("trusted decode", args.rows, best(lambda: decodeAll(donationFromRow, rows)), baseline)
+
+    store = StoreFactory(StoreConfig(StoreType.SQLLITE, ":memory:"))
+    store.setupStore()
+    store.insertDonations(donations)
+    endDate = STARTDATE + timedelta(days=DAYS)
+    report("iterDonations", args.rows, best(lambda: sum(1 for _ in store.iterDonations(STARTDATE, endDate))))
+    store.close()
+
+    store = StoreFactory(StoreConfig(StoreType.MEMORY, ":memory:"))
+    store.insertDonations(donations)
+    report("memory iterDonations", args.rows, best(lambda: sum(1 for _ in store.iterDonations(STARTDATE, endDate))))
+
+
+if __name__ == "__main__":
+    main()
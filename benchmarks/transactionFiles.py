@@ -0,0 +1,189 @@
+"""
+writes synthetic payment provider exports of any size, matching each importer's HEADER
+
+    python -m benchmarks.transactionFiles STRIPE 100000 stripe.csv
+"""
+import argparse
+import csv
+import random
+from datetime import date, datetime, timedelta
+from domain import PaymentProvider
+from infrastructure import GocardlessTransactionImporter, PaypalTransactionImporter, StripeTransactionImporter
+
+IMPORTERS = {
+    PaymentProvider.GOCARDLESS: GocardlessTransactionImporter,
+    PaymentProvider.PAYPAL: PaypalTransactionImporter,
+    PaymentProvider.STRIPE: StripeTransactionImporter,
+}
+AMOUNTS = ["2", "5", "10", "12.50", "20", "25", "50", "100", "250.75"]
+STARTDATE = date(2015, 1, 1)
+DAYS = 5 * 365
+
+
+def headerColumns(importer):
+    return next(csv.reader([importer.HEADER.strip()]))
+
+
+class TransactionFileGenerator():
+    """
+    rows are donations, apart from a fraction of refunds, of payments that did not complete
+    and of bad rows, which the importer should reject.
+    donors repeat, so there are donors with many donations across the date range
+    """
+    def __init__(self, paymentProvider, refunds=0.02, notCompleted=0.03, badRows=0.01, donors=2000, seed=0):
+        self.paymentProvider = paymentProvider
+        self._importer = IMPORTERS[paymentProvider]
+        self._columns = headerColumns(self._importer)
+        self._refunds = refunds
+        self._notCompleted = notCompleted
+        self._badRows = badRows
+        self._donors = donors
+        self._random = random.Random(seed)
+
+    def write(self, csvfile, rows):
+        """
+        csvfile opened with newline=''
+        """
+        config = self._importer.CSVCONFIG
+        csvfile.write(self._importer.HEADER.replace('\n', config.lineterminator))
+        quoting = csv.QUOTE_ALL if self.paymentProvider == PaymentProvider.PAYPAL else config.quoting
+        writer = csv.writer(csvfile, delimiter=config.delimiter, quotechar=config.quotechar, lineterminator=config.lineterminator, quoting=quoting)
+        for index in range(rows):
+            row = self._row(index)
+            writer.writerow([row.get(column, '') for column in self._columns])
+
+    def _kind(self):
+        x = self._random.random()
+        if x < self._badRows:
+            return "bad"
+        x -= self._badRows
+        if x < self._refunds:
+            return "refund"
+        x -= self._refunds
+        if x < self._notCompleted:
+            return "notCompleted"
+        return "donation"
+
+    def _row(self, index):
+        donor = f"donor{self._random.randrange(self._donors)}@test.com"
+        when = datetime.combine(STARTDATE + timedelta(days=self._random.randrange(DAYS)), datetime.min.time()) + \
+            timedelta(minutes=self._random.randrange(24 * 60))
+        amount = self._random.choice(AMOUNTS)
+        monthly = self._random.random() < 0.5
+        kind = self._kind()
+        return getattr(self, f"_{self.paymentProvider.name.lower()}Row")(index, donor, when, amount, monthly, kind)
+
+    def _gocardlessRow(self, index, donor, when, amount, monthly, kind):
+        row = {
+            "id": f"PM{index:012d}",
+            "created_at": when.strftime('%d/%m/%Y %H:%M'),
+            "charge_date": when.strftime('%d/%m/%Y'),
+            "amount": amount,
+            "description": "Spiked monthly",
+            "currency": "GBP",
+            "status": "paid_out",
+            "amount_refunded": "0",
+            "customers.email": donor,
+            "customers.country_code": "GB",
+            "customers.language": "en",
+            "customers.active_mandates": "TRUE",
+        }
+        if kind == "refund":
+            row["amount"] = "-" + amount
+            row["amount_refunded"] = amount
+        elif kind == "notCompleted":
+            row["amount"] = "0"
+            row["status"] = "pending_customer_approval"
+        elif kind == "bad":
+            row["charge_date"] = ""
+        return row
+
+    def _paypalRow(self, index, donor, when, amount, monthly, kind):
+        row = {
+            "Date": when.strftime('%d/%m/%Y'),
+            "Time": when.strftime('%H:%M:%S'),
+            "Time zone": "GMT",
+            "Name": donor.split('@')[0],
+            "Type": "Subscription Payment" if monthly else "Donation Payment",
+            "Status": "Completed",
+            "Currency": "GBP",
+            "Gross": amount,
+            "Fee": "-0.37",
+            "Net": amount,
+            "From Email Address": donor,
+            "To Email Address": "worldpay@spiked-online.com",
+            "Transaction ID": f"{index:017X}",
+            "Counterparty Status": "Verified",
+            "Address Status": "Unconfirmed",
+            "Quantity": "1",
+            "Country": "United Kingdom",
+            "Subject": "Spiked",
+            "Balance Impact": "Credit",
+        }
+        if kind == "refund":
+            row["Type"] = "Payment Refund"
+            row["Gross"] = "-" + amount
+            row["Balance Impact"] = "Debit"
+        elif kind == "notCompleted":
+            row["Status"] = "Pending"
+        elif kind == "bad":
+            row["Type"] = ""
+        return row
+
+    def _stripeRow(self, index, donor, when, amount, monthly, kind):
+        row = {
+            "id": f"ch_{index:024d}",
+            "Description": "Payment for invoice 1234-0001" if monthly else "",
+            "Seller Message": "Payment complete.",
+            "Created (UTC)": when.strftime('%d/%m/%Y %H:%M'),
+            "Amount": amount,
+            "Amount Refunded": "0",
+            "Currency": "gbp",
+            "Converted Amount": amount,
+            "Converted Amount Refunded": "0",
+            "Fee": "0.48",
+            "Tax": "0",
+            "Converted Currency": "gbp",
+            "Mode": "Live",
+            "Status": "Paid",
+            "Customer Email": donor if monthly else "",
+            "Captured": "TRUE",
+            "Card Brand": "Visa",
+            "Card Funding": "debit",
+            "Card Name": donor,
+            "Card Address Country": "GB",
+            "Payment Source Type": "card",
+        }
+        if kind == "refund":
+            row["Status"] = "Refunded"
+            row["Amount Refunded"] = amount
+        elif kind == "notCompleted":
+            row["Status"] = "Failed"
+            row["Captured"] = "FALSE"
+        elif kind == "bad":
+            row["Customer Email"] = ""
+            row["Card Name"] = "no email"
+        return row
+
+
+def writeTransactionFile(path, paymentProvider, rows, **kwargs):
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        TransactionFileGenerator(paymentProvider, **kwargs).write(csvfile, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write a synthetic payment provider export")
+    parser.add_argument("paymentProvider", choices=[p.name for p in PaymentProvider])
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--refunds", type=float, default=0.02)
+    parser.add_argument("--notCompleted", type=float, default=0.03)
+    parser.add_argument("--badRows", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    writeTransactionFile(args.path, PaymentProvider[args.paymentProvider], args.rows,
+                         refunds=args.refunds, notCompleted=args.notCompleted, badRows=args.badRows, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
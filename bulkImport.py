@@ -0,0 +1,88 @@
+"""
+imports provider exports into the store without the web app, for scheduled ingestion.
+prints a json summary, and exits with 1 if any file could not be imported
+
+    python bulkImport.py --provider STRIPE --db sdm.db exports/ stripe-extra.csv
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from domain import PaymentProvider
+from infrastructure import StoreConfig, StoreFactory, StoreType, expandUpload, importFiles
+from infrastructure.donationImport import IMPORT_CHUNKSIZE
+
+UPLOADEXTENSIONS = ('.csv', '.zip')
+
+
+def findFiles(paths):
+    """
+    the csv and zip files named, or found under the directories named, in a stable order
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in sorted(os.walk(path)):
+                found += [os.path.join(directory, filename) for filename in sorted(filenames)
+                          if filename.lower().endswith(UPLOADEXTENSIONS) and not filename.startswith('.')]
+        else:
+            found.append(path)
+    return found
+
+
+def summarise(results, seconds):
+    parsed = sum(result.parsed for result in results)
+    return {
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(parsed / seconds, 1) if seconds > 0 else 0.0,
+        "parsed": parsed,
+        "added": sum(result.added for result in results),
+        "dupes": sum(result.dupes for result in results),
+        "badRows": sum(result.badRows for result in results),
+        "alreadyImported": sum(1 for result in results if result.previousImport),
+        "errors": sum(1 for result in results if result.error),
+        "files": [result.toDict() for result in results],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="import payment provider exports into the store")
+    parser.add_argument("paths", nargs="+", help="csv or zip files, or directories of them")
+    parser.add_argument("--provider", choices=[p.name for p in PaymentProvider],
+                        help="used for files whose header is not recognised")
+    parser.add_argument("--db", help="sqlite database, defaults to config.SQLITE3DB")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes parsing files, 1 parses them in this process")
+    parser.add_argument("--chunkSize", type=int, default=IMPORT_CHUNKSIZE)
+    parser.add_argument("--rejects", help="directory to write the rejected rows of each file to")
+    args = parser.parse_args(argv)
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+    if args.db is None:
+        import config
+        args.db = config.SQLITE3DB
+    if args.rejects:
+        os.makedirs(args.rejects, exist_ok=True)
+    paymentProvider = PaymentProvider[args.provider] if args.provider else None
+
+    files = []
+    for path in findFiles(args.paths):
+        files += expandUpload(path, path)
+
+    store = StoreFactory(StoreConfig(StoreType.SQLLITE, args.db))
+    try:
+        started = time.perf_counter()
+        results = importFiles(store, files, paymentProvider, workers=args.workers, chunkSize=args.chunkSize, rejectsDirectory=args.rejects)
+        summary = summarise(results, time.perf_counter() - started)
+    finally:
+        store.close()
+
+    json.dump(summary, sys.stdout)
+    sys.stdout.write('\n')
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
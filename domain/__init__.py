@@ -2,16 +2,19 @@ from .utils import getWeekEnds, rndDate, getMonthEnds
 from .Types import Amount, BenefitName, Donor, Email, isnotemptyinstance, PaymentId
 from .delivery import Delivery
 from .currency import Currency, getCurrencyFromString, CURRENCYSYMBOLS
-from .money import Money
+from .money import Money, minorExponent
 from .donationType import DonationType
 from .paymentProvider import PaymentProvider
 from .donation import Donation
+from .donationRollup import DonationRollup
 from .total import Total
-from .summary import Summary, SummaryFields
+from .summary import Summary, SummaryFields, summarise, summariseRollups
 from .benefit import Benefit, BenefitType, BenefitException
 from .donorDetail import DonorDetail
+from .importJob import ImportJob, ImportJobStatus, ImportLedgerEntry
 
 __all__ = [getWeekEnds, rndDate, getMonthEnds, Amount, BenefitName, Donor, Email, isnotemptyinstance, PaymentId,
-           Delivery, Currency, getCurrencyFromString, CURRENCYSYMBOLS, Money, DonationType, PaymentProvider,
-           Donation, Total, Summary, SummaryFields, Benefit, BenefitType, BenefitException, DonorDetail
+           Delivery, Currency, getCurrencyFromString, CURRENCYSYMBOLS, Money, minorExponent, DonationType, PaymentProvider,
+           Donation, DonationRollup, Total, Summary, SummaryFields, summarise, summariseRollups, Benefit, BenefitType, BenefitException,
+           DonorDetail, ImportJob, ImportJobStatus, ImportLedgerEntry
            ]
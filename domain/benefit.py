@@ -88,7 +88,7 @@ class Benefit(ABC):
         yield self.endDate
         yield self.delivery.name
         try:
-            yield self.minAmount.amount
+            yield self.minAmount.minor
         except:  # noqa: E722
             yield None
         try:
@@ -1,11 +1,19 @@
+from functools import lru_cache
 from iso4217 import Currency
 
 
 def getCurrencyFromString(s: str):
     assert isinstance(s, str)
-    s = s.strip()
+    return _getCurrencyFromString(s.strip())
+
+
+@lru_cache(maxsize=256)
+def _getCurrencyFromString(s: str):
+    """
+    cached, as every imported row and benefit form resolves one of a handful of strings
+    """
     try:
-        return Currency(CURRENCYSYMBOLS[s.strip()])
+        return CURRENCYSYMBOLS[s]
     except KeyError:
         return Currency(s)
 
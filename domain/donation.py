@@ -31,11 +31,26 @@ class Donation():
         assert isinstance(self.type, DonationType)
         assert isinstance(self.money, Money)
 
+    @classmethod
+    def trusted(cls, source, paymentId, donor, paymentDate, type, money):
+        """
+        builds a donation without validating it, for values read back from a store that validated them when stored
+        """
+        donation = cls.__new__(cls)
+        fields = donation.__dict__
+        fields['source'] = source
+        fields['paymentId'] = paymentId
+        fields['donor'] = donor
+        fields['paymentDate'] = paymentDate
+        fields['type'] = type
+        fields['money'] = money
+        return donation
+
     def __iter__(self):
         yield self.source.name
         yield self.paymentId
         yield self.donor
         yield self.paymentDate
         yield self.type.name
-        yield self.money.amount
+        yield self.money.minor
         yield self.money.currency.name
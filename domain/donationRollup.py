@@ -0,0 +1,27 @@
+from datetime import date
+from dataclasses import dataclass
+from . import DonationType, Money, PaymentProvider, rndDate
+
+
+@dataclass(frozen=True)
+class DonationRollup():
+    """
+    the count and sum of a day's donations from one source, of one type and in one currency
+    """
+    paymentDate: date
+    source: PaymentProvider
+    type: DonationType
+    money: Money
+    count: int
+
+    @property
+    def currency(self):
+        return self.money.currency
+
+    @property
+    def week(self):
+        return rndDate(self.paymentDate, "week", "up")
+
+    @property
+    def month(self):
+        return rndDate(self.paymentDate, "month", "up")
@@ -1,13 +1,18 @@
 from datetime import date
 from dataclasses import dataclass
-from . import Donor,  isnotemptyinstance
+from . import Donor,  isnotemptyinstance, Total
 
 
 @dataclass(frozen=True)
 class DonorDetail():
+    """
+    count is the number of donations, and total their lifetime sum in each currency
+    """
     donor: Donor
     firstPaymentDate: date
     lastPaymentDate: date
+    count: int = None
+    total: Total = None
 
     def __post_init__(self):
         assert isnotemptyinstance(self.donor, Donor)
@@ -0,0 +1,81 @@
+from datetime import date, datetime
+from dataclasses import dataclass, field
+from enum import Enum, unique
+from typing import List
+from . import PaymentProvider
+
+
+@unique
+class ImportJobStatus(Enum):
+    QUEUED = 1
+    RUNNING = 2
+    DONE = 3
+    FAILED = 4
+
+
+@dataclass
+class ImportJob():
+    """
+    an upload of one or more provider files, imported in the background
+    files holds a dict of counts for each file imported so far
+    """
+    filename: str
+    paymentProvider: PaymentProvider
+    status: ImportJobStatus = ImportJobStatus.QUEUED
+    parsed: int = 0
+    added: int = 0
+    dupes: int = 0
+    badRows: int = 0
+    started: datetime = None
+    finished: datetime = None
+    error: str = None
+    files: List[dict] = field(default_factory=list)
+    storeId: str = None
+
+    @property
+    def isFinished(self):
+        return self.status in (ImportJobStatus.DONE, ImportJobStatus.FAILED)
+
+    @property
+    def rowsPerSecond(self):
+        if self.started is None:
+            return 0.0
+        seconds = ((self.finished or datetime.now()) - self.started).total_seconds()
+        if seconds <= 0:
+            return 0.0
+        return self.parsed / seconds
+
+    def toDict(self):
+        return {
+            "storeId": self.storeId,
+            "filename": self.filename,
+            "paymentProvider": self.paymentProvider.name if self.paymentProvider else None,
+            "status": self.status.name,
+            "parsed": self.parsed,
+            "added": self.added,
+            "dupes": self.dupes,
+            "badRows": self.badRows,
+            "rowsPerSecond": round(self.rowsPerSecond, 1),
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "error": self.error,
+            "files": self.files,
+        }
+
+
+@dataclass(frozen=True)
+class ImportLedgerEntry():
+    """
+    a file that has been imported, identified by the sha256 of its content.
+    firstDate and lastDate span its donations, None when it had none
+    """
+    sha256: str
+    filename: str
+    paymentProvider: PaymentProvider
+    rows: int
+    added: int
+    dupes: int
+    badRows: int
+    firstDate: date
+    lastDate: date
+    imported: datetime
@@ -1,56 +1,146 @@
-import re
 from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from functools import lru_cache
 from . import Amount, Currency, getCurrencyFromString
 
-CURRENCYFIRST = re.compile(r'(?P<currency>[^\.0-9]+)(?P<amount>[\.0-9]+)')
-CURRENCYLAST = re.compile(r'(?P<amount>[\.0-9]+)(?P<currency>[^\.0-9]*)')
+AMOUNTCHARACTERS = "0123456789."
+# for the few iso4217 codes without minor units, such as XAU
+DEFAULTEXPONENT = 2
+
+
+@lru_cache(maxsize=256)
+def minorExponent(currency):
+    """
+    the number of decimal places of the currency's minor unit, 2 for pence or cents
+    """
+    return DEFAULTEXPONENT if currency.exponent is None else currency.exponent
+
+
+def minorFromString(s, exponent):
+    """
+    reads a decimal string exactly, so "0.29" is 29 pence rather than 28.999... of a float
+    """
+    whole, _, fraction = s.strip().partition('.')
+    sign = 1
+    if whole[:1] in ('-', '+'):
+        sign = -1 if whole[0] == '-' else 1
+        whole = whole[1:]
+    if (whole.isdigit() or (not whole and fraction)) and (fraction.isdigit() or not fraction) and len(fraction) <= exponent:
+        return sign * (int(whole or '0') * 10 ** exponent + int(fraction.ljust(exponent, '0') or '0'))
+    try:
+        return toMinor(Decimal(s.strip()), exponent)
+    except (InvalidOperation, ValueError, OverflowError):
+        raise ValueError(f"not an amount: {s}")
+
+
+def toMinor(amount, exponent):
+    """
+    an amount in major units as an int of minor units, rounded half to even
+    """
+    if isinstance(amount, str):
+        return minorFromString(amount, exponent)
+    if isinstance(amount, int):
+        return amount * 10 ** exponent
+    if isinstance(amount, Decimal):
+        return int(amount.scaleb(exponent).to_integral_value(ROUND_HALF_EVEN))
+    return round(amount * 10 ** exponent)
+
+
+def splitAmount(s):
+    """
+    the leading run of digits and points, and what follows it
+    """
+    rest = s.lstrip(AMOUNTCHARACTERS)
+    return s[:len(s) - len(rest)], rest
+
+
+def splitCurrency(s):
+    """
+    the leading run of anything but digits and points, and what follows it
+    currency codes and symbols are short, so this loop is only a few steps
+    """
+    end = 0
+    while end < len(s) and s[end] not in AMOUNTCHARACTERS:
+        end += 1
+    return s[:end], s[end:]
 
 
 @dataclass(frozen=True, init=False)
 class Money ():
-    amount: Amount
+    """
+    held as an int of the currency's minor units, pence or cents, so sums and comparisons are exact.
+    constructed from an amount in major units, or from minor units with fromMinor
+    """
+    minor: int
     currency: Currency
+
+    @property
+    def amount(self) -> Amount:
+        return self.minor / 10 ** minorExponent(self.currency)
+
     @property
     def amountInt(self):
         return int(self.amount)
 
     def __init__(self, amount, currency):
-        if isinstance(amount, int):
-            object.__setattr__(self, 'amount', float(amount))
-        else:
-            object.__setattr__(self, 'amount', amount)
+        if not isinstance(currency, Currency):
+            currency = getCurrencyFromString(currency)
+        object.__setattr__(self, 'minor', toMinor(amount, minorExponent(currency)))
+        object.__setattr__(self, 'currency', currency)
 
-        if isinstance(currency, Currency):
-            object.__setattr__(self, 'currency', currency)
-        else:
-            object.__setattr__(self, 'currency', getCurrencyFromString(currency))
-
-    def __post_init__(self):
-        assert isinstance(self.amount, float) 
-        assert isinstance(self.currency, Currency) 
+    @classmethod
+    def fromMinor(cls, minor, currency):
+        """
+        trusted, minor must be an int and currency a Currency.
+        the fields are written to __dict__ directly, skipping the frozen dataclass's setattr
+        """
+        money = cls.__new__(cls)
+        fields = money.__dict__
+        fields['minor'] = minor
+        fields['currency'] = currency
+        return money
 
     def __add__(self, another):
         if (self.currency != another.currency): 
             raise TypeError(f"cannot add amounts with different currencies - {self.currency},{another.currency}")
-        return Money(self.amount + another.amount, self.currency)
+        return Money.fromMinor(self.minor + another.minor, self.currency)
 
     def __ge__(self, another):
         if (self.currency != another.currency): 
             raise TypeError(f"cannot compare amounts with different currencies - {self.currency},{another.currency}")
-        return self.amount >= another.amount
+        return self.minor >= another.minor
 
     def __str__(self):
         return f"{self.amount} {self.currency.value}"
 
     @classmethod
     def fromString(cls, s):
+        """
+        reads "£10", "GBP10.50", "10.50 GBP" or "10$"
+        """
         s = s.replace(" ", "").upper()
-        if str.isnumeric(s[0]): 
-            matched = CURRENCYLAST.match(s)
+        # fast path, the string is just a currency and an amount
+        currency = s.strip(AMOUNTCHARACTERS)
+        if str.isnumeric(s[0]):
+            amount = s[:len(s) - len(currency)]
         else:
-            matched = CURRENCYFIRST.match(s)
+            amount = s[len(currency):]
+        try:
+            return cls(amount=amount, currency=getCurrencyFromString(currency))
+        except ValueError:
+            return cls._fromString(s)
 
-        currency = getCurrencyFromString(matched.group('currency'))
-        amount = Amount(float(matched.group('amount')))
+    @classmethod
+    def _fromString(cls, s):
+        if str.isnumeric(s[0]):
+            amount, rest = splitAmount(s)
+            currency, _ = splitCurrency(rest)
+        else:
+            currency, rest = splitCurrency(s)
+            amount, _ = splitAmount(rest)
+            if not currency:
+                raise ValueError(f"no currency in {s}")
+        if not amount:
+            raise ValueError(f"no amount in {s}")
 
-        return cls(amount=amount, currency=currency)
+        return cls(amount=amount, currency=getCurrencyFromString(currency))
@@ -1,6 +1,6 @@
 from enum import Enum, unique
 from typing import List
-from . import Total, Money
+from . import Total
 
 
 @unique
@@ -14,40 +14,62 @@ class SummaryFields(Enum):
     DONOR = "donor"
 
 
-def groupByField(donations, field):
-    grouped = {}
-    for i in donations:
-        key = getattr(i, field.value)
-        if key in grouped:
-            grouped[key].append(i)
-        else: 
-            grouped[key] = [i]
-    return grouped
+class Summary(dict):
+    """
+    totals of donations, branching on each field in turn.
+    donations may be any iterable, it is read once and no donation is kept
+    """
+    def __init__(self, donations, fields: List[SummaryFields]):
+        self.total = Total([], 0)
+        self._fields = fields
+        if self._isNode(fields):
+            self.field = fields[0]
+        for donation in donations:
+            self.addDonation(donation)
 
+    @classmethod
+    def fromRollups(cls, rollups, fields: List[SummaryFields]):
+        summary = cls([], fields)
+        for rollup in rollups:
+            summary.addRollup(rollup)
+        return summary
 
-def getZero(donations):
-    return Total(Money(0, donations[0].money.currency), 0)
+    def _isNode(self, fields: List[SummaryFields]):
+        return len(fields) != 0
 
+    def addDonation(self, donation):
+        self._add(donation, donation.money, 1)
 
-def addDonations(x, y):
-    return x.money + y.money
+    def addRollup(self, rollup):
+        self._add(rollup, rollup.money, rollup.count)
 
+    def _add(self, item, money, count):
+        self.total.addMoney(money, count)
+        if self._isNode(self._fields):
+            key = getattr(item, self.field.value)
+            branch = self.get(key)
+            if branch is None:
+                branch = self[key] = Summary([], self._fields[1:])
+            branch._add(item, money, count)
 
-def sumTotals(x, y):
-    return x.total + y.total
 
+def summarise(donations, *fieldLists: List[SummaryFields]) -> List[Summary]:
+    """
+    a Summary for each list of fields, built in one pass over donations
+    """
+    summaries = [Summary([], fields) for fields in fieldLists]
+    for donation in donations:
+        for summary in summaries:
+            summary.addDonation(donation)
+    return summaries
 
-class Summary(dict):
-    def __init__(self, donations, fields: List[SummaryFields]):
-        self.total = Total([x.money for x in donations], len(donations))
-        if self._isNode(fields): 
-            self.field = fields[0]
-            fields = fields[1:]
-            self._makeBranches(donations, fields)
-
-    def _isNode(self, fields: List[SummaryFields]):
-        return len(fields) != 0
 
-    def _makeBranches(self, donations, fields):
-        for key, group in groupByField(donations, self.field).items():
-            self[key] = Summary(group, fields)
+def summariseRollups(rollups, *fieldLists: List[SummaryFields]) -> List[Summary]:
+    """
+    as summarise, from DonationRollups, so the cost follows the number of days rather than of donations
+    """
+    summaries = [Summary([], fields) for fields in fieldLists]
+    for rollup in rollups:
+        for summary in summaries:
+            summary.addRollup(rollup)
+    return summaries
@@ -16,9 +16,12 @@ class Total(dict):
         else:
             self[key] = money
 
-    def addMoney(self, money: Money):
+    def addMoney(self, money: Money, count=1):
+        """
+        count is the number of donations money sums
+        """
         self._addMoney(money)
-        self.count += 1
+        self.count += count
 
     def __add__(self, another):
         monies = [x for x in self.values()]
@@ -1,25 +1,27 @@
 from domain import PaymentProvider
 from .store import Store, StoreConfig, StoreType, StoreDuplicate, StoreNotFound  # noqa: F401
 from .storeSqllite import StoreSqlLite
-from .transactionimporter import GocardlessTransactionImporter, PaypalTransactionImporter, StripeTransactionImporter
+from .storeMemory import StoreMemory
+from .storePool import StorePool
+from .cachingStore import CachingStore, StoreCache
+from .storeMetrics import StoreMetrics, storeMetrics
+from .transactionimporter import GocardlessTransactionImporter, PaypalTransactionImporter, StripeTransactionImporter, TransactionImporterFactory
+from .transactionimporter import paymentProviderFromHeader
+from .donationImport import DecodingReader, ImportFile, ImportResult, importDonations, importFiles, expandUpload, saveUpload
+from .encoding import EncodingDetector
+from .importJobs import ImportJobRunner, failInterruptedJobs
 
 
 def StoreFactory(config: StoreConfig) -> Store:
     if (config.type == StoreType.SQLLITE):
         return StoreSqlLite(config)
+    if (config.type == StoreType.MEMORY):
+        return StoreMemory(config)
 
 
-def TransactionImporterFactory(paymentProvider, csvfile):
-    if paymentProvider == PaymentProvider.PAYPAL:
-        return PaypalTransactionImporter(csvfile)
-    elif paymentProvider == PaymentProvider.GOCARDLESS:
-        return GocardlessTransactionImporter(csvfile)
-    elif paymentProvider == PaymentProvider.STRIPE:
-        return StripeTransactionImporter(csvfile)
-    else:
-        raise Exception
-
-
-__all__ = [PaymentProvider, Store, StoreConfig, StoreType, StoreDuplicate, StoreNotFound, StoreSqlLite, GocardlessTransactionImporter,
-           PaypalTransactionImporter, StripeTransactionImporter, StoreFactory, TransactionImporterFactory
-           ]
\ No newline at end of file
+__all__ = [PaymentProvider, Store, StoreConfig, StoreType, StoreDuplicate, StoreNotFound, StoreSqlLite, StoreMemory, StorePool, CachingStore, StoreCache,
+           StoreMetrics, storeMetrics, GocardlessTransactionImporter,
+           PaypalTransactionImporter, StripeTransactionImporter, StoreFactory, TransactionImporterFactory,
+           paymentProviderFromHeader, DecodingReader, ImportFile, ImportResult, importDonations, importFiles, expandUpload, saveUpload,
+           EncodingDetector, ImportJobRunner, failInterruptedJobs
+           ]
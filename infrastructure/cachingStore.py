@@ -0,0 +1,246 @@
+"""
+a Store decorator answering repeated reads from a cache shared by every store wrapped with it
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List
+from domain import Benefit, Donation, Donor
+from .store import Store
+
+DONATIONREADS = ("getDonations", "getRollups")
+BENEFITLISTS = ("getCurrentBenefits", "getDeliveredBenefits", "getPendingBenefits")
+
+
+class StoreCache():
+    """
+    least recently used results of store reads, by method and arguments.
+    maxItems bounds the memory held, counting each donation, benefit, rollup or donor in a result as one item.
+    entries expire after seconds, which bounds how stale a read can be after a write made without the cache,
+    such as by bulkImport. safe to share between threads
+    """
+    def __init__(self, maxItems, seconds, clock=time.monotonic):
+        self.maxItems = maxItems
+        self.seconds = seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._items = 0
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.invalidations = 0
+        # counts invalidations, so a result read before one is not cached after it
+        self._generation = 0
+
+    def get(self, key, read):
+        """
+        the cached result for key, or the result of read, cached if it fits
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits[key[0]] += 1
+                return entry[1]
+            self.misses[key[0]] += 1
+            generation = self._generation
+        value = read()
+        self._put(key, value, generation)
+        return value
+
+    def _put(self, key, value, generation):
+        size = len(value) if isinstance(value, list) else 1
+        if size > self.maxItems:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (self._clock() + self.seconds, value, size)
+            self._items += size
+            while self._items > self.maxItems:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._items -= entry[2]
+
+    def invalidate(self, matches):
+        """
+        removes the entries whose key matches
+        """
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if matches(key)]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._items = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "entries": len(self._entries),
+                "items": self._items,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def dateKey(startDate, endDate):
+    return (startDate.toordinal(), endDate.toordinal())
+
+
+def coversAny(ordinals):
+    """
+    matches the donation reads whose dates include one of ordinals, and every read of donors
+    """
+    def matches(key):
+        if key[0] in DONATIONREADS:
+            start, end = key[1]
+            return any(start <= ordinal <= end for ordinal in ordinals)
+        return key[0] == "getDetailDonors"
+    return matches
+
+
+def benefitReads(storeId=None):
+    """
+    matches the lists of benefits, and the benefit storeId
+    """
+    def matches(key):
+        return key[0] in BENEFITLISTS or (key[0] == "getBenefit" and key[1] == str(storeId))
+    return matches
+
+
+class CachingStore(Store):
+    """
+    reads of benefits, donations, rollups and donors are answered from cache while no write through a CachingStore
+    sharing it has changed them. writes are passed to store and remove only the entries they could change.
+    results are shared between callers, so they must not be modified
+    """
+    def __init__(self, store: Store, cache: StoreCache) -> None:
+        self._store = store
+        self._cache = cache
+
+    @property
+    def type(self):
+        return self._store.type
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _donationsAdded(self, donations):
+        if donations:
+            self._cache.invalidate(coversAny({donation.paymentDate.toordinal() for donation in donations}))
+
+    def insertDonation(self, donation: Donation) -> None:
+        self._store.insertDonation(donation)
+        self._donationsAdded([donation])
+
+    def insertDonations(self, donations: Iterable[Donation], chunkSize=None):
+        added, dupes = self._store.insertDonations(donations, chunkSize)
+        self._donationsAdded(added)
+        return added, dupes
+
+    def getDonationKeys(self, source, startDate, endDate):
+        return self._store.getDonationKeys(source, startDate, endDate)
+
+    def getDonations(self, startDate, endDate) -> List[Donation]:
+        if startDate > endDate:
+            raise ValueError("startdate gt enddate")
+        return list(self._cache.get(("getDonations", dateKey(startDate, endDate)), lambda: self._store.getDonations(startDate, endDate)))
+
+    def iterDonations(self, startDate, endDate, **kwargs):
+        return self._store.iterDonations(startDate, endDate, **kwargs)
+
+    def getRollups(self, startDate, endDate):
+        if startDate > endDate:
+            raise ValueError("startdate gt enddate")
+        return iter(self._cache.get(("getRollups", dateKey(startDate, endDate)), lambda: list(self._store.getRollups(startDate, endDate))))
+
+    def rebuildRollups(self) -> None:
+        self._store.rebuildRollups()
+        self._cache.invalidate(lambda key: key[0] == "getRollups")
+
+    def rebuildDonors(self) -> None:
+        self._store.rebuildDonors()
+        self._cache.invalidate(lambda key: key[0] == "getDetailDonors")
+
+    def getDonation(self, source, paymentId) -> Donation:
+        return self._store.getDonation(source, paymentId)
+
+    def addBenefit(self, benefit: Benefit):
+        benefit = self._store.addBenefit(benefit)
+        self._cache.invalidate(benefitReads())
+        return benefit
+
+    def getCurrentBenefits(self) -> List[Benefit]:
+        # a benefit moves from current to pending at midnight, so today is part of the key
+        return list(self._cache.get(("getCurrentBenefits", date.today()), self._store.getCurrentBenefits))
+
+    def getDeliveredBenefits(self) -> List[Benefit]:
+        return list(self._cache.get(("getDeliveredBenefits",), self._store.getDeliveredBenefits))
+
+    def getPendingBenefits(self) -> List[Benefit]:
+        return list(self._cache.get(("getPendingBenefits", date.today()), self._store.getPendingBenefits))
+
+    def getBenefit(self, storeId) -> Benefit:
+        return self._cache.get(("getBenefit", str(storeId)), lambda: self._store.getBenefit(storeId))
+
+    def deleteBenefit(self, storeId) -> None:
+        self._store.deleteBenefit(storeId)
+        self._cache.invalidate(benefitReads(storeId))
+
+    def updateBenefit(self, benefit: Benefit):
+        benefit = self._store.updateBenefit(benefit)
+        self._cache.invalidate(benefitReads(benefit._storeId))
+        return benefit
+
+    def getQualifyingDonors(self, benefit: Benefit) -> List[Donor]:
+        return self._store.getQualifyingDonors(benefit)
+
+    def evaluateBenefits(self, benefits) -> Dict[str, List[Donor]]:
+        return self._store.evaluateBenefits(benefits)
+
+    def getDetailDonors(self):
+        return list(self._cache.get(("getDetailDonors",), self._store.getDetailDonors))
+
+    def addImportJob(self, job):
+        return self._store.addImportJob(job)
+
+    def updateImportJob(self, job) -> None:
+        self._store.updateImportJob(job)
+
+    def getImportJob(self, storeId):
+        return self._store.getImportJob(storeId)
+
+    def getUnfinishedImportJobs(self):
+        return self._store.getUnfinishedImportJobs()
+
+    def addLedgerEntry(self, entry) -> None:
+        self._store.addLedgerEntry(entry)
+
+    def getLedgerEntry(self, sha256):
+        return self._store.getLedgerEntry(sha256)
+
+    def setupStore(self):
+        self._store.setupStore()
+        self._cache.clear()
+
+    def reset(self):
+        self._store.reset()
+
+    def close(self):
+        self._store.close()
@@ -0,0 +1,508 @@
+import codecs
+import hashlib
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from queue import Empty
+from domain import ImportLedgerEntry, rndDate
+from .encoding import EncodingDetector, asciiCompatible, peek
+from .store import StoreDuplicate, StoreNotFound
+from .storeSqllite import batches
+from .transactionimporter import UNDECODABLE, TransactionImporterFactory, paymentProviderFromHeader
+
+BLOCKSIZE = 64 * 1024
+IMPORT_CHUNKSIZE = 5000
+HEADERSAMPLESIZE = 8 * 1024
+LINEEND = re.compile(r'\r\n|\r|\n')
+# undecodable bytes are escaped to lone surrogates, which a strict decode never produces
+ESCAPED = re.compile('[\udc00-\udcff]')
+ESCAPEUNDECODABLE = 'sdmEscapeUndecodable'
+
+
+def escapeUndecodable(error):
+    """
+    as surrogateescape, but for any byte, which it is not for utf-16
+    """
+    return ''.join(chr(0xDC00 + byte) for byte in error.object[error.start:error.end]), error.end
+
+
+codecs.register_error(ESCAPEUNDECODABLE, escapeUndecodable)
+
+
+class DecodingReader():
+    """
+    iterates the lines of a binary stream, decoding one block at a time
+    so the whole upload is never held in memory.
+    line endings are kept, as for a file opened with newline=''.
+    a block with bytes that are not in encoding, which the encoding detector only checked a sample of,
+    is decoded again with them replaced by U+FFFD, and the numbers of the lines they were in added to undecodableLines.
+    with redetect, a function from bytes to their encoding, a file that was ascii up to its first undecodable byte
+    is decoded from there in the encoding redetect finds, if it decodes the block, and encoding is changed to it
+    """
+    def __init__(self, stream, encoding, blockSize=BLOCKSIZE, redetect=None):
+        self._stream = stream
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._blockSize = blockSize
+        self._redetect = redetect
+        self._ascii = redetect is not None and asciiCompatible(encoding)
+        self.undecodableLines = set()
+
+    def _decode(self, block, final):
+        """
+        the text of block, and whether it had undecodable bytes
+        """
+        try:
+            text = self._decoder.decode(block, final=final)
+            self._ascii = self._ascii and text.isascii()
+            return text, False
+        except UnicodeDecodeError as error:
+            # the object of the error is the decoder's buffered input and block, which a failed decode leaves buffered
+            if self._ascii and error.object[:error.start].isascii():
+                text = self._changeEncoding(error.object, final)
+                if text is not None:
+                    return text, False
+            self._ascii = False
+            self._decoder.errors = ESCAPEUNDECODABLE
+            try:
+                return self._decoder.decode(block, final=final), True
+            finally:
+                self._decoder.errors = 'strict'
+
+    def _changeEncoding(self, data, final):
+        """
+        the text of data in the encoding redetect finds for it, or None if that encoding cannot take over from this one
+        """
+        encoding = self._redetect(data)
+        if encoding == self.encoding or not asciiCompatible(encoding):
+            return None
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            text = decoder.decode(data, final=final)
+        except UnicodeDecodeError:
+            return None
+        self._decoder = decoder
+        self.encoding = encoding
+        self._ascii = False
+        return text
+
+    def __iter__(self):
+        pending = ''
+        pendingEscaped = False
+        lineNumber = 0
+        while True:
+            block = self._stream.read(self._blockSize)
+            final = not block
+            decoded, escaped = self._decode(block, final)
+            escaped = escaped or pendingEscaped
+            text = pending + decoded
+            start = 0
+            for match in LINEEND.finditer(text):
+                end = match.end()
+                # a trailing \r may be the first half of \r\n
+                if not final and end == len(text) and match.group() == '\r':
+                    break
+                lineNumber += 1
+                yield self._unescape(text[start:end], lineNumber) if escaped else text[start:end]
+                start = end
+            pending = text[start:]
+            pendingEscaped = escaped and ESCAPED.search(pending) is not None
+            if final:
+                break
+        if pending:
+            yield self._unescape(pending, lineNumber + 1) if pendingEscaped else pending
+
+    def _unescape(self, line, lineNumber):
+        if ESCAPED.search(line):
+            self.undecodableLines.add(lineNumber)
+            return ESCAPED.sub('\ufffd', line)
+        return line
+
+
+@dataclass
+class ImportResult():
+    """
+    previousImport names the earlier import of an identical file, which was skipped whole.
+    rejects is the csv the bad rows were written to, if any were
+    """
+    filename: str = None
+    added: int = 0
+    dupes: int = 0
+    badRows: int = 0
+    badRowReasons: dict = field(default_factory=dict)
+    rejects: str = None
+    error: str = None
+    paymentProvider: object = None
+    firstDate: date = None
+    lastDate: date = None
+    sha256: str = None
+    previousImport: str = None
+
+    @property
+    def parsed(self):
+        return self.added + self.dupes + self.badRows
+
+    def toDict(self):
+        d = asdict(self)
+        d["paymentProvider"] = self.paymentProvider.name if self.paymentProvider else None
+        d["firstDate"] = self.firstDate.isoformat() if self.firstDate else None
+        d["lastDate"] = self.lastDate.isoformat() if self.lastDate else None
+        d["parsed"] = self.parsed
+        d["rejects"] = self.rejects is not None
+        return d
+
+    def setBadRows(self, badRows):
+        self.badRows = len(badRows)
+        self.badRowReasons = dict(badRows.reasons)
+        self.rejects = badRows.path if badRows.written else None
+
+
+@dataclass(frozen=True)
+class ImportFile():
+    """
+    a csv on disk, or a csv member of a zip archive on disk.
+    sha256 is the hash of the content when it was taken as the file was saved
+    """
+    name: str
+    path: str
+    member: str = None
+    sha256: str = None
+
+    @contextmanager
+    def open(self):
+        if self.member is None:
+            with open(self.path, 'rb') as stream:
+                yield stream
+        else:
+            with zipfile.ZipFile(self.path) as archive, archive.open(self.member) as stream:
+                yield stream
+
+
+def hashStream(stream, blockSize=BLOCKSIZE):
+    sha256 = hashlib.sha256()
+    for block in iter(lambda: stream.read(blockSize), b''):
+        sha256.update(block)
+    return sha256.hexdigest()
+
+
+def hashFile(importFile):
+    if importFile.sha256:
+        return importFile.sha256
+    with importFile.open() as stream:
+        return hashStream(stream)
+
+
+def saveUpload(stream, path, blockSize=BLOCKSIZE):
+    """
+    copies an uploaded stream to path, hashing it on the way, returns the sha256 hex digest
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'wb') as saved:
+        for block in iter(lambda: stream.read(blockSize), b''):
+            sha256.update(block)
+            saved.write(block)
+    return sha256.hexdigest()
+
+
+def isCsv(filename):
+    return filename.rsplit('.', 1)[-1].lower() == "csv"
+
+
+def expandUpload(name, path, sha256=None):
+    """
+    the csv files in an upload, a zip yields each of its csv members
+    """
+    if not zipfile.is_zipfile(path):
+        return [ImportFile(name, path, sha256=sha256)]
+    with zipfile.ZipFile(path) as archive:
+        members = [info.filename for info in archive.infolist() if not info.is_dir()]
+    return [ImportFile(f"{name}/{member}", path, member) for member in members
+            if isCsv(member) and not os.path.basename(member).startswith('.') and not member.startswith('__MACOSX/')]
+
+
+def monthIndex(d):
+    return d.year * 12 + d.month - 1
+
+
+def monthStart(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class DuplicateIndex():
+    """
+    the paymentIds already in the store, loaded for each provider a month at a time
+    as donations from that month arrive, so known duplicates never reach the database.
+    the store still rejects any duplicate this misses, e.g. one whose date has changed
+    """
+    def __init__(self, store):
+        self._store = store
+        self._keys = {}
+        self._loadedMonths = {}
+
+    def _load(self, source, months):
+        loaded = self._loadedMonths.setdefault(source, set())
+        missing = [month for month in months if month not in loaded]
+        if not missing:
+            return
+        first, last = min(missing), max(missing)
+        startDate = monthStart(first)
+        endDate = rndDate(monthStart(last), "month", "up")
+        self._keys.setdefault(source, set()).update(self._store.getDonationKeys(source, startDate, endDate))
+        loaded.update(range(first, last + 1))
+
+    def preload(self, donations):
+        """
+        loads the keys for every provider and month the donations span
+        """
+        months = {}
+        for donation in donations:
+            months.setdefault(donation.source, set()).add(monthIndex(donation.paymentDate))
+        for source, sourceMonths in months.items():
+            self._load(source, sourceMonths)
+
+    def split(self, donations):
+        """
+        returns (new, dupes), new donations are remembered so a repeat later in the import is a dupe
+        """
+        self.preload(donations)
+        new = []
+        dupes = []
+        for donation in donations:
+            keys = self._keys[donation.source]
+            if donation.paymentId in keys:
+                dupes.append(donation)
+            else:
+                keys.add(donation.paymentId)
+                new.append(donation)
+        return new, dupes
+
+
+def insertChunk(store, duplicateIndex, chunk, result):
+    for donation in chunk:
+        if result.firstDate is None or donation.paymentDate < result.firstDate:
+            result.firstDate = donation.paymentDate
+        if result.lastDate is None or donation.paymentDate > result.lastDate:
+            result.lastDate = donation.paymentDate
+    new, dupes = duplicateIndex.split(chunk)
+    added, storeDupes = store.insertDonations(new)
+    result.added += len(added)
+    result.dupes += len(dupes) + len(storeDupes)
+
+
+def findPreviousImport(store, result):
+    """
+    sets previousImport when an identical file is in the import ledger
+    """
+    try:
+        result.previousImport = store.getLedgerEntry(result.sha256).filename
+    except StoreNotFound:
+        pass
+    return result.previousImport is not None
+
+
+def recordImport(store, result):
+    """
+    a file with rows rejected for bytes that did not decode is not recorded, so uploading it again retries those rows
+    """
+    if result.sha256 is None or result.paymentProvider is None or UNDECODABLE in result.badRowReasons:
+        return
+    try:
+        store.addLedgerEntry(ImportLedgerEntry(
+            sha256=result.sha256,
+            filename=result.filename,
+            paymentProvider=result.paymentProvider,
+            rows=result.parsed,
+            added=result.added,
+            dupes=result.dupes,
+            badRows=result.badRows,
+            firstDate=result.firstDate,
+            lastDate=result.lastDate,
+            imported=datetime.now()
+        ))
+    except StoreDuplicate:
+        # the same file in two uploads that ran at once, any other failure to record the import is raised
+        pass
+
+
+def importDonations(store, importer, filename=None, chunkSize=IMPORT_CHUNKSIZE, progress=None, sha256=None):
+    """
+    pipes donations from a TransactionImporter into the store one chunk at a time.
+    progress is called with the ImportResult after each chunk.
+    with the sha256 of the file, a file in the import ledger is skipped and the import is recorded there
+    """
+    result = ImportResult(filename=filename, paymentProvider=importer.SOURCE, sha256=sha256)
+    if sha256 and findPreviousImport(store, result):
+        return result
+    duplicateIndex = DuplicateIndex(store)
+    for chunk in batches(importer, chunkSize):
+        insertChunk(store, duplicateIndex, chunk, result)
+        result.setBadRows(importer.badRows)
+        if progress:
+            progress(result)
+    result.setBadRows(importer.badRows)
+    recordImport(store, result)
+    return result
+
+
+# the messages a worker sends, for each file, as it parses
+CHUNK, DONE, FAILED = range(3)
+# chunks that can wait on the queue for each worker, before workers block until this process catches up
+QUEUEDCHUNKS = 2
+# how often a wait for chunks checks that the workers are still running
+POLLSECONDS = 1
+# imports run on threads of the web app, and a forked worker could inherit a lock another thread held, such as logging's
+WORKERCONTEXT = multiprocessing.get_context("spawn")
+
+# the queue a worker process sends its chunks to, set by its pool's initializer
+_chunks = None
+
+
+def setChunkQueue(chunks):
+    global _chunks
+    _chunks = chunks
+
+
+def openImporter(stream, paymentProvider=None, rejectsPath=None, encodingDetector=None):
+    """
+    the importer of an upload, its DecodingReader and its provider, which is taken from the header when it can be recognised.
+    the encoding is detected again for a provider found in the header, so the provider's confirmed encoding is tried
+    """
+    encodingDetector = encodingDetector or EncodingDetector()
+    encoding = encodingDetector.detect(stream, paymentProvider)
+    header = peek(stream, HEADERSAMPLESIZE).decode(encoding, errors='replace')
+    headerProvider = paymentProviderFromHeader(next(iter(header.splitlines()), ''))
+    if headerProvider is not None and headerProvider != paymentProvider:
+        paymentProvider = headerProvider
+        encoding = encodingDetector.detect(stream, paymentProvider)
+    if paymentProvider is None:
+        raise ValueError("payment provider not recognised")
+    reader = DecodingReader(stream, encoding, redetect=encodingDetector.redetect)
+    return TransactionImporterFactory(paymentProvider, reader, rejectsPath), reader, paymentProvider
+
+
+def streamFile(store, importFile, result, duplicateIndex, paymentProvider=None, chunkSize=IMPORT_CHUNKSIZE, progress=None, rejectsPath=None,
+               encodingDetector=None):
+    """
+    as a worker of importFiles, but streaming the file into the store from this process, filling in its result
+    """
+    try:
+        with importFile.open() as stream:
+            importer, reader, result.paymentProvider = openImporter(stream, paymentProvider, rejectsPath, encodingDetector)
+            for chunk in batches(importer, chunkSize):
+                insertChunk(store, duplicateIndex, chunk, result)
+                result.setBadRows(importer.badRows)
+                if progress:
+                    progress()
+    except Exception as e:
+        result.error = str(e)
+        return
+    result.setBadRows(importer.badRows)
+    if encodingDetector and not reader.undecodableLines:
+        encodingDetector.confirm(result.paymentProvider, reader.encoding)
+    recordImport(store, result)
+
+
+def parseFile(index, importFile, paymentProvider=None, rejectsPath=None, encodingDetector=None, chunkSize=IMPORT_CHUNKSIZE):
+    """
+    runs in a worker process, so only picklable values go in and come out.
+    the donations are put on the chunk queue as (index, CHUNK, donations) while the file is parsed,
+    so no more than a chunk of it is held, followed by (index, DONE, (badRows, paymentProvider, encoding)),
+    or by (index, FAILED, error) if it cannot be parsed.
+    the encoding is sent to be confirmed, or None if some of the file did not decode in it
+    """
+    try:
+        with importFile.open() as stream:
+            importer, reader, paymentProvider = openImporter(stream, paymentProvider, rejectsPath, encodingDetector)
+            for chunk in batches(importer, chunkSize):
+                _chunks.put((index, CHUNK, chunk))
+        _chunks.put((index, DONE, (importer.badRows, paymentProvider, None if reader.undecodableLines else reader.encoding)))
+    except Exception as e:
+        _chunks.put((index, FAILED, str(e)))
+
+
+def rejectsPath(rejectsDirectory, index):
+    return os.path.join(rejectsDirectory, f"{index}.csv") if rejectsDirectory else None
+
+
+def importFiles(store, files, paymentProvider=None, workers=None, chunkSize=IMPORT_CHUNKSIZE, progress=None, rejectsDirectory=None,
+                encodingDetector=None):
+    """
+    parses files concurrently in a process pool, this process is the only writer to the store.
+    with one worker, files are parsed in this process instead, one after another.
+    the workers stream chunks of donations through a bounded queue, so memory does not grow with the size or number of files.
+    files already in the import ledger are not parsed.
+    returns one ImportResult per file, in the order given. a file that fails part way through keeps the donations
+    added before it failed, and its error, but is not recorded in the import ledger, nor is one with undecodable rows.
+    progress is called with all of the ImportResults after each chunk.
+    the bad rows of each file are written to rejectsDirectory, named by the file's index.
+    the encodings of files are detected by encodingDetector, and confirmed to it for their provider as each is imported
+    """
+    encodingDetector = encodingDetector or EncodingDetector()
+    results = [ImportResult(filename=importFile.name, sha256=hashFile(importFile)) for importFile in files]
+    duplicateIndex = DuplicateIndex(store)
+    if workers == 1:
+        for index, (file, result) in enumerate(zip(files, results)):
+            if not findPreviousImport(store, result):
+                streamFile(store, file, result, duplicateIndex, paymentProvider, chunkSize, progress and (lambda: progress(results)),
+                           rejectsPath(rejectsDirectory, index), encodingDetector)
+        return results
+    workers = workers or os.cpu_count()
+    chunks = WORKERCONTEXT.Queue(QUEUEDCHUNKS * workers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=WORKERCONTEXT, initializer=setChunkQueue, initargs=(chunks,)) as pool:
+        parsing = {index: pool.submit(parseFile, index, importFile, paymentProvider, rejectsPath(rejectsDirectory, index), encodingDetector, chunkSize)
+                   for index, (importFile, result) in enumerate(zip(files, results)) if not findPreviousImport(store, result)}
+        try:
+            while parsing:
+                try:
+                    index, message, value = chunks.get(timeout=POLLSECONDS)
+                except Empty:
+                    failWorkerErrors(parsing, results)
+                    continue
+                if index not in parsing:
+                    continue
+                result = results[index]
+                if message == CHUNK:
+                    insertChunk(store, duplicateIndex, value, result)
+                    if progress:
+                        progress(results)
+                    continue
+                del parsing[index]
+                if message == FAILED:
+                    result.error = value
+                    continue
+                badRows, result.paymentProvider, encoding = value
+                if encoding:
+                    encodingDetector.confirm(result.paymentProvider, encoding)
+                result.setBadRows(badRows)
+                recordImport(store, result)
+        finally:
+            drainWorkers(parsing, chunks)
+    return results
+
+
+def failWorkerErrors(parsing, results):
+    """
+    a worker that raised without sending FAILED, such as one that died, fails its file
+    """
+    for index, future in list(parsing.items()):
+        if future.done() and future.exception() is not None:
+            results[index].error = str(future.exception()) or type(future.exception()).__name__
+            del parsing[index]
+
+
+def drainWorkers(parsing, chunks):
+    """
+    after an error in this process, workers still parsing would block on the full queue and the pool would never shut down
+    """
+    for future in parsing.values():
+        future.cancel()
+    while not all(future.done() for future in parsing.values()):
+        try:
+            chunks.get(timeout=POLLSECONDS)
+        except Empty:
+            pass
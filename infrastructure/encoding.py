@@ -0,0 +1,104 @@
+import codecs
+from chardet.universaldetector import UniversalDetector
+
+SAMPLESIZE = 64 * 1024
+DETECTORSAMPLESIZE = 512 * 1024
+DEFAULTENCODING = 'utf-8'
+ASCII = bytes(range(128))
+
+# utf-32-le starts with the utf-16-le bom, so the longer boms are checked first
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def peek(stream, size):
+    position = stream.tell()
+    sample = stream.read(size)
+    stream.seek(position)
+    return sample
+
+
+def encodingFromBom(sample):
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    return None
+
+
+def decodes(sample, encoding, final):
+    """
+    strict decode of a prefix, a multibyte sequence cut off at the end of the sample is not an error
+    """
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def asciiCompatible(encoding):
+    """
+    whether ascii bytes decode to the same text in encoding, so a file that starts as ascii can be decoded in it
+    """
+    try:
+        return ASCII.decode(encoding) == ASCII.decode('ascii')
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+
+class EncodingDetector():
+    """
+    detects the encoding of an upload without reading all of it.
+    each payment provider always exports in the same encoding, so the
+    last confirmed encoding for a provider is tried before falling back to chardet.
+    an ascii sample decodes in most encodings, so for one the provider's confirmed encoding is taken over utf-8
+    """
+    def __init__(self, sampleSize=SAMPLESIZE, detectorSampleSize=DETECTORSAMPLESIZE):
+        self._sampleSize = sampleSize
+        self._detectorSampleSize = detectorSampleSize
+        self._confirmed = {}
+
+    def detect(self, stream, paymentProvider=None):
+        sample = peek(stream, self._sampleSize)
+        final = len(sample) < self._sampleSize
+
+        encoding = encodingFromBom(sample)
+        if encoding:
+            return encoding
+
+        confirmed = self._confirmed.get(paymentProvider)
+        if confirmed and sample.isascii() and asciiCompatible(confirmed):
+            return confirmed
+        if decodes(sample, DEFAULTENCODING, final):
+            return DEFAULTENCODING
+        if confirmed and decodes(sample, confirmed, final):
+            return confirmed
+
+        return self._detect(peek(stream, self._detectorSampleSize))
+
+    def redetect(self, data):
+        """
+        the encoding of data, part of a file found not to be in the encoding detected from its sample
+        """
+        return self._detect(data)
+
+    def confirm(self, paymentProvider, encoding):
+        """
+        call once a file has been decoded without errors
+        """
+        self._confirmed[paymentProvider] = encoding
+
+    def _detect(self, sample):
+        detector = UniversalDetector()
+        for line in sample.splitlines(keepends=True):
+            detector.feed(line)
+            if detector.done:
+                break
+        detector.close()
+        encoding = detector.result["encoding"]
+        return encoding.lower() if encoding else DEFAULTENCODING
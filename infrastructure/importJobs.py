@@ -0,0 +1,127 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from domain import ImportJob, ImportJobStatus
+from .donationImport import DecodingReader, hashFile, importDonations, importFiles, rejectsPath
+from .encoding import EncodingDetector
+from .transactionimporter import TransactionImporterFactory
+
+IMPORTJOB_WORKERS = 2
+REJECTSDIRECTORY = os.path.join(tempfile.gettempdir(), 'sdmRejects')
+# rejected rows hold donors' details, so are only readable by the app, and only kept for as long as they are useful
+REJECTSMODE = 0o700
+REJECTSRETENTION = timedelta(days=7)
+
+
+def updateJob(job, results):
+    job.files = [result.toDict() for result in results]
+    job.parsed = sum(result.parsed for result in results)
+    job.added = sum(result.added for result in results)
+    job.dupes = sum(result.dupes for result in results)
+    job.badRows = sum(result.badRows for result in results)
+
+
+def failInterruptedJobs(store):
+    """
+    fails the jobs left queued or running by app processes that stopped before finishing them.
+    any running app process could be importing those jobs, so this is only for while none are running
+    """
+    jobs = store.getUnfinishedImportJobs()
+    for job in jobs:
+        job.status = ImportJobStatus.FAILED
+        job.error = "interrupted, the import stopped before it finished"
+        job.finished = datetime.now()
+        store.updateImportJob(job)
+    return jobs
+
+
+class ImportJobRunner():
+    """
+    imports uploads on a local thread pool, so the request that queued them returns straight away.
+    each job opens its own store with openStore and records its progress there.
+    the rows each job rejected are kept under rejectsDirectory, after the upload itself is removed,
+    until they are older than rejectsRetention, when they are removed as the next job starts
+    """
+    def __init__(self, openStore, workers=IMPORTJOB_WORKERS, encodingDetector=None, rejectsDirectory=REJECTSDIRECTORY,
+                 rejectsRetention=REJECTSRETENTION):
+        self._openStore = openStore
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='importJob')
+        self.encodingDetector = encodingDetector or EncodingDetector()
+        self.rejectsDirectory = rejectsDirectory
+        self.rejectsRetention = rejectsRetention
+
+    def rejectsPath(self, storeId, index):
+        """
+        the csv of rows rejected from the job's file at index, which may not exist
+        """
+        return rejectsPath(os.path.join(self.rejectsDirectory, str(storeId)), index)
+
+    def submit(self, store, filename, files, paymentProvider, directory=None) -> ImportJob:
+        """
+        files are ImportFiles, directory is removed once the job has finished with them
+        """
+        job = store.addImportJob(ImportJob(filename=filename, paymentProvider=paymentProvider))
+        self._pool.submit(self._run, job, files, paymentProvider, directory)
+        return job
+
+    def removeOldRejects(self):
+        """
+        removes the rejects of jobs that finished longer than rejectsRetention ago
+        """
+        if not os.path.isdir(self.rejectsDirectory):
+            return
+        oldest = time.time() - self.rejectsRetention.total_seconds()
+        for entry in os.scandir(self.rejectsDirectory):
+            if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < oldest:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _run(self, job, files, paymentProvider, directory):
+        store = self._openStore()
+        try:
+            job.status = ImportJobStatus.RUNNING
+            job.started = datetime.now()
+            store.updateImportJob(job)
+
+            def progress(results):
+                updateJob(job, results)
+                store.updateImportJob(job)
+
+            self.removeOldRejects()
+            rejectsDirectory = os.path.join(self.rejectsDirectory, str(job.storeId))
+            os.makedirs(rejectsDirectory, mode=REJECTSMODE, exist_ok=True)
+            # makedirs only applies the mode to the directories it creates
+            os.chmod(self.rejectsDirectory, REJECTSMODE)
+            if len(files) == 1 and files[0].member is None:
+                results = [self._importCsv(store, files[0], paymentProvider, lambda result: progress([result]), self.rejectsPath(job.storeId, 0))]
+            else:
+                results = importFiles(store, files, paymentProvider, progress=progress, rejectsDirectory=rejectsDirectory,
+                                      encodingDetector=self.encodingDetector)
+            updateJob(job, results)
+            job.status = ImportJobStatus.DONE
+        except Exception as e:
+            logging.exception("import job %s failed", job.storeId)
+            job.status = ImportJobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished = datetime.now()
+            store.updateImportJob(job)
+            store.close()
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _importCsv(self, store, importFile, paymentProvider, progress, rejectsPath):
+        with importFile.open() as stream:
+            encoding = self.encodingDetector.detect(stream, paymentProvider)
+            reader = DecodingReader(stream, encoding)
+            importer = TransactionImporterFactory(paymentProvider, reader, rejectsPath)
+            result = importDonations(store, importer, importFile.name, progress=progress, sha256=hashFile(importFile))
+        if not reader.undecodableLines:
+            self.encodingDetector.confirm(paymentProvider, encoding)
+        return result
@@ -0,0 +1,93 @@
+"""
+the qualifying rules of each benefit type, applied in python to per donor, per day aggregates
+so a store can evaluate many benefits from one read, or from aggregates it keeps itself
+"""
+from datetime import date
+from functools import lru_cache
+from domain import BenefitType, rndDate
+
+
+def months(start, end):
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+@lru_cache(maxsize=65536)
+def dateFromOrdinal(ordinal):
+    """
+    donations fall on a few thousand distinct days, so each is decoded once and the date shared
+    """
+    return date.fromordinal(ordinal)
+
+
+def qualifyingWindow(benefit):
+    """
+    the first and last dates of the donations the qualifying query for benefit reads, as ordinals.
+    a new donor is one with no earlier donation, so NEWDONOR reads back to the first donation
+    """
+    if benefit.type == BenefitType.AMOUNTPERMONTH:
+        return (rndDate(benefit.startDate, "month", "down").toordinal(), rndDate(benefit.endDate, "month", "up").toordinal())
+    elif benefit.type == BenefitType.NEWDONOR:
+        return (0, benefit.endDate.toordinal())
+    return (benefit.startDate.toordinal(), benefit.endDate.toordinal())
+
+
+def evaluationWindow(benefit):
+    """
+    the donations a benefit is evaluated from, as ordinals. unlike qualifyingWindow NEWDONOR's first dates come from donors
+    """
+    if benefit.type == BenefitType.AMOUNTPERMONTH:
+        return qualifyingWindow(benefit)
+    return (benefit.startDate.toordinal(), benefit.endDate.toordinal())
+
+
+def overlappingGroups(benefits):
+    """
+    benefits in each currency, grouped so the windows of a group overlap and each group is read once
+    """
+    byCurrency = {}
+    for benefit in benefits:
+        byCurrency.setdefault(benefit.minAmount.currency.name, []).append(benefit)
+    for currency, inCurrency in byCurrency.items():
+        group = []
+        groupStart = groupEnd = None
+        for benefit in sorted(inCurrency, key=evaluationWindow):
+            start, end = evaluationWindow(benefit)
+            if group and start > groupEnd:
+                yield currency, groupStart, groupEnd, group
+                group = []
+            if not group:
+                groupStart, groupEnd = start, end
+            group.append(benefit)
+            groupEnd = max(groupEnd, end)
+        yield currency, groupStart, groupEnd, group
+
+
+class BenefitEvaluator():
+    """
+    decides from a donor's days whether they qualify for a benefit, as getQualifyingQuery does in sql
+    """
+    def __init__(self, benefit):
+        self.benefit = benefit
+        self.start, self.end = evaluationWindow(benefit)
+        self.minAmount = benefit.minAmount.minor
+        self.months = months(benefit.startDate, benefit.endDate)
+        self.donors = []
+
+    def evaluate(self, donor, days, firstDates):
+        inWindow = [day for day in days if self.start <= day[0] <= self.end]
+        if not inWindow:
+            return
+        if self.benefit.type == BenefitType.AMOUNT:
+            qualifies = sum(total for _, total, _ in inWindow) >= self.minAmount
+        elif self.benefit.type == BenefitType.AMOUNTPERMONTH:
+            monthTotals = {}
+            for ordinal, total, _ in inWindow:
+                day = dateFromOrdinal(ordinal)
+                monthTotals[(day.year, day.month)] = monthTotals.get((day.year, day.month), 0) + total
+            qualifies = sum(1 for total in monthTotals.values() if total >= self.minAmount) >= self.months
+        else:
+            firstDate = firstDates.get(donor)
+            qualifies = (firstDate is not None and self.start <= firstDate <= self.end
+                         and any(largest > self.minAmount for _, _, largest in inWindow))
+        if qualifies:
+            self.donors.append(donor)
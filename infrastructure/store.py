@@ -1,9 +1,9 @@
-from typing import NewType, List
+from typing import Dict, NewType, List, Iterable, Iterator, Tuple, Set
 from datetime import datetime
 from dataclasses import dataclass
 from enum import Enum
 from abc import ABC, abstractmethod
-from domain import Donor, Donation, Benefit, PaymentId, PaymentProvider, DonorDetail
+from domain import Donor, Donation, DonationRollup, Benefit, PaymentId, PaymentProvider, DonorDetail, ImportJob, ImportLedgerEntry
 
 
 class StoreException(Exception):
@@ -21,6 +21,7 @@ class StoreNotFound(StoreException):
 
 class StoreType(Enum):
     SQLLITE = 1
+    MEMORY = 2
 
 
 ConnectionString = NewType('ConnectionString', str)
@@ -28,8 +29,24 @@ ConnectionString = NewType('ConnectionString', str)
 
 @dataclass(frozen=True)
 class StoreConfig():
+    """
+    the tuning fields are SQLite pragmas, applied to each connection.
+    cacheSize is in pages, or KiB when negative. busyTimeout is in milliseconds.
+    poolSize is the number of idle stores a StorePool keeps open.
+    readCacheItems bounds the results a StoreCache keeps, and readCacheSeconds how long it keeps them.
+    queries taking longer than slowQuerySeconds are logged with their plan
+    """
     type: StoreType
     connnectionString: ConnectionString
+    journalMode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cacheSize: int = -64000
+    mmapSize: int = 256 * 2**20
+    busyTimeout: int = 5000
+    poolSize: int = 4
+    readCacheItems: int = 200000
+    readCacheSeconds: float = 300
+    slowQuerySeconds: float = 0.5
 
 
 class Store(ABC):
@@ -47,10 +64,53 @@ class Store(ABC):
     def insertDonation(self, donation: Donation) -> None:
         pass
 
+    @abstractmethod
+    def insertDonations(self, donations: Iterable[Donation], chunkSize: int = None) -> Tuple[List[Donation], List[Donation]]:
+        """
+        insert many donations, committing once per chunk
+        returns (added, dupes)
+        """
+        pass
+
+    @abstractmethod
+    def getDonationKeys(self, source: PaymentProvider, startDate: datetime, endDate: datetime) -> Set[PaymentId]:
+        """
+        the paymentIds of donations from source between the dates
+        """
+        pass
+
     @abstractmethod
     def getDonations(self, startDate: datetime, endDate: datetime):
         pass
 
+    @abstractmethod
+    def iterDonations(self, startDate: datetime, endDate: datetime) -> Iterator[Donation]:
+        """
+        as getDonations, but read lazily so memory does not grow with the date range
+        """
+        pass
+
+    @abstractmethod
+    def getRollups(self, startDate: datetime, endDate: datetime) -> Iterator[DonationRollup]:
+        """
+        the daily rollups between the dates, kept up to date as donations are inserted
+        """
+        pass
+
+    @abstractmethod
+    def rebuildRollups(self) -> None:
+        """
+        regenerates the rollups from the donations
+        """
+        pass
+
+    @abstractmethod
+    def rebuildDonors(self) -> None:
+        """
+        regenerates each donor's first and last dates, count and totals from the donations
+        """
+        pass
+
     @abstractmethod
     def getDonation(self, source: PaymentProvider, paymentId: PaymentId) -> Donation:
         pass
@@ -85,16 +145,62 @@ class Store(ABC):
 
     @abstractmethod
     def getQualifyingDonors(self, benefit: Benefit) -> List[Donor]:
+        """
+        may be answered from the donors found last time, while no donation has arrived that could change them
+        """
+        pass
+
+    @abstractmethod
+    def evaluateBenefits(self, benefits: Iterable[Benefit]) -> Dict[str, List[Donor]]:
+        """
+        the qualifying donors of each stored benefit, by storeId, evaluated together. benefits that have not been stored are left out
+        """
         pass
 
     @abstractmethod
     def getDetailDonors(self) -> List[DonorDetail]:
+        """
+        every donor, in the order of their first donation
+        """
+        pass
+
+    @abstractmethod
+    def addImportJob(self, job: ImportJob) -> ImportJob:
+        pass
+
+    @abstractmethod
+    def updateImportJob(self, job: ImportJob) -> None:
+        pass
+
+    @abstractmethod
+    def getImportJob(self, storeId) -> ImportJob:
+        pass
+
+    @abstractmethod
+    def getUnfinishedImportJobs(self) -> List[ImportJob]:
+        """
+        the import jobs still queued or running
+        """
+        pass
+
+    @abstractmethod
+    def addLedgerEntry(self, entry: ImportLedgerEntry) -> None:
+        pass
+
+    @abstractmethod
+    def getLedgerEntry(self, sha256: str) -> ImportLedgerEntry:
         pass
 
     @abstractmethod
     def setupStore(self):
         pass
 
+    def reset(self):
+        """
+        called before a pooled store is reused, to discard anything left over from its last use
+        """
+        pass
+
     @abstractmethod
     def close(self):
         pass
@@ -0,0 +1,289 @@
+"""
+a store held in python structures, for tests and benchmarks, and as a read cache for analytics workers.
+stores opened with the same connection string share their data within the process, except :memory:,
+which like sqlite's gives each store its own
+"""
+from bisect import bisect_left, bisect_right
+from copy import deepcopy
+from datetime import date
+from threading import Lock, RLock
+from typing import Dict, List
+from domain import Benefit, BenefitType, Donor, DonationRollup, DonorDetail, ImportJob, Money, Total
+from .store import Store, StoreType, StoreConfig, StoreDuplicate, StoreNotFound
+from .qualifying import BenefitEvaluator, overlappingGroups
+
+PRIVATE = ":memory:"
+
+
+class MemoryData():
+    """
+    donations are found by (source, paymentId) in a dict, and by date in arrays kept sorted for bisect.
+    rollups and donors are kept up to date as donations are added, as are the per donor, per day
+    totals and largest donation in each currency that the qualifying rules read
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.donations = {}
+        self.byDate = []
+        self.dates = []
+        self.unsorted = []
+        self.rollups = {}
+        self.donors = {}
+        self.donorTotals = {}
+        self.donorDays = {}
+        self.benefits = {}
+        self.importJobs = {}
+        self.ledger = {}
+        self.lastId = 0
+
+    def nextId(self):
+        self.lastId += 1
+        return self.lastId
+
+    def add(self, donation):
+        self.donations[(donation.source, donation.paymentId)] = donation
+        self.unsorted.append(donation)
+        self.aggregate(donation)
+
+    def aggregate(self, donation):
+        ordinal = donation.paymentDate.toordinal()
+        minor = donation.money.minor
+        currency = donation.money.currency
+
+        rollup = self.rollups.setdefault((ordinal, donation.source, donation.type, currency), [0, 0])
+        rollup[0] += 1
+        rollup[1] += minor
+
+        donor = self.donors.get(donation.donor)
+        if donor is None:
+            self.donors[donation.donor] = [ordinal, ordinal, 1]
+        else:
+            donor[0] = min(donor[0], ordinal)
+            donor[1] = max(donor[1], ordinal)
+            donor[2] += 1
+        totals = self.donorTotals.setdefault(donation.donor, {})
+        totals[currency] = totals.get(currency, 0) + minor
+
+        day = self.donorDays.setdefault(currency.name, {}).setdefault(donation.donor, {}).setdefault(ordinal, [0, minor])
+        day[0] += minor
+        day[1] = max(day[1], minor)
+
+    def reaggregate(self):
+        self.rollups, self.donors, self.donorTotals, self.donorDays = {}, {}, {}, {}
+        for donation in self.donations.values():
+            self.aggregate(donation)
+
+    def sortedByDate(self):
+        """
+        donations added since the last read are merged in, keeping each day in the order its donations were added
+        """
+        if self.unsorted:
+            byDate = self.byDate + self.unsorted
+            byDate.sort(key=lambda donation: donation.paymentDate)
+            self.byDate = byDate
+            self.dates = [donation.paymentDate.toordinal() for donation in byDate]
+            self.unsorted = []
+        return self.byDate, self.dates
+
+
+_shared = {}
+_sharedLock = Lock()
+
+
+def memoryData(name):
+    if name == PRIVATE:
+        return MemoryData()
+    with _sharedLock:
+        if name not in _shared:
+            _shared[name] = MemoryData()
+        return _shared[name]
+
+
+def copyBenefit(storeId, benefit):
+    return Benefit.Factory(storeId, benefit.type, benefit.reward, benefit.startDate, benefit.endDate, benefit.delivery,
+                           benefit.minAmount, benefit.completed)
+
+
+def dateRange(startDate, endDate):
+    if startDate > endDate:
+        raise ValueError("startdate gt enddate")
+    return startDate.toordinal(), endDate.toordinal()
+
+
+class StoreMemory(Store):
+    @property
+    def type(self):
+        return StoreType.MEMORY
+
+    def __init__(self, config: StoreConfig) -> None:
+        self._data = memoryData(config.connnectionString)
+
+    def insertDonation(self, donation) -> None:
+        with self._data.lock:
+            if (donation.source, donation.paymentId) in self._data.donations:
+                raise StoreDuplicate(donation=donation)
+            self._data.add(donation)
+
+    def insertDonations(self, donations, chunkSize=None):
+        """
+        chunkSize is accepted for the Store interface, every donation is added at once
+        """
+        added = []
+        dupes = []
+        with self._data.lock:
+            for donation in donations:
+                if (donation.source, donation.paymentId) in self._data.donations:
+                    dupes.append(donation)
+                else:
+                    self._data.add(donation)
+                    added.append(donation)
+        return added, dupes
+
+    def _between(self, startDate, endDate):
+        start, end = dateRange(startDate, endDate)
+        with self._data.lock:
+            byDate, dates = self._data.sortedByDate()
+        return byDate[bisect_left(dates, start):bisect_right(dates, end)]
+
+    def getDonationKeys(self, source, startDate, endDate):
+        return {donation.paymentId for donation in self._between(startDate, endDate) if donation.source == source}
+
+    def getDonations(self, startDate, endDate):
+        return self._between(startDate, endDate)
+
+    def iterDonations(self, startDate, endDate, batchSize=None):
+        return iter(self._between(startDate, endDate))
+
+    def getRollups(self, startDate, endDate):
+        start, end = dateRange(startDate, endDate)
+        with self._data.lock:
+            rollups = [(key, value[:]) for key, value in self._data.rollups.items() if start <= key[0] <= end]
+        rollups.sort(key=lambda rollup: (rollup[0][0], rollup[0][1].name, rollup[0][2].name, rollup[0][3].name))
+        return (DonationRollup(date.fromordinal(ordinal), source, type, Money.fromMinor(minor, currency), count)
+                for (ordinal, source, type, currency), (count, minor) in rollups)
+
+    def rebuildRollups(self):
+        with self._data.lock:
+            self._data.reaggregate()
+
+    def rebuildDonors(self):
+        with self._data.lock:
+            self._data.reaggregate()
+
+    def getDonation(self, source, paymentId):
+        donation = self._data.donations.get((source, paymentId))
+        if donation is None:
+            raise StoreNotFound(source=source, paymentId=paymentId)
+        return donation
+
+    def addBenefit(self, benefit) -> Benefit:
+        with self._data.lock:
+            storeId = str(self._data.nextId())
+            benefit.setStoreId(storeId)
+            self._data.benefits[storeId] = copyBenefit(storeId, benefit)
+        return benefit
+
+    def _benefits(self, keep):
+        with self._data.lock:
+            benefits = list(self._data.benefits.values())
+        return [copyBenefit(benefit._storeId, benefit) for benefit in benefits if keep(benefit)]
+
+    def getCurrentBenefits(self):
+        today = date.today()
+        return self._benefits(lambda benefit: not benefit.completed and benefit.endDate > today)
+
+    def getDeliveredBenefits(self):
+        return self._benefits(lambda benefit: benefit.completed)
+
+    def getPendingBenefits(self):
+        today = date.today()
+        return self._benefits(lambda benefit: not benefit.completed and benefit.endDate <= today)
+
+    def getBenefit(self, storeId) -> Benefit:
+        benefit = self._data.benefits.get(str(storeId))
+        if benefit is None:
+            raise StoreNotFound(storeId=storeId)
+        return copyBenefit(benefit._storeId, benefit)
+
+    def updateBenefit(self, benefit) -> None:
+        with self._data.lock:
+            self._data.benefits[str(benefit._storeId)] = copyBenefit(str(benefit._storeId), benefit)
+        return benefit
+
+    def deleteBenefit(self, storeId) -> None:
+        with self._data.lock:
+            self._data.benefits.pop(str(storeId), None)
+
+    def getQualifyingDonors(self, benefit) -> List[Donor]:
+        return self._evaluate([benefit])[0].donors
+
+    def evaluateBenefits(self, benefits) -> Dict[str, List[Donor]]:
+        stored = [benefit for benefit in benefits if benefit._storeId is not None]
+        return {evaluator.benefit._storeId: evaluator.donors for evaluator in self._evaluate(stored)}
+
+    def _evaluate(self, benefits):
+        evaluators = []
+        with self._data.lock:
+            for currency, start, end, group in overlappingGroups(benefits):
+                groupEvaluators = [BenefitEvaluator(benefit) for benefit in group]
+                firstDates = {}
+                if any(benefit.type == BenefitType.NEWDONOR for benefit in group):
+                    firstDates = {donor: values[0] for donor, values in self._data.donors.items()}
+                for donor, days in self._data.donorDays.get(currency, {}).items():
+                    inWindow = [(ordinal, total, largest) for ordinal, (total, largest) in days.items() if start <= ordinal <= end]
+                    if inWindow:
+                        for evaluator in groupEvaluators:
+                            evaluator.evaluate(donor, inWindow, firstDates)
+                evaluators += groupEvaluators
+        for evaluator in evaluators:
+            evaluator.donors.sort()
+        byBenefit = {id(evaluator.benefit): evaluator for evaluator in evaluators}
+        return [byBenefit[id(benefit)] for benefit in benefits]
+
+    def getDetailDonors(self) -> List[DonorDetail]:
+        with self._data.lock:
+            donors = [(firstDate, donor, lastDate, count, dict(self._data.donorTotals[donor]))
+                      for donor, (firstDate, lastDate, count) in self._data.donors.items()]
+        donors.sort()
+        return [DonorDetail(donor, date.fromordinal(firstDate), date.fromordinal(lastDate), count,
+                            Total([Money.fromMinor(minor, currency) for currency, minor in totals.items()], count))
+                for firstDate, donor, lastDate, count, totals in donors]
+
+    def addImportJob(self, job) -> ImportJob:
+        with self._data.lock:
+            job.storeId = str(self._data.nextId())
+            self._data.importJobs[job.storeId] = deepcopy(job)
+        return job
+
+    def updateImportJob(self, job) -> None:
+        with self._data.lock:
+            self._data.importJobs[job.storeId] = deepcopy(job)
+
+    def getImportJob(self, storeId) -> ImportJob:
+        job = self._data.importJobs.get(str(storeId))
+        if job is None:
+            raise StoreNotFound(storeId=storeId)
+        return deepcopy(job)
+
+    def getUnfinishedImportJobs(self) -> List[ImportJob]:
+        with self._data.lock:
+            jobs = [deepcopy(job) for job in self._data.importJobs.values() if not job.isFinished]
+        return sorted(jobs, key=lambda job: int(job.storeId))
+
+    def addLedgerEntry(self, entry) -> None:
+        with self._data.lock:
+            if entry.sha256 in self._data.ledger:
+                raise StoreDuplicate(sha256=entry.sha256)
+            self._data.ledger[entry.sha256] = entry
+
+    def getLedgerEntry(self, sha256):
+        entry = self._data.ledger.get(sha256)
+        if entry is None:
+            raise StoreNotFound(sha256=sha256)
+        return entry
+
+    def setupStore(self):
+        pass
+
+    def close(self):
+        pass
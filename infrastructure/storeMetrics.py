@@ -0,0 +1,273 @@
+"""
+timing of store calls and the sqlite queries they run.
+each public method of an instrumented store records its wall time, the rows its queries returned and the time spent
+decoding them into a StoreMetrics, and any query slower than the connection's threshold is logged with its plan
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from sqlite3 import dbapi2 as sqlite
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, float("inf"))
+# rows fetched at a time when a cursor is iterated
+ITERATIONBATCHSIZE = 256
+
+
+class MethodStats():
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.rows = 0
+        self.decodeSeconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds, rows, decodeSeconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        self.rows += rows
+        self.decodeSeconds += decodeSeconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def toDict(self):
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 6),
+            "meanSeconds": round(self.seconds / self.calls, 6) if self.calls else 0.0,
+            "maxSeconds": round(self.maxSeconds, 6),
+            "rows": self.rows,
+            "decodeSeconds": round(self.decodeSeconds, 6),
+            "histogram": {f"<={bound}s": count for bound, count in zip(BUCKETS, self.buckets)},
+        }
+
+
+class StoreMetrics():
+    """
+    per method histograms of store calls, safe to share between threads
+    """
+    def __init__(self):
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, seconds, rows, decodeSeconds):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.add(seconds, rows, decodeSeconds)
+
+    def snapshot(self):
+        """
+        the stats of each method, the one taking the most time in all first
+        """
+        with self._lock:
+            methods = sorted(self._methods.items(), key=lambda item: item[1].seconds, reverse=True)
+            return {method: stats.toDict() for method, stats in methods}
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+
+
+# the metrics of every store in this process, unless a store is given its own
+storeMetrics = StoreMetrics()
+
+_calls = threading.local()
+
+
+class MethodCall():
+    """
+    what one store call has spent so far. queries and decoding add to the call active when they started,
+    so rows read lazily after the method returned are still counted against it
+    """
+    def __init__(self, method, metrics):
+        self.method = method
+        self.metrics = metrics
+        self.seconds = 0.0
+        self.rows = 0
+        self.decodeSeconds = 0.0
+        # calls made by the method to other methods of the store
+        self.depth = 0
+        # set when the result is read after the method returns, so is recorded by timedBatches
+        self.lazy = False
+
+    def record(self):
+        self.metrics.record(self.method, self.seconds, self.rows, self.decodeSeconds)
+
+
+def currentCall():
+    return getattr(_calls, "current", None)
+
+
+def addDecodeTime(call, seconds):
+    if call is not None:
+        call.decodeSeconds += seconds
+
+
+def timedMethod(name, method):
+    @wraps(method)
+    def timed(self, *args, **kwargs):
+        call = currentCall()
+        if call is not None:
+            # a call made by another method of the store is counted as part of it
+            call.depth += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                call.depth -= 1
+        call = MethodCall(name, self._metrics)
+        _calls.current = call
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            call.seconds += time.perf_counter() - started
+            _calls.current = None
+            if not call.lazy:
+                call.record()
+    return timed
+
+
+def timedBatches(batches):
+    """
+    the items of each of batches, a generator of lists, as the lazily read result of the current call.
+    the time taken to make each batch is counted against the call, which is recorded once its result has been read,
+    or abandoned. timing batches rather than items keeps the cost to each item to that of one generator
+    """
+    call = currentCall()
+    if call is None or call.depth:
+        # read by the method that made the call, whose time includes the reading
+        return (item for batch in batches for item in batch)
+    call.lazy = True
+
+    def timed():
+        try:
+            while True:
+                started = time.perf_counter()
+                batch = next(batches, None)
+                call.seconds += time.perf_counter() - started
+                if batch is None:
+                    return
+                yield from batch
+        finally:
+            batches.close()
+            call.record()
+    return timed()
+
+
+def instrumented(cls):
+    """
+    class decorator timing every public method the class defines
+    """
+    for name, attribute in list(vars(cls).items()):
+        if callable(attribute) and not name.startswith('_') and not isinstance(attribute, (staticmethod, classmethod, type)):
+            setattr(cls, name, timedMethod(name, attribute))
+    return cls
+
+
+class InstrumentedCursor(sqlite.Cursor):
+    """
+    counts the rows fetched against the current call, and logs statements slower than the connection's slowQuerySeconds,
+    counting the time to fetch their rows as well as to execute them.
+    iterating fetches ITERATIONBATCHSIZE rows at a time, so the timing is paid per batch rather than per row.
+    rows fetched ahead are dropped if the iteration stops early, so a cursor is read by iterating or fetching, not both
+    """
+    def _start(self, sql, parameters, count=1):
+        self._call = currentCall()
+        self._sql = sql
+        self._parameters = parameters
+        self._count = count
+        self._seconds = 0.0
+        self._logged = False
+
+    def _spent(self, started, rows=0):
+        seconds = time.perf_counter() - started
+        call = getattr(self, "_call", None)
+        if call is not None:
+            call.rows += rows
+        if not hasattr(self, "_sql"):
+            return
+        self._seconds += seconds
+        if not self._logged and self._seconds >= self.connection.slowQuerySeconds:
+            self._logged = True
+            self.connection.logSlowQuery(self._call.method if self._call else "store", self._sql, self._parameters, self._count, self._seconds)
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._spent(started)
+
+    def executemany(self, sql, seqOfParameters):
+        seqOfParameters = list(seqOfParameters)
+        self._start(sql, seqOfParameters[0] if seqOfParameters else (), len(seqOfParameters))
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seqOfParameters)
+        finally:
+            self._spent(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._spent(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._spent(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._spent(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(ITERATIONBATCHSIZE)
+            if not rows:
+                return
+            yield from rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class InstrumentedConnection(sqlite.Connection):
+    """
+    a connection whose cursors are InstrumentedCursors
+    """
+    slowQuerySeconds = float("inf")
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seqOfParameters):
+        return self.cursor().executemany(sql, seqOfParameters)
+
+    def logSlowQuery(self, method, sql, parameters, count, seconds):
+        """
+        parameters are those of the first of count executions. only their number and types are logged, as they hold donors' details
+        """
+        try:
+            plan = '\n'.join(row[3] for row in super().cursor().execute("EXPLAIN QUERY PLAN " + sql, parameters))
+        except sqlite.Error as error:
+            plan = f"not available: {error}"
+        types = ', '.join(sorted({type(parameter).__name__ for parameter in parameters}))
+        logging.warning("slow query in %s took %.3fs for %d execution(s)\n%s\nparameters: %d (%s)\nplan:\n%s", method, seconds, count,
+                        ' '.join(sql.split()), len(parameters), types, plan)
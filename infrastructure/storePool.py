@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+from .store import Store
+
+
+class StorePool():
+    """
+    keeps up to size idle stores open for reuse, so a request neither pays to connect
+    nor starts with a cold page cache. one pool per worker process, it is safe to share between threads.
+    acquire never waits, a new store is opened when none is idle
+    """
+    def __init__(self, openStore, size):
+        self._openStore = openStore
+        self._size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Store:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._openStore()
+
+    def release(self, store: Store) -> None:
+        try:
+            store.reset()
+        except Exception:
+            store.close()
+            raise
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(store)
+                return
+        store.close()
+
+    @contextmanager
+    def store(self):
+        store = self.acquire()
+        try:
+            yield store
+        finally:
+            self.release(store)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for store in idle:
+            store.close()
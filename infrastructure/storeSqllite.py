@@ -1,12 +1,15 @@
-from typing import List
+import json
+import time
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Dict, List
 from sqlite3 import dbapi2 as sqlite, OperationalError
-from datetime import date, datetime
-from domain import Benefit, Donor, Donation, DonationType, Money, Delivery, Currency, PaymentProvider, rndDate, BenefitType, DonorDetail
+from datetime import datetime
+from domain import Benefit, Donor, Donation, DonationRollup, DonationType, Money, Delivery, Currency, PaymentProvider, rndDate, BenefitType, DonorDetail, Total
+from domain import ImportJob, ImportJobStatus, ImportLedgerEntry, minorExponent
 from .store import Store, StoreType, StoreConfig, StoreDuplicate, StoreNotFound
-
-
-def months(start, end):
-    return (end.year - start.year) * 12 + end.month - start.month + 1
+from .storeMetrics import InstrumentedConnection, addDecodeTime, currentCall, instrumented, storeMetrics, timedBatches
+from .qualifying import BenefitEvaluator, dateFromOrdinal, months, overlappingGroups, qualifyingWindow
 
 
 def sqlNames(fields):
@@ -22,12 +25,66 @@ def setCmd(fields):
     return 'SET ' + ','.join(updateFields)
 
 
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fetchBatches(cursor, size):
+    """
+    the rows of an executed cursor, fetched size at a time
+    """
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def decodeRows(rows, fromRow):
+    """
+    the rows decoded with fromRow, the time it takes counted against the current store call
+    """
+    call = currentCall()
+    started = time.perf_counter()
+    decoded = [fromRow(row) for row in rows]
+    addDecodeTime(call, time.perf_counter() - started)
+    return decoded
+
+
+def decodeBatches(cursor, size, fromRow):
+    """
+    the rows of cursor decoded with fromRow as they are read, fetched in batches of size.
+    rows are decoded DECODE_BATCHSIZE at a time, few enough that the objects made are freed before the
+    garbage collector's youngest generation is next collected, so it does not have to scan them
+    """
+    call = currentCall()
+
+    def decode():
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            for start in range(0, len(rows), DECODE_BATCHSIZE):
+                started = time.perf_counter()
+                decoded = [fromRow(row) for row in rows[start:start + DECODE_BATCHSIZE]]
+                addDecodeTime(call, time.perf_counter() - started)
+                yield decoded
+    return timedBatches(decode())
+
+
 CMD_INIT_DONATIONS = """
     CREATE TABLE donations(
         source TEXT NOT NULL,
         paymentId TEXT NOT NULL,
         donor TEXT NOT NULL,
-        date TEXT NOT NULL,
+        date INT NOT NULL,
         type TEXT NOT NULL,
         amount INT NOT NULL,
         currency TEXT NOT NULL,
@@ -48,10 +105,10 @@ CMD_INIT_BENEFITS = """
         id INTEGER PRIMARY KEY,
         type TEXT NOT NULL,
         reward TEXT NOT NULL,
-        startDate TEXT NOT NULL,
-        endDate TEXT NOT NULL,
+        startDate INT NOT NULL,
+        endDate INT NOT NULL,
         delivery TEXT NOT NULL,
-        minAmount FLOAT NULL,
+        minAmount INT NULL,
         minAmountCurrency TEXT NULL,
         completed INT NOT NULL
     );"""
@@ -69,15 +126,307 @@ CMD_GET_BENEFITS = f"SELECT id,{sqlNames(BENEFIT_FIELDS)} FROM benefits where en
 CMD_GET_BENEFIT = f"SELECT id,{sqlNames(BENEFIT_FIELDS)} FROM benefits WHERE id=?"
 CMD_INSERT_BENEFIT = f"INSERT INTO benefits ({sqlNames(BENEFIT_FIELDS)}) VALUES ({sqlValues(BENEFIT_FIELDS)});"
 CMD_DELETE_BENEFIT = "DELETE FROM benefits WHERE id=?"
+# a benefit that ends today is pending rather than current
+CMD_GET_CURRENT_BENEFITS = "SELECT * FROM benefits WHERE completed=0 AND endDate>?"
+CMD_GET_DELIVERED_BENEFITS = "SELECT * FROM benefits WHERE completed=1"
+CMD_GET_PENDING_BENEFITS = "SELECT * FROM benefits WHERE completed=0 AND endDate<=?"
 CMD_UPDATE_BENEFIT = f"UPDATE benefits {setCmd(BENEFIT_FIELDS)} WHERE id=?"
 
+CMD_INIT_IMPORTJOBS = """
+    CREATE TABLE IF NOT EXISTS importJobs(
+        id INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        paymentProvider TEXT NULL,
+        status TEXT NOT NULL,
+        parsed INT NOT NULL,
+        added INT NOT NULL,
+        dupes INT NOT NULL,
+        badRows INT NOT NULL,
+        started TEXT NULL,
+        finished TEXT NULL,
+        error TEXT NULL,
+        files TEXT NOT NULL
+    );"""
+IMPORTJOB_FIELDS = [
+    "filename",
+    "paymentProvider",
+    "status",
+    "parsed",
+    "added",
+    "dupes",
+    "badRows",
+    "started",
+    "finished",
+    "error",
+    "files"
+]
+CMD_GET_IMPORTJOB = f"SELECT id,{sqlNames(IMPORTJOB_FIELDS)} FROM importJobs WHERE id=?"
+CMD_INSERT_IMPORTJOB = f"INSERT INTO importJobs ({sqlNames(IMPORTJOB_FIELDS)}) VALUES ({sqlValues(IMPORTJOB_FIELDS)});"
+CMD_UPDATE_IMPORTJOB = f"UPDATE importJobs {setCmd(IMPORTJOB_FIELDS)} WHERE id=?"
+CMD_GET_UNFINISHED_IMPORTJOBS = f"SELECT id,{sqlNames(IMPORTJOB_FIELDS)} FROM importJobs WHERE status IN (?,?) ORDER BY id"
+
+CMD_INIT_IMPORTS = """
+    CREATE TABLE IF NOT EXISTS imports(
+        sha256 TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        paymentProvider TEXT NOT NULL,
+        rows INT NOT NULL,
+        added INT NOT NULL,
+        dupes INT NOT NULL,
+        badRows INT NOT NULL,
+        firstDate INT NULL,
+        lastDate INT NULL,
+        imported TEXT NOT NULL
+    );"""
+IMPORT_FIELDS = [
+    "sha256",
+    "filename",
+    "paymentProvider",
+    "rows",
+    "added",
+    "dupes",
+    "badRows",
+    "firstDate",
+    "lastDate",
+    "imported"
+]
+CMD_GET_IMPORT = f"SELECT {sqlNames(IMPORT_FIELDS)} FROM imports WHERE sha256=?"
+CMD_INSERT_IMPORT = f"INSERT INTO imports ({sqlNames(IMPORT_FIELDS)}) VALUES ({sqlValues(IMPORT_FIELDS)});"
+
+CMD_INIT_ROLLUPS = """
+    CREATE TABLE IF NOT EXISTS donationsByDay(
+        date INT NOT NULL,
+        source TEXT NOT NULL,
+        type TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        count INT NOT NULL,
+        amount INT NOT NULL,
+        PRIMARY KEY(date, source, type, currency)
+    ) WITHOUT ROWID;"""
+ROLLUP_FIELDS = [
+    "date",
+    "source",
+    "type",
+    "currency",
+    "count",
+    "amount"
+]
+CMD_GET_ROLLUPS = f"SELECT {sqlNames(ROLLUP_FIELDS)} FROM donationsByDay WHERE date>=? AND date<=?"
+CMD_UPSERT_ROLLUP = f"""
+    INSERT INTO donationsByDay ({sqlNames(ROLLUP_FIELDS)}) VALUES ({sqlValues(ROLLUP_FIELDS)})
+    ON CONFLICT(date, source, type, currency) DO UPDATE SET count=count+excluded.count, amount=amount+excluded.amount"""
+CMD_DELETE_ROLLUPS = "DELETE FROM donationsByDay"
+CMD_FILL_ROLLUPS = f"""
+    INSERT INTO donationsByDay ({sqlNames(ROLLUP_FIELDS)})
+    SELECT date, source, type, currency, COUNT(*), SUM(amount) FROM donations GROUP BY date, source, type, currency"""
+
+CMD_INIT_DONORS = """
+    CREATE TABLE IF NOT EXISTS donors(
+        donor TEXT PRIMARY KEY,
+        firstDate INT NOT NULL,
+        lastDate INT NOT NULL,
+        count INT NOT NULL
+    ) WITHOUT ROWID;"""
+CMD_INIT_DONORTOTALS = """
+    CREATE TABLE IF NOT EXISTS donorTotals(
+        donor TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        amount INT NOT NULL,
+        PRIMARY KEY(donor, currency)
+    ) WITHOUT ROWID;"""
+# getDetailDonors, and the NEWDONOR qualifying query
+CMD_INIT_DONORS_INDEX = "CREATE INDEX IF NOT EXISTS donorsByFirstDate ON donors(firstDate, donor)"
+DONOR_FIELDS = [
+    "donor",
+    "firstDate",
+    "lastDate",
+    "count"
+]
+DONORTOTAL_FIELDS = [
+    "donor",
+    "currency",
+    "amount"
+]
+CMD_UPSERT_DONOR = f"""
+    INSERT INTO donors ({sqlNames(DONOR_FIELDS)}) VALUES ({sqlValues(DONOR_FIELDS)})
+    ON CONFLICT(donor) DO UPDATE SET
+        firstDate=MIN(firstDate, excluded.firstDate), lastDate=MAX(lastDate, excluded.lastDate), count=count+excluded.count"""
+CMD_UPSERT_DONORTOTAL = f"""
+    INSERT INTO donorTotals ({sqlNames(DONORTOTAL_FIELDS)}) VALUES ({sqlValues(DONORTOTAL_FIELDS)})
+    ON CONFLICT(donor, currency) DO UPDATE SET amount=amount+excluded.amount"""
+CMD_GET_DONORTOTALS = f"SELECT {sqlNames(DONORTOTAL_FIELDS)} FROM donorTotals"
+CMD_DELETE_DONORS = ["DELETE FROM donors", "DELETE FROM donorTotals"]
+CMD_FILL_DONORS = [
+    f"""INSERT INTO donors ({sqlNames(DONOR_FIELDS)})
+    SELECT donor, MIN(date), MAX(date), COUNT(*) FROM donations GROUP BY donor""",
+    f"""INSERT INTO donorTotals ({sqlNames(DONORTOTAL_FIELDS)})
+    SELECT donor, currency, SUM(amount) FROM donations GROUP BY donor, currency""",
+]
+
+# the newest donations rowid on each day, the watermark the qualifying donor cache is checked against
+CMD_INIT_DONATIONCHANGES = """
+    CREATE TABLE IF NOT EXISTS donationChanges(
+        date INT PRIMARY KEY,
+        generation INT NOT NULL
+    ) WITHOUT ROWID;"""
+CMD_FILL_DONATIONCHANGES = "INSERT INTO donationChanges (date, generation) SELECT date, MAX(rowid) FROM donations GROUP BY date"
+CMD_UPSERT_DONATIONCHANGE = """
+    INSERT INTO donationChanges (date, generation) VALUES (?,?)
+    ON CONFLICT(date) DO UPDATE SET generation=MAX(generation, excluded.generation)"""
+CMD_GET_GENERATION = "SELECT MAX(rowid) FROM donations"
+CMD_GET_WATERMARK = "SELECT COALESCE(MAX(generation), 0) FROM donationChanges WHERE date>=? AND date<=?"
+CMD_INIT_BENEFITDONORS = """
+    CREATE TABLE IF NOT EXISTS benefitDonors(
+        benefitId INT NOT NULL,
+        donor TEXT NOT NULL,
+        PRIMARY KEY(benefitId, donor)
+    ) WITHOUT ROWID;"""
+CMD_INIT_BENEFITWATERMARKS = """
+    CREATE TABLE IF NOT EXISTS benefitWatermarks(
+        benefitId INT PRIMARY KEY,
+        watermark INT NOT NULL
+    );"""
+CMD_GET_BENEFITWATERMARK = "SELECT watermark FROM benefitWatermarks WHERE benefitId=?"
+CMD_GET_BENEFITDONORS = "SELECT donor FROM benefitDonors WHERE benefitId=? ORDER BY donor"
+CMD_INSERT_BENEFITDONOR = "INSERT INTO benefitDonors (benefitId, donor) VALUES (?,?)"
+CMD_REPLACE_BENEFITWATERMARK = "INSERT OR REPLACE INTO benefitWatermarks (benefitId, watermark) VALUES (?,?)"
+CMD_DELETE_BENEFITDONORS = ["DELETE FROM benefitDonors WHERE benefitId=?", "DELETE FROM benefitWatermarks WHERE benefitId=?"]
+CMD_DELETE_ALL_BENEFITDONORS = ["DELETE FROM benefitDonors", "DELETE FROM benefitWatermarks"]
+
+CMD_INIT_SCHEMAVERSION = """
+    CREATE TABLE IF NOT EXISTS schemaVersion(
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied TEXT NOT NULL
+    );"""
+CMD_GET_SCHEMAVERSION = "SELECT MAX(version) FROM schemaVersion"
+CMD_INSERT_SCHEMAVERSION = "INSERT INTO schemaVersion (version, description, applied) VALUES (?,?,?)"
+CMD_HAS_TABLE = "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?"
+
+CMD_INIT_INDEXES = [
+    # getDonations
+    "CREATE INDEX IF NOT EXISTS donationsByDate ON donations(date)",
+    # getDonationKeys
+    "CREATE INDEX IF NOT EXISTS donationsBySourceDate ON donations(source, date, paymentId)",
+    # the AMOUNT and AMOUNTPERMONTH qualifying queries
+    "CREATE INDEX IF NOT EXISTS donationsByCurrencyDate ON donations(currency, date, donor, amount)",
+    # the NEWDONOR qualifying query
+    "CREATE INDEX IF NOT EXISTS donationsByDonorDate ON donations(donor, date, currency, amount)",
+    # getCurrentBenefits, getDeliveredBenefits and getPendingBenefits
+    "CREATE INDEX IF NOT EXISTS benefitsByCompletedEndDate ON benefits(completed, endDate)",
+]
+
+
+@dataclass(frozen=True)
+class Migration():
+    """
+    commands are sql, or functions called with the connection for changes sql cannot make alone
+    """
+    version: int
+    description: str
+    commands: List
+
+
+# julianday() of the day whose ordinal is 0, so sqlite's date functions can read an ordinal
+JULIANDAY_OFFSET = 1721424.5
+
+
+def ordinalSql(column):
+    """
+    a date stored as text, as its ordinal
+    """
+    return f"CASE WHEN typeof({column})='text' THEN CAST(julianday(date({column})) - {JULIANDAY_OFFSET} AS INTEGER) ELSE {column} END"
+
+
+def rebuildTable(connection, table, create, columns):
+    """
+    sqlite cannot change the type of a column, so the table is copied into one created with the new types.
+    columns are the sql expressions for each column of the new table.
+    rows are copied in rowid order, which keeps the order donations were inserted in, that a donor's first and last donations follow
+    """
+    connection.execute(create.replace(f" {table}(", f" {table}Rebuild("))
+    connection.execute(f"INSERT INTO {table}Rebuild SELECT {','.join(columns)} FROM {table} ORDER BY rowid")
+    connection.execute(f"DROP TABLE {table}")
+    connection.execute(f"ALTER TABLE {table}Rebuild RENAME TO {table}")
+
+
+def migrateOrdinalDates(connection):
+    """
+    dates were stored as iso text
+    """
+    rebuildTable(connection, "donations", CMD_INIT_DONATIONS,
+                 ["source", "paymentId", "donor", ordinalSql("date"), "type", "amount", "currency"])
+    rebuildTable(connection, "benefits", CMD_INIT_BENEFITS,
+                 ["id", "type", "reward", ordinalSql("startDate"), ordinalSql("endDate"), "delivery", "minAmount", "minAmountCurrency", "completed"])
+    rebuildTable(connection, "imports", CMD_INIT_IMPORTS,
+                 [ordinalSql(name) if name in ("firstDate", "lastDate") else name for name in IMPORT_FIELDS])
+
+
+def migrateMinorUnits(connection):
+    """
+    amounts were stored in major units, as floats
+    """
+    for table, amount, currency in [("donations", "amount", "currency"), ("benefits", "minAmount", "minAmountCurrency")]:
+        for (code,) in connection.execute(f"SELECT DISTINCT {currency} FROM {table} WHERE {currency} IS NOT NULL").fetchall():
+            scale = 10 ** minorExponent(Currency(code.upper()))
+            connection.execute(f"UPDATE {table} SET {amount}=CAST(ROUND({amount}*?) AS INTEGER) WHERE {currency}=?", (scale, code))
+
+
+MIGRATIONS = [
+    Migration(1, "indexes for the donation and benefit queries", CMD_INIT_INDEXES),
+    Migration(2, "import jobs and import ledger", [CMD_INIT_IMPORTJOBS, CMD_INIT_IMPORTS]),
+    Migration(3, "amounts in minor units", [migrateMinorUnits]),
+    Migration(4, "dates as ordinals", [migrateOrdinalDates] + CMD_INIT_INDEXES),
+    Migration(5, "daily rollups", [CMD_INIT_ROLLUPS, CMD_FILL_ROLLUPS]),
+    Migration(6, "donors", [CMD_INIT_DONORS, CMD_INIT_DONORTOTALS, CMD_INIT_DONORS_INDEX] + CMD_FILL_DONORS),
+    Migration(7, "qualifying donor cache", [CMD_INIT_DONATIONCHANGES, CMD_FILL_DONATIONCHANGES, CMD_INIT_BENEFITDONORS,
+                                            CMD_INIT_BENEFITWATERMARKS]),
+]
+
+
+def schemaVersion(connection):
+    connection.execute(CMD_INIT_SCHEMAVERSION)
+    return connection.execute(CMD_GET_SCHEMAVERSION).fetchone()[0] or 0
+
+
+def migrate(connection, migrations=MIGRATIONS):
+    """
+    applies each migration newer than the store's schema version in its own transaction.
+    the version is read again once the write lock is held, so two processes connecting at once
+    apply each migration only once
+    """
+    for migration in migrations:
+        if migration.version <= schemaVersion(connection):
+            continue
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if migration.version > (connection.execute(CMD_GET_SCHEMAVERSION).fetchone()[0] or 0):
+                for command in migration.commands:
+                    if callable(command):
+                        command(connection)
+                    else:
+                        connection.execute(command)
+                connection.execute(CMD_INSERT_SCHEMAVERSION, (migration.version, migration.description, toTimestamp(datetime.now())))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+
 CMD_GET_DONATIONS = f"SELECT {sqlNames(DONATION_FIELDS)} FROM donations WHERE date>=? AND date<=?"
 CMD_GET_DONATION = f"SELECT {sqlNames(DONATION_FIELDS)} FROM donations WHERE source = ? AND paymentId = ?"
 CMD_INSERT_DONATION = f"INSERT INTO donations ({sqlNames(DONATION_FIELDS)}) VALUES ({sqlValues(DONATION_FIELDS)});"
+CMD_GET_DONATION_KEYS = "SELECT paymentId FROM donations WHERE source = ? AND paymentId IN ({})"
+CMD_GET_DONATION_KEYS_BY_DATE = "SELECT paymentId FROM donations WHERE source = ? AND date>=? AND date<=?"
+
+# keeps the IN (...) lookup below SQLITE_MAX_VARIABLE_NUMBER on old sqlite builds
+KEY_LOOKUP_BATCHSIZE = 500
+FETCH_BATCHSIZE = 1000
+DECODE_BATCHSIZE = 64
 
 
 def getQualifyingQuery(benefit):
-    minAmount = benefit.minAmount.amount
+    minAmount = benefit.minAmount.minor
     minAmountCurrency = benefit.minAmount.currency.name
     if benefit.type == BenefitType.AMOUNT:
         cmd = """
@@ -87,20 +436,20 @@ def getQualifyingQuery(benefit):
             ORDER BY donor
             """
         args = (
-            benefit.startDate,
-            benefit.endDate,
+            encodeDate(benefit.startDate),
+            encodeDate(benefit.endDate),
             minAmountCurrency,
             minAmount
             )
     elif benefit.type == BenefitType.AMOUNTPERMONTH:
         startDate = rndDate(benefit.startDate, "month", "down")
         endDate = rndDate(benefit.endDate, "month", "up")
-        cmd = """
+        cmd = f"""
 SELECT
     donor
 FROM (
     SELECT
-        donor, STRFTIME('%Y-%m', date) AS month ,SUM(amount) AS monthTotal
+        donor, STRFTIME('%Y-%m', date + {JULIANDAY_OFFSET}) AS month ,SUM(amount) AS monthTotal
     FROM donations
     WHERE date>=? AND date<=? AND currency=?
     GROUP BY donor,month
@@ -110,31 +459,31 @@ GROUP BY donor
 HAVING COUNT(1) >=?
 """
         args = (
-            startDate,
-            endDate,
+            encodeDate(startDate),
+            encodeDate(endDate),
             minAmountCurrency,
             minAmount,
             months(startDate, endDate)
             )
 
     elif benefit.type == BenefitType.NEWDONOR:
+        # donors whose first donation falls in the benefit, and who gave more than minAmount in it
         cmd = """
-SELECT
-    donor
-FROM (
-    SELECT donor,date
-        FROM donations
-    WHERE currency=? AND amount>?
-    GROUP BY donor
-    ORDER BY date
+SELECT donor
+FROM donors
+WHERE firstDate>=? AND firstDate<=? AND EXISTS (
+    SELECT 1 FROM donations
+    WHERE donations.donor=donors.donor AND date>=? AND date<=? AND currency=? AND amount>?
 )
-WHERE date>=? and date <=?
+ORDER BY donor
 """
         args = (
+            encodeDate(benefit.startDate),
+            encodeDate(benefit.endDate),
+            encodeDate(benefit.startDate),
+            encodeDate(benefit.endDate),
             minAmountCurrency,
-            minAmount,
-            benefit.startDate,
-            benefit.endDate
+            minAmount
             )
 
     else:
@@ -142,40 +491,129 @@ WHERE date>=? and date <=?
     return (cmd, args)
 
 
+# the per donor, per day aggregate every benefit in a currency is evaluated from
+CMD_GET_DONOR_DAYS = """
+    SELECT donor, date, SUM(amount), MAX(amount) FROM donations
+    WHERE currency=? AND date>=? AND date<=?
+    GROUP BY donor, date
+    ORDER BY donor"""
+CMD_GET_FIRSTDATES = "SELECT donor, firstDate FROM donors WHERE firstDate>=? AND firstDate<=?"
+
+
+CMD_GET_DETAIL_DONORS = f"SELECT {sqlNames(DONOR_FIELDS)} FROM donors ORDER BY firstDate, donor"
+
+
 def isTrue(dbValue: int):
     return dbValue != 0
 
 
+def encodeDate(value):
+    """
+    a date, or the day of a datetime, as its ordinal
+    """
+    return None if value is None else value.toordinal()
+
+
 def parseDate(dbValue):
-    try:
-        d = datetime.strptime(dbValue, '%Y-%m-%d')
-        return date(d.year, d.month, d.day)
-    except:  # noqa: E722
-        return None
+    return None if dbValue is None else dateFromOrdinal(dbValue)
+
+
+def donationToRow(donation):
+    return (
+        donation.source.name,
+        donation.paymentId,
+        donation.donor,
+        donation.paymentDate.toordinal(),
+        donation.type.name,
+        donation.money.minor,
+        donation.money.currency.name
+    )
+
+
+def rollupRows(donations):
+    """
+    the change each donation makes to its day's rollup, summed so each rollup is written once
+    """
+    rollups = {}
+    for donation in donations:
+        key = (donation.paymentDate.toordinal(), donation.source.name, donation.type.name, donation.money.currency.name)
+        count, amount = rollups.get(key, (0, 0))
+        rollups[key] = (count + 1, amount + donation.money.minor)
+    return [key + value for key, value in rollups.items()]
 
 
-def donorDetailFromRow(row):
+def rollupFromRow(row):
+    return DonationRollup(
+        paymentDate=parseDate(row[0]),
+        source=PAYMENTPROVIDERS[row[1]],
+        type=DONATIONTYPES[row[2]],
+        money=Money.fromMinor(row[5], currencyFromName(row[3])),
+        count=row[4]
+    )
+
+
+def benefitToRow(benefit):
+    row = tuple(benefit)
+    return row[:2] + (encodeDate(row[2]), encodeDate(row[3])) + row[4:]
+
+
+def donorRows(donations):
+    """
+    the change each donation makes to its donor and the donor's totals, summed so each is written once
+    """
+    donors = {}
+    totals = {}
+    for donation in donations:
+        ordinal = donation.paymentDate.toordinal()
+        firstDate, lastDate, count = donors.get(donation.donor, (ordinal, ordinal, 0))
+        donors[donation.donor] = (min(firstDate, ordinal), max(lastDate, ordinal), count + 1)
+        key = (donation.donor, donation.money.currency.name)
+        totals[key] = totals.get(key, 0) + donation.money.minor
+    return ([(donor,) + value for donor, value in donors.items()],
+            [key + (amount,) for key, amount in totals.items()])
+
+
+def donorDetailFromRow(row, monies=()):
     return DonorDetail(
         donor=row[0],
         firstPaymentDate=parseDate(row[1]),
-        lastPaymentDate=parseDate(row[2])
+        lastPaymentDate=parseDate(row[2]),
+        count=row[3],
+        total=Total(monies, row[3])
     )
 
 
+# lookup tables for decoding rows, by the names the store writes
+PAYMENTPROVIDERS = {provider.name: provider for provider in PaymentProvider}
+DONATIONTYPES = {donationType.name: donationType for donationType in DonationType}
+CURRENCIES = {currency.name: currency for currency in Currency}
+
+
+def currencyFromName(name):
+    try:
+        return CURRENCIES[name]
+    except KeyError:
+        return Currency(name.upper())
+
+
 def donationFromRow(row):
-    return Donation(
-        source=PaymentProvider[row[0]],
-        paymentId=row[1],
-        donor=row[2],
-        paymentDate=parseDate(row[3]),
-        type=DonationType[row[4]],
-        money=Money(amount=row[5], currency=Currency(row[6].upper()))
+    """
+    rows were validated as they were stored, so they are decoded through the lookup tables without validating again
+    """
+    return Donation.trusted(
+        PAYMENTPROVIDERS[row[0]],
+        row[1],
+        row[2],
+        parseDate(row[3]),
+        DONATIONTYPES[row[4]],
+        Money.fromMinor(row[5], currencyFromName(row[6]))
     )
 
 
 def benefitFromRow(row):
     try:
-        minAmount = Money(row[6], Currency[row[7]])
+        # minAmount had REAL affinity in older stores, so whole numbers come back as floats
+        minAmount = Money.fromMinor(int(row[6]), Currency[row[7]])
     except:  # noqa: E722
         minAmount = None
     if row[8] == 1:
@@ -194,43 +632,236 @@ def benefitFromRow(row):
     )
 
 
+def parseTimestamp(dbValue):
+    if dbValue is None:
+        return None
+    return datetime.fromisoformat(dbValue)
+
+
+def toTimestamp(value):
+    if value is None:
+        return None
+    return value.isoformat()
+
+
+def importJobFromRow(row):
+    return ImportJob(
+        storeId=str(row[0]),
+        filename=row[1],
+        paymentProvider=PaymentProvider[row[2]] if row[2] else None,
+        status=ImportJobStatus[row[3]],
+        parsed=row[4],
+        added=row[5],
+        dupes=row[6],
+        badRows=row[7],
+        started=parseTimestamp(row[8]),
+        finished=parseTimestamp(row[9]),
+        error=row[10],
+        files=json.loads(row[11])
+    )
+
+
+def importJobToRow(job):
+    return (
+        job.filename,
+        job.paymentProvider.name if job.paymentProvider else None,
+        job.status.name,
+        job.parsed,
+        job.added,
+        job.dupes,
+        job.badRows,
+        toTimestamp(job.started),
+        toTimestamp(job.finished),
+        job.error,
+        json.dumps(job.files)
+    )
+
+
+def ledgerEntryFromRow(row):
+    return ImportLedgerEntry(
+        sha256=row[0],
+        filename=row[1],
+        paymentProvider=PaymentProvider[row[2]],
+        rows=row[3],
+        added=row[4],
+        dupes=row[5],
+        badRows=row[6],
+        firstDate=parseDate(row[7]),
+        lastDate=parseDate(row[8]),
+        imported=parseTimestamp(row[9])
+    )
+
+
+def ledgerEntryToRow(entry):
+    return (
+        entry.sha256,
+        entry.filename,
+        entry.paymentProvider.name,
+        entry.rows,
+        entry.added,
+        entry.dupes,
+        entry.badRows,
+        encodeDate(entry.firstDate),
+        encodeDate(entry.lastDate),
+        toTimestamp(entry.imported)
+    )
+
+
+def connect(config, mode):
+    """
+    in WAL mode readers see the last commit while an import is writing, rather than waiting for it
+    """
+    connection = sqlite.connect(database=f"file:{config.connnectionString}?mode={mode}", uri=True, check_same_thread=False,
+                                timeout=config.busyTimeout / 1000, factory=InstrumentedConnection)
+    connection.slowQuerySeconds = config.slowQuerySeconds
+    connection.execute(f"PRAGMA journal_mode={config.journalMode}")
+    connection.execute(f"PRAGMA synchronous={config.synchronous}")
+    connection.execute(f"PRAGMA cache_size={int(config.cacheSize)}")
+    connection.execute(f"PRAGMA mmap_size={int(config.mmapSize)}")
+    connection.execute(f"PRAGMA busy_timeout={int(config.busyTimeout)}")
+    return connection
+
+
+@instrumented
 class StoreSqlLite(Store):
     def type(self):
         return StoreType.Sqllite
 
-    def __init__(self, config: StoreConfig) -> None:
-        connectionString = config.connnectionString
+    def __init__(self, config: StoreConfig, metrics=None) -> None:
+        self._metrics = metrics or storeMetrics
         try:
-            self._connection = sqlite.connect(database=f"file:{connectionString}?mode=rw", uri=True, check_same_thread=False)
+            self._connection = connect(config, "rw")
         except OperationalError:
-            self._connection = sqlite.connect(database=f"file:{connectionString}?mode=rwc", uri=True, check_same_thread=False)
+            self._connection = connect(config, "rwc")
             self.setupStore()
+        # a store that has been set up is brought up to the current schema
+        if self._connection.execute(CMD_HAS_TABLE, ("donations",)).fetchone():
+            migrate(self._connection)
+
+    @property
+    def schemaVersion(self):
+        return schemaVersion(self._connection)
 
     def insertDonation(self, donation) -> None:
+        cursor = self._connection.cursor()
         try:
-            self._connection.cursor().execute(CMD_INSERT_DONATION, tuple(donation))
+            cursor.execute(CMD_INSERT_DONATION, donationToRow(donation))
+            self._afterInsert(cursor, [donation])
             self._connection.commit()
         except sqlite.IntegrityError as error:
+            self._connection.rollback()
             raise StoreDuplicate(inner=error)
+        except Exception:
+            self._connection.rollback()
+            raise
+
+    def _afterInsert(self, cursor, donations):
+        """
+        keeps the tables derived from donations up to date, in the transaction that inserted them
+        """
+        cursor.executemany(CMD_UPSERT_ROLLUP, rollupRows(donations))
+        donors, totals = donorRows(donations)
+        cursor.executemany(CMD_UPSERT_DONOR, donors)
+        cursor.executemany(CMD_UPSERT_DONORTOTAL, totals)
+        if donations:
+            generation = cursor.execute(CMD_GET_GENERATION).fetchone()[0]
+            dates = {donation.paymentDate.toordinal() for donation in donations}
+            cursor.executemany(CMD_UPSERT_DONATIONCHANGE, [(day, generation) for day in dates])
+
+    def insertDonations(self, donations, chunkSize=None):
+        """
+        chunkSize is the number of rows per transaction, None writes everything in one transaction
+        """
+        added = []
+        dupes = []
+        uncommitted = 0
+        cursor = self._connection.cursor()
+        try:
+            for batch in batches(donations, KEY_LOOKUP_BATCHSIZE):
+                new = self._removeDuplicates(cursor, batch, dupes)
+                cursor.executemany(CMD_INSERT_DONATION, [donationToRow(donation) for donation in new])
+                self._afterInsert(cursor, new)
+                added += new
+                uncommitted += len(batch)
+                if chunkSize and uncommitted >= chunkSize:
+                    self._connection.commit()
+                    uncommitted = 0
+            self._connection.commit()
+        except Exception:
+            self._connection.rollback()
+            raise
+        return added, dupes
+
+    def _removeDuplicates(self, cursor, batch, dupes):
+        existing = set()
+        for source in {donation.source for donation in batch}:
+            paymentIds = [donation.paymentId for donation in batch if donation.source == source]
+            cmd = CMD_GET_DONATION_KEYS.format(sqlValues(paymentIds))
+            existing.update((source, row[0]) for row in cursor.execute(cmd, (source.name, *paymentIds)))
+
+        new = []
+        for donation in batch:
+            key = (donation.source, donation.paymentId)
+            if key in existing:
+                dupes.append(donation)
+            else:
+                existing.add(key)
+                new.append(donation)
+        return new
+
+    def getDonationKeys(self, source, startDate, endDate):
+        rows = self._connection.cursor().execute(CMD_GET_DONATION_KEYS_BY_DATE, (source.name, encodeDate(startDate), encodeDate(endDate)))
+        return {row[0] for row in rows}
 
     def getDonations(self, startDate, endDate):
+        return list(self.iterDonations(startDate, endDate))
+
+    def iterDonations(self, startDate, endDate, batchSize=FETCH_BATCHSIZE):
+        if startDate > endDate:
+            raise ValueError("startdate gt enddate")
+        cursor = self._connection.cursor()
+        cursor.execute(CMD_GET_DONATIONS, (encodeDate(startDate), encodeDate(endDate)))
+        return decodeBatches(cursor, batchSize, donationFromRow)
+
+    def getRollups(self, startDate, endDate):
         if startDate > endDate:
             raise ValueError("startdate gt enddate")
-        rows = self._connection.cursor().execute(CMD_GET_DONATIONS, (startDate, endDate)).fetchall()
-        return [donationFromRow(row) for row in rows]
+        cursor = self._connection.cursor()
+        cursor.execute(CMD_GET_ROLLUPS, (encodeDate(startDate), encodeDate(endDate)))
+        return decodeBatches(cursor, FETCH_BATCHSIZE, rollupFromRow)
+
+    def rebuildRollups(self):
+        try:
+            self._connection.execute(CMD_DELETE_ROLLUPS)
+            self._connection.execute(CMD_FILL_ROLLUPS)
+            for cmd in CMD_DELETE_ALL_BENEFITDONORS:
+                self._connection.execute(cmd)
+            self._connection.commit()
+        except Exception:
+            self._connection.rollback()
+            raise
+
+    def rebuildDonors(self):
+        try:
+            for cmd in CMD_DELETE_DONORS + CMD_FILL_DONORS + CMD_DELETE_ALL_BENEFITDONORS:
+                self._connection.execute(cmd)
+            self._connection.commit()
+        except Exception:
+            self._connection.rollback()
+            raise
 
     def getDonation(self, source: PaymentProvider, paymentId):
         rows = self._connection.cursor().execute(CMD_GET_DONATION, (source.name, paymentId)).fetchall()
         count = len(rows)
         if count == 1:
-            return donationFromRow(rows[0])
+            return decodeRows(rows, donationFromRow)[0]
         elif count == 0:
             raise StoreNotFound(source=source, paymentId=paymentId)
         else:
             raise StoreDuplicate()
 
     def addBenefit(self, benefit) -> Benefit:
-        t = tuple(benefit)
+        t = benefitToRow(benefit)
         try:
             id = self._connection.cursor().execute(CMD_INSERT_BENEFIT, t).lastrowid
             benefit.setStoreId(str(id))
@@ -245,69 +876,178 @@ class StoreSqlLite(Store):
         return datetime(now.year, now.month, now.day, 23, 59, 59, 999999)
 
     def getCurrentBenefits(self):
-        args = self.endToday,
-        rows = self._connection.cursor().execute("SELECT * FROM benefits WHERE completed=0 AND endDate>=?", args).fetchall()
-        return [benefitFromRow(row) for row in rows]
+        args = encodeDate(self.endToday),
+        rows = self._connection.cursor().execute(CMD_GET_CURRENT_BENEFITS, args).fetchall()
+        return decodeRows(rows, benefitFromRow)
 
     def getDeliveredBenefits(self):
-        rows = self._connection.cursor().execute("SELECT * FROM benefits WHERE completed=1").fetchall()
-        return [benefitFromRow(row) for row in rows]
+        rows = self._connection.cursor().execute(CMD_GET_DELIVERED_BENEFITS).fetchall()
+        return decodeRows(rows, benefitFromRow)
 
     def getPendingBenefits(self):
-        args = self.endToday,
-        rows = self._connection.cursor().execute("SELECT * FROM benefits WHERE completed=0 AND endDate<?", args).fetchall()
-        return [benefitFromRow(row) for row in rows]
+        args = encodeDate(self.endToday),
+        rows = self._connection.cursor().execute(CMD_GET_PENDING_BENEFITS, args).fetchall()
+        return decodeRows(rows, benefitFromRow)
 
     def getBenefit(self, storeId) -> List[Benefit]:
         id = int(storeId)
-        return benefitFromRow(self._connection.cursor().execute(CMD_GET_BENEFIT, (id,)).fetchone())
+        return decodeRows(self._connection.cursor().execute(CMD_GET_BENEFIT, (id,)).fetchall(), benefitFromRow)[0]
 
     def updateBenefit(self, benefit) -> None:
-        t = tuple(benefit) + (int(benefit._storeId),)
+        t = benefitToRow(benefit) + (int(benefit._storeId),)
+        cursor = self._connection.cursor()
         try:
-            self._connection.cursor().execute(CMD_UPDATE_BENEFIT, t)
+            cursor.execute(CMD_UPDATE_BENEFIT, t)
+            self._forgetQualifyingDonors(cursor, benefit._storeId)
             self._connection.commit()
             return benefit
         except sqlite.IntegrityError as error:
+            self._connection.rollback()
             raise StoreDuplicate(inner=error)
 
     def deleteBenefit(self, storeId) -> None:
-        self._connection.cursor().execute(CMD_DELETE_BENEFIT, (storeId))
-        self._connection.commit()
+        cursor = self._connection.cursor()
+        cursor.execute(CMD_DELETE_BENEFIT, (int(storeId),))
+        self._forgetQualifyingDonors(cursor, storeId)
         self._connection.commit()
 
+    def _forgetQualifyingDonors(self, cursor, storeId):
+        for cmd in CMD_DELETE_BENEFITDONORS:
+            cursor.execute(cmd, (int(storeId),))
+
     def getQualifyingDonors(self, benefit) -> List[Donor]:
+        """
+        the donors of a stored benefit are kept, with the newest generation of donations in its window when they were found,
+        and found again only once a newer donation arrives in the window or the benefit is updated
+        """
+        if benefit._storeId is None:
+            return self._findQualifyingDonors(benefit)
+        cursor = self._connection.cursor()
+        donors, watermark = self._cachedQualifyingDonors(cursor, benefit)
+        if donors is None:
+            donors = self._findQualifyingDonors(benefit)
+            self._cacheQualifyingDonors(cursor, [(benefit, watermark, donors)])
+        return donors
+
+    def _cachedQualifyingDonors(self, cursor, benefit):
+        """
+        the cached donors of benefit, or None if there are none or newer donations have arrived in its window,
+        and the watermark to cache them with if they are found again
+        """
+        benefitId = int(benefit._storeId)
+        watermark = cursor.execute(CMD_GET_WATERMARK, qualifyingWindow(benefit)).fetchone()[0]
+        row = cursor.execute(CMD_GET_BENEFITWATERMARK, (benefitId,)).fetchone()
+        if row is not None and row[0] >= watermark:
+            return [row[0] for row in cursor.execute(CMD_GET_BENEFITDONORS, (benefitId,))], watermark
+        return None, watermark
+
+    def _cacheQualifyingDonors(self, cursor, found):
+        try:
+            for benefit, watermark, donors in found:
+                benefitId = int(benefit._storeId)
+                self._forgetQualifyingDonors(cursor, benefitId)
+                cursor.executemany(CMD_INSERT_BENEFITDONOR, [(benefitId, donor) for donor in donors])
+                cursor.execute(CMD_REPLACE_BENEFITWATERMARK, (benefitId, watermark))
+            self._connection.commit()
+        except Exception:
+            self._connection.rollback()
+            raise
+
+    def evaluateBenefits(self, benefits) -> Dict[str, List[Donor]]:
+        """
+        benefits whose cached donors are still good are answered from the cache, and the rest from one read of the
+        donations in each currency and group of overlapping windows
+        """
+        cursor = self._connection.cursor()
+        result = {}
+        stale = []
+        for benefit in benefits:
+            if benefit._storeId is None:
+                continue
+            donors, watermark = self._cachedQualifyingDonors(cursor, benefit)
+            if donors is None:
+                stale.append((benefit, watermark))
+            else:
+                result[benefit._storeId] = donors
+
+        for currency, start, end, group in overlappingGroups([benefit for benefit, _ in stale]):
+            evaluators = [BenefitEvaluator(benefit) for benefit in group]
+            firstDates = {}
+            if any(benefit.type == BenefitType.NEWDONOR for benefit in group):
+                firstDates = dict(cursor.execute(CMD_GET_FIRSTDATES, (start, end)).fetchall())
+            days = self._connection.cursor().execute(CMD_GET_DONOR_DAYS, (currency, start, end))
+            for donor, rows in groupby(fetchBatches(days, FETCH_BATCHSIZE), key=lambda row: row[0]):
+                donorDays = [row[1:] for row in rows]
+                for evaluator in evaluators:
+                    evaluator.evaluate(donor, donorDays, firstDates)
+            for evaluator in evaluators:
+                result[evaluator.benefit._storeId] = evaluator.donors
+
+        self._cacheQualifyingDonors(cursor, [(benefit, watermark, result[benefit._storeId]) for benefit, watermark in stale])
+        return result
+
+    def _findQualifyingDonors(self, benefit):
         cmd, args = getQualifyingQuery(benefit)
         rows = self._connection.cursor().execute(cmd, args).fetchall()
         return [row[0] for row in rows]
 
     def getDetailDonors(self) -> List[DonorDetail]:
-        cmd = """
-SELECT first.donor, firstDate, lastDate
-FROM (
-    SELECT donor,date as firstDate
-    FROM donations
-    GROUP BY DONOR
-    HAVING MIN(ROWID)
-    ORDER BY date
-) first
-JOIN (
-    SELECT donor,date as lastDate
-    FROM donations
-    GROUP BY DONOR
-    HAVING MAX(ROWID)
-    ORDER BY date
-) last
-ON first.donor=last.donor
-"""
-        rows = self._connection.cursor().execute(cmd).fetchall()
-        return [donorDetailFromRow(row) for row in rows]
+        monies = {}
+        totals = self._connection.execute(CMD_GET_DONORTOTALS).fetchall()
+        started = time.perf_counter()
+        for donor, currency, amount in totals:
+            monies.setdefault(donor, []).append(Money.fromMinor(amount, currencyFromName(currency)))
+        addDecodeTime(currentCall(), time.perf_counter() - started)
+        rows = self._connection.cursor().execute(CMD_GET_DETAIL_DONORS).fetchall()
+        return decodeRows(rows, lambda row: donorDetailFromRow(row, monies.get(row[0], ())))
+
+    def addImportJob(self, job) -> ImportJob:
+        id = self._connection.cursor().execute(CMD_INSERT_IMPORTJOB, importJobToRow(job)).lastrowid
+        self._connection.commit()
+        job.storeId = str(id)
+        return job
+
+    def updateImportJob(self, job) -> None:
+        self._connection.cursor().execute(CMD_UPDATE_IMPORTJOB, importJobToRow(job) + (int(job.storeId),))
+        self._connection.commit()
+
+    def getImportJob(self, storeId) -> ImportJob:
+        row = self._connection.cursor().execute(CMD_GET_IMPORTJOB, (int(storeId),)).fetchone()
+        if row is None:
+            raise StoreNotFound(storeId=storeId)
+        return decodeRows((row,), importJobFromRow)[0]
+
+    def getUnfinishedImportJobs(self) -> List[ImportJob]:
+        args = (ImportJobStatus.QUEUED.name, ImportJobStatus.RUNNING.name)
+        return decodeRows(self._connection.cursor().execute(CMD_GET_UNFINISHED_IMPORTJOBS, args).fetchall(), importJobFromRow)
+
+    def addLedgerEntry(self, entry) -> None:
+        try:
+            self._connection.cursor().execute(CMD_INSERT_IMPORT, ledgerEntryToRow(entry))
+            self._connection.commit()
+        except sqlite.IntegrityError as error:
+            self._connection.rollback()
+            # sha256 is the only key, any other constraint failing is an error in the entry
+            if str(error).startswith("UNIQUE constraint failed"):
+                raise StoreDuplicate(inner=error)
+            raise
+
+    def getLedgerEntry(self, sha256) -> ImportLedgerEntry:
+        row = self._connection.cursor().execute(CMD_GET_IMPORT, (sha256,)).fetchone()
+        if row is None:
+            raise StoreNotFound(sha256=sha256)
+        return decodeRows((row,), ledgerEntryFromRow)[0]
 
     def setupStore(self):
         cursor = self._connection.cursor()
         cursor.execute(CMD_INIT_BENEFITS)
         cursor.execute(CMD_INIT_DONATIONS)
         self._connection.commit()
+        migrate(self._connection)
+
+    def reset(self):
+        if self._connection.in_transaction:
+            self._connection.rollback()
 
     def close(self):
         self._connection.close()
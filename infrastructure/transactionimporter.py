@@ -1,10 +1,11 @@
-import sys
-from datetime import datetime
+from collections import Counter
+from datetime import date, datetime
 from abc import ABC, abstractmethod
 from typing import Dict
 from dataclasses import dataclass
 from email.utils import parseaddr
-from domain import PaymentProvider, Donation, DonationType, Money
+from operator import itemgetter
+from domain import PaymentProvider, Donation, DonationType, Money, getCurrencyFromString
 import csv
 
 
@@ -12,10 +13,86 @@ def isEmail(s):
     return '@' in parseaddr(s)[1]
 
 
+def parseDayMonthYear(s):
+    """
+    dd/mm/yyyy, anything else goes through strptime
+    """
+    if len(s) == 10 and s[2] == '/' and s[5] == '/':
+        return date(int(s[6:10]), int(s[3:5]), int(s[0:2]))
+    return datetime.strptime(s, '%d/%m/%Y').date()
+
+
+def parseDayMonthYearTime(s):
+    """
+    dd/mm/yyyy hh:mm, anything else goes through strptime
+    """
+    if len(s) == 16 and s[2] == '/' and s[5] == '/' and s[10] == ' ' and s[13] == ':' and int(s[11:13]) < 24 and int(s[14:16]) < 60:
+        return date(int(s[6:10]), int(s[3:5]), int(s[0:2]))
+    return datetime.strptime(s, '%d/%m/%Y %H:%M').date()
+
+
+def moneyFromColumns(currency, amount):
+    return Money(amount, getCurrencyFromString(currency.upper()))
+
+
+BADROW_LIMIT = 10000
+# the reason a row is rejected when some of its bytes did not decode
+UNDECODABLE = "UnicodeDecodeError"
+
+
 class FilteredRow(Exception):
     pass
 
 
+def rejectReason(exception):
+    if isinstance(exception, FilteredRow):
+        return f"filtered: {exception}"
+    return type(exception).__name__
+
+
+class BadRows():
+    """
+    the rows an importer rejected, counted by reason.
+    with a path, the first limit rows are written there as a csv of line, reason and the original columns,
+    so the rows themselves are never held in memory.
+    closed once the importer is exhausted, it can then be pickled
+    """
+    def __init__(self, fieldnames, path=None, limit=BADROW_LIMIT):
+        self.path = path
+        self.limit = limit
+        self.count = 0
+        self.written = 0
+        self.reasons = Counter()
+        self._fieldnames = fieldnames
+        self._file = None
+        self._writer = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, lineNumber, reason, row):
+        self.count += 1
+        self.reasons[reason] += 1
+        if self.path is None or self.written >= self.limit:
+            return
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["line", "reason"] + self._fieldnames)
+        self._writer.writerow([lineNumber, reason] + row)
+        self.written += 1
+
+    @property
+    def truncated(self):
+        return self.count > self.written
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._writer = None
+
+
 @dataclass(frozen=True)
 class CsvConfig():
     delimiter: str
@@ -27,14 +104,22 @@ class CsvConfig():
     skipinitialspace: bool
 
 
+def missingColumn(name):
+    def getter(row):
+        raise KeyError(name)
+    return getter
+
+
 class TransactionImporter(ABC):
     CSVCONFIG: CsvConfig
+    HEADER: str
 
-    def __init__(self, csvfile):
+    def __init__(self, csvfile, rejectsPath=None):
         """
         open file handle with newline='
+        rejected rows are written to rejectsPath when it is given
         """
-        self._reader = csv.DictReader(
+        self._reader = csv.reader(
             csvfile,
             delimiter=self.CSVCONFIG.delimiter,
             doublequote=self.CSVCONFIG.doublequote,
@@ -44,20 +129,62 @@ class TransactionImporter(ABC):
             quoting=self.CSVCONFIG.quoting,
             skipinitialspace=self.CSVCONFIG.skipinitialspace,
         )
-        self.badRows = []
+        self._fieldnames = next(self._reader, [])
+        # as with DictReader, a repeated column name resolves to its last occurrence
+        self._columns = {name: index for index, name in enumerate(self._fieldnames)}
+        self._compile()
+        self.badRows = BadRows(self._fieldnames, rejectsPath)
+        # the lines a DecodingReader could not decode, their rows are rejected
+        self._undecodableLines = getattr(csvfile, "undecodableLines", None)
+        self._lineNumber = self._reader.line_num
+
+    def _column(self, name):
+        """
+        accessor for a column of a csv.reader row, resolved once from the header
+        """
+        try:
+            return itemgetter(self._columns[name])
+        except KeyError:
+            return missingColumn(name)
+
+    @classmethod
+    def matchesHeader(cls, header):
+        """
+        true if a csv header line has every column of this provider's export
+        """
+        columns = next(csv.reader([header.strip()], delimiter=cls.CSVCONFIG.delimiter, quotechar=cls.CSVCONFIG.quotechar), [])
+        expected = next(csv.reader([cls.HEADER.strip()], delimiter=cls.CSVCONFIG.delimiter, quotechar=cls.CSVCONFIG.quotechar))
+        return set(expected) <= set(columns)
 
     def __iter__(self):
         return self
 
     def __next__(self):
         while True:
-            row = self._reader.__next__()
+            try:
+                row = self._reader.__next__()
+            except StopIteration as e:
+                self.badRows.close()
+                raise e
+            if not row:
+                continue
+            firstLine, self._lineNumber = self._lineNumber + 1, self._reader.line_num
+            if self._undecodableLines and not self._undecodableLines.isdisjoint(range(firstLine, self._lineNumber + 1)):
+                self.badRows.add(self._lineNumber, UNDECODABLE, row)
+                continue
             try:
                 return self.parser(self._filter(row))
             except StopIteration as e:
                 raise e
-            except Exception:
-                self.badRows.append((self._reader.line_num, sys.exc_info()[0], row))
+            except Exception as e:
+                self.badRows.add(self._reader.line_num, rejectReason(e), row)
+
+    @abstractmethod
+    def _compile(self):
+        """
+        create the column accessors used by parser and _filter
+        """
+        pass
 
     @abstractmethod
     def parser(self, row):
@@ -81,18 +208,25 @@ class GocardlessTransactionImporter (TransactionImporter):
         skipinitialspace=False,
     )
 
+    def _compile(self):
+        self._id = self._column("id")
+        self._email = self._column("customers.email")
+        self._chargeDate = self._column("charge_date")
+        self._currency = self._column("currency")
+        self._amount = self._column("amount")
+
     def parser(self, row):
         return Donation(
             source=self.SOURCE,
-            paymentId=row["id"],
-            donor=row["customers.email"],
-            paymentDate=datetime.strptime(row["charge_date"], '%d/%m/%Y').date(),
+            paymentId=self._id(row),
+            donor=self._email(row),
+            paymentDate=parseDayMonthYear(self._chargeDate(row)),
             type=DonationType.MONTHLY,
-            money=Money.fromString(row["currency"]+row["amount"])
+            money=moneyFromColumns(self._currency(row), self._amount(row))
         )
 
     def _filter(self, row):
-        if float(row["amount"]) <= 0:
+        if float(self._amount(row)) <= 0:
             raise FilteredRow('gross le 0')
         return row
 
@@ -115,20 +249,29 @@ class PaypalTransactionImporter (TransactionImporter):
         "Subscription Payment": DonationType.MONTHLY,
     }
 
+    def _compile(self):
+        self._transactionId = self._column("Transaction ID")
+        self._email = self._column("From Email Address")
+        self._date = self._column("Date")
+        self._type = self._column("Type")
+        self._currency = self._column("Currency")
+        self._gross = self._column("Gross")
+        self._status = self._column("Status")
+
     def parser(self, row) -> Donation:
         return Donation(
             source=self.SOURCE,
-            paymentId=row["Transaction ID"],
-            donor=row["From Email Address"],
-            paymentDate=datetime.strptime(row["Date"], '%d/%m/%Y').date(),
-            type=self.DONATIONTYPES[row["Type"]],
-            money=Money.fromString(row["Currency"]+row["Gross"])
+            paymentId=self._transactionId(row),
+            donor=self._email(row),
+            paymentDate=parseDayMonthYear(self._date(row)),
+            type=self.DONATIONTYPES[self._type(row)],
+            money=moneyFromColumns(self._currency(row), self._gross(row))
         )
 
     def _filter(self, row):
-        if float(row["Gross"]) <= 0:
+        if float(self._gross(row)) <= 0:
             raise FilteredRow('gross le 0')
-        if row["Status"] != 'Completed':
+        if self._status(row) != 'Completed':
             raise FilteredRow('not completed status')
         return row
 
@@ -146,34 +289,67 @@ class StripeTransactionImporter (TransactionImporter):
         skipinitialspace=False,
     )
 
-    def __init__(self, csvfile):
-        super().__init__(csvfile)
+    def __init__(self, csvfile, rejectsPath=None):
+        super().__init__(csvfile, rejectsPath)
+
+    def _compile(self):
+        self._id = self._column("id")
+        self._description = self._column("Description")
+        self._created = self._column("Created (UTC)")
+        self._amount = self._column("Amount")
+        self._currency = self._column("Currency")
+        self._status = self._column("Status")
+        self._customerEmail = self._column("Customer Email")
+        self._cardName = self._column("Card Name")
 
     def _getDonationType(self, row):
-        if row["Description"][:19].lower().strip() == "payment for invoice":
+        if self._description(row)[:19].lower().strip() == "payment for invoice":
             return DonationType.MONTHLY
         return DonationType.ONEOFF
 
     def _filter(self, row):
-        if float(row["Amount"]) <= 0:
+        if float(self._amount(row)) <= 0:
             raise FilteredRow('gross le 0')
-        if row["Status"].lower().strip() != "paid":
+        if self._status(row).lower().strip() != "paid":
             raise FilteredRow('not paid')
         return row
 
     def _getEmail(self, row):
-        if isEmail(row["Customer Email"]):
-            return row["Customer Email"]
-        if isEmail(row["Card Name"]):
-            return row["Card Name"]
+        customerEmail = self._customerEmail(row)
+        if isEmail(customerEmail):
+            return customerEmail
+        cardName = self._cardName(row)
+        if isEmail(cardName):
+            return cardName
         raise Exception("No Email found")
 
     def parser(self, row) -> Donation:
         return Donation(
                 source=self.SOURCE,
-                paymentId=row["id"],
+                paymentId=self._id(row),
                 donor=self._getEmail(row),
-                paymentDate=datetime.strptime(row["Created (UTC)"], '%d/%m/%Y %H:%M').date(),
+                paymentDate=parseDayMonthYearTime(self._created(row)),
                 type=self._getDonationType(row),
-                money=Money.fromString(row["Currency"].upper()+row["Amount"])
+                money=moneyFromColumns(self._currency(row), self._amount(row))
             )
+
+
+IMPORTERS = [GocardlessTransactionImporter, PaypalTransactionImporter, StripeTransactionImporter]
+
+
+def paymentProviderFromHeader(header):
+    for importer in IMPORTERS:
+        if importer.matchesHeader(header):
+            return importer.SOURCE
+    return None
+
+
+def TransactionImporterFactory(paymentProvider, csvfile, rejectsPath=None):
+    if paymentProvider == PaymentProvider.PAYPAL:
+        return PaypalTransactionImporter(csvfile, rejectsPath)
+    elif paymentProvider == PaymentProvider.GOCARDLESS:
+        return GocardlessTransactionImporter(csvfile, rejectsPath)
+    elif paymentProvider == PaymentProvider.STRIPE:
+        return StripeTransactionImporter(csvfile, rejectsPath)
+    else:
+        raise Exception
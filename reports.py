@@ -1,6 +1,6 @@
 from io import BytesIO
 import xlsxwriter
-from domain import rndDate, getWeekEnds, getMonthEnds, Summary, SummaryFields, Currency, DonationType
+from domain import rndDate, getWeekEnds, getMonthEnds, SummaryFields, Currency, DonationType, summariseRollups
 
 
 WORKBOOKDEFAULTS = {'default_date_format': 'dd/mm/yy'}
@@ -19,15 +19,20 @@ def getDonationsReport(store, startDate, endDate):
     workbook = xlsxwriter.Workbook(output, WORKBOOKDEFAULTS)
     formats = addFormats(workbook)
 
-    donations = store.getDonations(rndDate(startDate, 'month', 'down'), rndDate(endDate, 'month', 'up'))
+    # the sheets are built from the daily rollups, so their cost follows the days in the range rather than the donations
+    rollups = store.getRollups(rndDate(startDate, 'month', 'down'), rndDate(endDate, 'month', 'up'))
+    revenues, counts = summariseRollups(rollups, [SummaryFields.CURRENCY, SummaryFields.MONTH, SummaryFields.TYPE],
+                                        [SummaryFields.MONTH, SummaryFields.TYPE])
     monthEnds = getMonthEnds(startDate, endDate)
-    addRevenuesByMonth(workbook, formats, monthEnds, donations)
-    addDonationsByMonth(workbook, formats, monthEnds, donations)
+    addRevenuesByMonth(workbook, formats, monthEnds, revenues)
+    addDonationsByMonth(workbook, formats, monthEnds, counts)
 
-    donations = store.getDonations(rndDate(startDate, 'week', 'down'), rndDate(endDate, 'week', 'up'))
+    rollups = store.getRollups(rndDate(startDate, 'week', 'down'), rndDate(endDate, 'week', 'up'))
+    revenues, counts = summariseRollups(rollups, [SummaryFields.CURRENCY, SummaryFields.WEEK, SummaryFields.TYPE],
+                                        [SummaryFields.WEEK, SummaryFields.TYPE])
     weekEnds = getWeekEnds(startDate, endDate)
-    addRevenuesByWeek(workbook, formats, weekEnds, donations)
-    addDonationsByWeek(workbook, formats, weekEnds, donations)
+    addRevenuesByWeek(workbook, formats, weekEnds, revenues)
+    addDonationsByWeek(workbook, formats, weekEnds, counts)
 
     # details = store.getDetailDonors()
     # addNewDonorsByMonth(workbook, formats, monthEnds, details)
@@ -64,8 +69,7 @@ def addWorksheet(workbook, title):
     return ws
 
 
-def addRevenuesByMonth(workbook, formats, monthEnds, donations):
-    summary = Summary(donations, [SummaryFields.CURRENCY, SummaryFields.MONTH, SummaryFields.TYPE])
+def addRevenuesByMonth(workbook, formats, monthEnds, summary):
 
     ws = addWorksheet(workbook, 'RevenuesByMonth')
     row = 0
@@ -98,8 +102,7 @@ def addRevenuesByMonth(workbook, formats, monthEnds, donations):
     row = writeRow(ws, row, None, formats['header'], len(monthEnds), formats['header'])
 
 
-def addRevenuesByWeek(workbook, formats, weekEnds, donations):
-    summary = Summary(donations, [SummaryFields.CURRENCY, SummaryFields.WEEK, SummaryFields.TYPE])
+def addRevenuesByWeek(workbook, formats, weekEnds, summary):
 
     ws = addWorksheet(workbook, 'RevenuesByWeek')
     row = 0
@@ -132,8 +135,7 @@ def addRevenuesByWeek(workbook, formats, weekEnds, donations):
     row = writeRow(ws, row, None, formats['header'], len(weekEnds), formats['header'])
 
 
-def addDonationsByMonth(workbook, formats, monthEnds, donations):
-    summary = Summary(donations, [SummaryFields.MONTH, SummaryFields.TYPE])
+def addDonationsByMonth(workbook, formats, monthEnds, summary):
     ws = addWorksheet(workbook, 'DonationsByMonth')
     row = 0
 
@@ -158,8 +160,7 @@ def addDonationsByMonth(workbook, formats, monthEnds, donations):
     row = writeRow(ws, row, None, formats['header'], len(monthEnds), formats['header'])
 
 
-def addDonationsByWeek(workbook, formats, weekEnds, donations):
-    summary = Summary(donations, [SummaryFields.WEEK, SummaryFields.TYPE])
+def addDonationsByWeek(workbook, formats, weekEnds, summary):
     ws = addWorksheet(workbook, 'DonationsByWeek')
     row = 0
 
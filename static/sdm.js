@@ -25,4 +25,40 @@ function showBenefitType() {
     var containers = $(".benefitType")
     containers.hide()
     containers.filter("#type"+selectedType).show()
-}
\ No newline at end of file
+}
+
+function pollImportJob(storeId) {
+    jQuery.getJSON('/donations/imports/' + storeId, function(job) {
+        $("#importStatus").text(job.status.toLowerCase())
+        $("#importParsed").text(job.parsed)
+        $("#importRowsPerSecond").text(job.rowsPerSecond)
+        $("#importAdded").text(job.added)
+        $("#importDupes").text(job.dupes)
+        $("#importBadRows").text(job.badRows)
+        $("#importError").text(job.error || "")
+
+        if (job.status == "QUEUED" || job.status == "RUNNING") {
+            setTimeout(function() { pollImportJob(storeId) }, 1000)
+            return
+        }
+        var rows = $("#importFiles tbody")
+        rows.empty()
+        job.files.forEach(function(file, index) {
+            var row = $("<tr>")
+            var note = file.error || (file.previousImport ? "same file as " + file.previousImport : "")
+            row.append($("<td>").text(file.filename + (note ? " : " + note : "")))
+            row.append($("<td class='text-right text-success'>").text(file.added))
+            row.append($("<td class='text-right text-warning'>").text(file.dupes))
+            var badRows = $("<td class='text-right text-warning'>").text(file.badRows)
+            if (file.rejects) {
+                badRows.append(" ").append($("<a>").attr("href", "/donations/imports/" + storeId + "/rejects/" + index).text("download"))
+            }
+            row.append(badRows)
+            var reasons = Object.keys(file.badRowReasons).map(function(reason) { return reason + " " + file.badRowReasons[reason] })
+            row.append($("<td class='text-muted'>").text(reasons.join(", ")))
+            rows.append(row)
+        })
+        var details = job.files.some(function(file) { return file.previousImport || file.badRows })
+        $("#importFiles").prop("hidden", job.files.length < 2 && !details)
+    });
+}
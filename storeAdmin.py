@@ -0,0 +1,52 @@
+"""
+maintenance of the store's derived tables, for when they are suspected to have drifted from the donations
+
+    python storeAdmin.py --db sdm.db rebuild-rollups
+    python storeAdmin.py --db sdm.db backfill-donors
+    python storeAdmin.py --db sdm.db fail-interrupted-imports
+"""
+import argparse
+import sys
+from infrastructure import StoreConfig, StoreFactory, StoreType, failInterruptedJobs
+
+
+def rebuildRollups(store):
+    store.rebuildRollups()
+
+
+def backfillDonors(store):
+    store.rebuildDonors()
+
+
+def failInterruptedImports(store):
+    for job in failInterruptedJobs(store):
+        print(f"failed import job {job.storeId} of {job.filename}")
+
+
+COMMANDS = {
+    "rebuild-rollups": rebuildRollups,
+    "backfill-donors": backfillDonors,
+    "fail-interrupted-imports": failInterruptedImports,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="maintain the store's derived tables")
+    parser.add_argument("command", choices=list(COMMANDS))
+    parser.add_argument("--db", help="sqlite database, defaults to config.SQLITE3DB")
+    args = parser.parse_args(argv)
+
+    if args.db is None:
+        import config
+        args.db = config.SQLITE3DB
+
+    store = StoreFactory(StoreConfig(StoreType.SQLLITE, args.db))
+    try:
+        COMMANDS[args.command](store)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import json
+import os
+import shutil
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from tempfile import TemporaryDirectory
+from bulkImport import main
+
+
+class Test_BulkImport(unittest.TestCase):
+    directory = os.path.join(os.path.dirname(__file__), 'paymentProviderTransactionFiles')
+
+    def run_main(self, *argv):
+        output = StringIO()
+        with redirect_stdout(output):
+            code = main(list(argv))
+        return code, json.loads(output.getvalue())
+
+    def test_main_imports_directory_and_reports_summary(self):
+        with TemporaryDirectory() as directory:
+            exports = os.path.join(directory, 'exports')
+            os.mkdir(exports)
+            for name in ['paypal.csv', 'stripe.csv', 'gocardless.csv']:
+                shutil.copy(os.path.join(self.directory, name), exports)
+            db = os.path.join(directory, 'store.db')
+
+            code, summary = self.run_main('--db', db, '--workers', '2', exports)
+            self.assertEqual(code, 0)
+            self.assertEqual([os.path.basename(f["filename"]) for f in summary["files"]], ['gocardless.csv', 'paypal.csv', 'stripe.csv'])
+            self.assertEqual((summary["added"], summary["dupes"], summary["badRows"], summary["errors"]), (8, 0, 3, 0))
+            self.assertIn("rowsPerSecond", summary)
+
+            code, summary = self.run_main('--db', db, '--workers', '1', exports)
+            self.assertEqual((summary["added"], summary["alreadyImported"]), (0, 3))
+
+            code, summary = self.run_main('--db', os.path.join(directory, 'single.db'), '--workers', '1', exports)
+            self.assertEqual((summary["added"], summary["dupes"], summary["badRows"], summary["errors"]), (8, 0, 3, 0))
+
+    def test_main_reports_unrecognised_files(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'unknown.csv')
+            with open(path, 'w') as csvfile:
+                csvfile.write("a,b,c\n1,2,3\n")
+            code, summary = self.run_main('--db', os.path.join(directory, 'store.db'), path)
+        self.assertEqual(code, 1)
+        self.assertEqual(summary["errors"], 1)
@@ -0,0 +1,116 @@
+import unittest
+from datetime import date
+from domain import Benefit, BenefitType, Currency, Delivery, Donation, DonationType, Money, PaymentProvider
+from infrastructure import CachingStore, StoreCache, StoreConfig, StoreFactory, StoreType
+from tests import test_sqlliteStore
+
+
+class TestCachingStoreInterface(test_sqlliteStore.TestStoreSqlLite):
+    readsSqlliteTables = False
+
+    def getStore(self):
+        return CachingStore(super().getStore(), StoreCache(1000, 60))
+
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCachingStore(unittest.TestCase):
+    def getStore(self, maxItems=1000, clock=None):
+        inner = StoreFactory(StoreConfig(StoreType.MEMORY, ":memory:"))
+        return CachingStore(inner, StoreCache(maxItems, 60, clock or Clock()))
+
+    def donation(self, paymentId, paymentDate):
+        return Donation(PaymentProvider.STRIPE, paymentId, 'test@test.com', paymentDate, DonationType.ONEOFF, Money(1, Currency('GBP')))
+
+    def benefit(self):
+        return Benefit.Factory(None, BenefitType.AMOUNT, "reward", date(2000, 1, 1), date(2000, 2, 1), Delivery.ONLINE, Money(5, Currency('GBP')), False)
+
+    def test_repeated_reads_hit(self):
+        s = self.getStore()
+        s.insertDonation(self.donation('1', date(2000, 1, 1)))
+        for _ in range(3):
+            self.assertEqual(len(s.getDonations(date(2000, 1, 1), date(2000, 1, 31))), 1)
+            s.getPendingBenefits()
+        stats = s.cache.stats()
+        self.assertEqual(stats["hits"], {"getDonations": 2, "getPendingBenefits": 2})
+        self.assertEqual(stats["misses"], {"getDonations": 1, "getPendingBenefits": 1})
+
+    def test_insertDonation_invalidates_only_reads_covering_its_date(self):
+        s = self.getStore()
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 31))
+        s.getDonations(date(2000, 2, 1), date(2000, 2, 28))
+        list(s.getRollups(date(2000, 1, 1), date(2000, 1, 31)))
+        s.getPendingBenefits()
+        s.insertDonation(self.donation('1', date(2000, 1, 15)))
+        self.assertEqual(s.cache.stats()["invalidations"], 2)
+        self.assertEqual(len(s.getDonations(date(2000, 1, 1), date(2000, 1, 31))), 1)
+        self.assertEqual([r.count for r in s.getRollups(date(2000, 1, 1), date(2000, 1, 31))], [1])
+        s.getDonations(date(2000, 2, 1), date(2000, 2, 28))
+        s.getPendingBenefits()
+        self.assertEqual(s.cache.stats()["hits"], {"getDonations": 1, "getPendingBenefits": 1})
+
+    def test_benefit_writes_invalidate_benefit_reads(self):
+        s = self.getStore()
+        benefit = s.addBenefit(self.benefit())
+        other = s.addBenefit(self.benefit())
+        self.assertEqual(len(s.getPendingBenefits()), 2)
+        s.getBenefit(other._storeId)
+        updated = Benefit.Factory(benefit._storeId, BenefitType.AMOUNT, "new reward", date(2000, 1, 1), date(2000, 2, 1), Delivery.ONLINE,
+                                  Money(5, Currency('GBP')), False)
+        s.updateBenefit(updated)
+        self.assertEqual(s.getBenefit(benefit._storeId).reward, "new reward")
+        self.assertEqual([b.reward for b in s.getPendingBenefits()], ["new reward", "reward"])
+        s.getBenefit(other._storeId)
+        self.assertEqual(s.cache.stats()["hits"], {"getBenefit": 1})
+        s.deleteBenefit(benefit._storeId)
+        self.assertEqual(len(s.getPendingBenefits()), 1)
+
+    def test_cache_is_shared_between_stores(self):
+        cache = StoreCache(1000, 60)
+        inner = StoreFactory(StoreConfig(StoreType.MEMORY, "test_cache_is_shared_between_stores"))
+        reader, writer = CachingStore(inner, cache), CachingStore(StoreFactory(StoreConfig(StoreType.MEMORY, "test_cache_is_shared_between_stores")), cache)
+        self.assertEqual(reader.getDonations(date(2000, 1, 1), date(2000, 1, 1)), [])
+        writer.insertDonation(self.donation('1', date(2000, 1, 1)))
+        self.assertEqual(len(reader.getDonations(date(2000, 1, 1), date(2000, 1, 1))), 1)
+
+    def test_least_recently_used_is_evicted_beyond_maxItems(self):
+        s = self.getStore(maxItems=3)
+        s.insertDonations([self.donation(str(i), date(2000, 1, 1 + i)) for i in range(3)])
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 1))
+        s.getDonations(date(2000, 1, 2), date(2000, 1, 2))
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 1))
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 3))
+        stats = s.cache.stats()
+        self.assertEqual((stats["entries"], stats["items"], stats["evictions"]), (1, 3, 2))
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 3))
+        self.assertEqual(s.cache.stats()["hits"], {"getDonations": 2})
+
+    def test_entries_expire(self):
+        clock = Clock()
+        s = self.getStore(clock=clock)
+        s.getDeliveredBenefits()
+        clock.now = 59
+        s.getDeliveredBenefits()
+        clock.now = 61
+        s.getDeliveredBenefits()
+        self.assertEqual(s.cache.stats()["misses"], {"getDeliveredBenefits": 2})
+
+    def test_read_overtaken_by_a_write_is_not_cached(self):
+        s = self.getStore()
+        inner = s._store
+        read = inner.getDonations
+
+        def slowRead(startDate, endDate):
+            donations = read(startDate, endDate)
+            s.insertDonation(self.donation('1', date(2000, 1, 1)))
+            return donations
+        inner.getDonations = slowRead
+        self.assertEqual(s.getDonations(date(2000, 1, 1), date(2000, 1, 1)), [])
+        inner.getDonations = read
+        self.assertEqual(len(s.getDonations(date(2000, 1, 1), date(2000, 1, 1))), 1)
@@ -1,5 +1,5 @@
 import unittest
-from domain import Currency, Donation, Money, PaymentProvider, DonationType, Summary, SummaryFields, rndDate, Total
+from domain import Currency, Donation, DonationRollup, Money, PaymentProvider, DonationType, Summary, SummaryFields, rndDate, Total, summarise, summariseRollups
 
 from datetime import date, timedelta
 
@@ -25,6 +25,13 @@ class TestDomain(unittest.TestCase):
         s = "50.25 USD"
         self.assertEqual(Money.fromString(s), self.MONEYUSD1)
 
+    def test_Money_fromString_ignores_trailing_text(self):
+        self.assertEqual(Money.fromString("$50.25 each"), self.MONEYUSD1)
+
+    def test_Money_fromString_without_amount_throws(self):
+        with self.assertRaises(ValueError):
+            Money.fromString("GBP")
+
     def test_Money_add_different_currencies_throws(self):
         with self.assertRaises(TypeError):
             _ = self.MONEYUSD1 + self.MONEYGBP1
@@ -33,6 +40,24 @@ class TestDomain(unittest.TestCase):
         x = self.MONEYGBP1 + self.MONEYGBP1
         self.assertEqual(x, Money.fromString("£100.50"))
 
+    def test_Money_holds_minor_units(self):
+        self.assertEqual(Money("0.29", Currency('GBP')).minor, 29)
+        self.assertEqual(Money(0.29, Currency('GBP')).minor, 29)
+        self.assertEqual(Money(-12, Currency('GBP')).minor, -1200)
+        self.assertEqual(Money("1500", Currency('JPY')).minor, 1500)
+        self.assertEqual(Money("1.5e2", Currency('GBP')).minor, 15000)
+        self.assertEqual(Money.fromMinor(5025, Currency('GBP')), self.MONEYGBP1)
+        self.assertEqual(self.MONEYGBP1.amount, 50.25)
+        with self.assertRaises(ValueError):
+            Money("ten", Currency('GBP'))
+
+    def test_Money_sums_exactly(self):
+        total = Money(0, Currency('GBP'))
+        for _ in range(10):
+            total += Money("0.10", Currency('GBP'))
+        self.assertEqual(total, Money(1, Currency('GBP')))
+        self.assertTrue(Money("0.30", Currency('GBP')) >= Money("0.10", Currency('GBP')) + Money("0.20", Currency('GBP')))
+
     TOTAL1 = Total([MONEYGBP1, MONEYUSD1], 2)
 
     def test_Total_initialises_dict(self):
@@ -85,6 +110,13 @@ class TestDomain(unittest.TestCase):
     DONATION1 = Donation(PaymentProvider.GOCARDLESS, 'ksdjhf', 'test@test.com', WEEKSTART, DonationType.ANNUAL, MONEYGBP1)
     DONATION2 = Donation(PaymentProvider.STRIPE, 'ksdjhf', 'test@test.com', WEEKEND, DonationType.MONTHLY, MONEYUSD1)
 
+    def test_Donation_trusted_equals_validated(self):
+        trusted = Donation.trusted(PaymentProvider.GOCARDLESS, 'ksdjhf', 'test@test.com', self.WEEKSTART, DonationType.ANNUAL,
+                                   Money.fromMinor(5025, Currency('GBP')))
+        self.assertEqual(trusted, self.DONATION1)
+        self.assertEqual(hash(trusted), hash(self.DONATION1))
+        self.assertEqual(tuple(trusted), tuple(self.DONATION1))
+
     def test_Summary_does_not_throw(self):
         Summary([self.DONATION1], [])
         self.assertTrue(True)
@@ -101,6 +133,30 @@ class TestDomain(unittest.TestCase):
         summary = Summary([self.DONATION1, self.DONATION1], [SummaryFields.SOURCE])
         self.assertEqual(summary[PaymentProvider.GOCARDLESS].total, {Currency('GBP'): self.MONEYGBP1 + self.MONEYGBP1})
 
+    def test_Summary_reads_iterator_once(self):
+        summary = Summary(iter([self.DONATION1, self.DONATION2, self.DONATION1]), [SummaryFields.SOURCE, SummaryFields.TYPE])
+        self.assertEqual(summary.total.count, 3)
+        self.assertEqual(summary[PaymentProvider.GOCARDLESS][DonationType.ANNUAL].total, {Currency('GBP'): self.MONEYGBP1 + self.MONEYGBP1})
+        self.assertEqual(summary[PaymentProvider.STRIPE].total, {Currency('USD'): self.MONEYUSD1})
+
+    def test_summarise_builds_each_summary(self):
+        bySource, byType = summarise(iter([self.DONATION1, self.DONATION2]), [SummaryFields.SOURCE], [SummaryFields.TYPE])
+        self.assertEqual(list(bySource), [PaymentProvider.GOCARDLESS, PaymentProvider.STRIPE])
+        self.assertEqual(list(byType), [DonationType.ANNUAL, DonationType.MONTHLY])
+        self.assertEqual(byType.total.count, 2)
+
+    def test_Summary_fromRollups_equals_Summary_of_donations(self):
+        fields = [SummaryFields.CURRENCY, SummaryFields.WEEK, SummaryFields.TYPE]
+        donations = [self.DONATION1, self.DONATION1, self.DONATION2]
+        rollups = [DonationRollup(self.WEEKSTART, PaymentProvider.GOCARDLESS, DonationType.ANNUAL, self.MONEYGBP1 + self.MONEYGBP1, 2),
+                   DonationRollup(self.WEEKEND, PaymentProvider.STRIPE, DonationType.MONTHLY, self.MONEYUSD1, 1)]
+        fromRollups = Summary.fromRollups(rollups, fields)
+        self.assertEqual(fromRollups, Summary(donations, fields))
+        self.assertEqual(fromRollups.total.count, 3)
+        self.assertEqual(fromRollups[Currency('GBP')].total.count, 2)
+        counts, = summariseRollups(iter(rollups), [SummaryFields.SOURCE])
+        self.assertEqual(counts[PaymentProvider.GOCARDLESS].total.count, 2)
+
     def test_Summary_has_branches_in_correct_order(self):
         summary = Summary([self.DONATION1], [SummaryFields.SOURCE, SummaryFields.TYPE])
         self.assertTrue(DonationType.ANNUAL in summary[PaymentProvider.GOCARDLESS])
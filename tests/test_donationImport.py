@@ -0,0 +1,263 @@
+import os
+import sqlite3
+import tracemalloc
+import unittest
+import zipfile
+from io import BytesIO
+from datetime import date
+from tempfile import TemporaryDirectory
+from domain import Currency, Donation, DonationType, Money, PaymentProvider
+from infrastructure import DecodingReader, EncodingDetector, PaypalTransactionImporter, StoreConfig, StoreFactory, StoreType, importDonations, importFiles
+from infrastructure import StoreNotFound, expandUpload, paymentProviderFromHeader, saveUpload
+from infrastructure.donationImport import DuplicateIndex, hashFile
+
+
+class Test_DonationImport(unittest.TestCase):
+    directory = os.path.join(os.path.dirname(__file__), 'paymentProviderTransactionFiles')
+    paypalfile = os.path.join(directory, 'paypal.csv')
+    stripefile = os.path.join(directory, 'stripe.csv')
+    gocardlessfile = os.path.join(directory, 'gocardless.csv')
+
+    def getStore(self):
+        s = StoreFactory(StoreConfig(StoreType.SQLLITE, ":memory:"))
+        s.setupStore()
+        return s
+
+    def test_DecodingReader_splits_lines_across_blocks(self):
+        text = "a,£1\r\nb,£2\nc,£3\rd,£4"
+        lines = list(DecodingReader(BytesIO(text.encode('utf-8')), 'utf-8', blockSize=3))
+        self.assertEqual(lines, ["a,£1\r\n", "b,£2\n", "c,£3\r", "d,£4"])
+
+    def test_DecodingReader_matches_file_lines(self):
+        with open(self.paypalfile, newline='', encoding='utf-8') as csvfile:
+            expected = list(csvfile)
+        with open(self.paypalfile, 'rb') as stream:
+            lines = list(DecodingReader(stream, 'utf-8', blockSize=7))
+        self.assertEqual(lines, expected)
+
+    def test_DecodingReader_replaces_undecodable_bytes(self):
+        for encoding, data, expected, undecodable in [
+                ('utf-8', "a,£1\nb,".encode('utf-8') + b"\xa3" + "2\nc,£3\n".encode('utf-8') + b"d\xff",
+                 ["a,£1\n", "b,\ufffd2\n", "c,£3\n", "d\ufffd"], {2, 4}),
+                ('utf-16-le', "a\nb".encode('utf-16-le') + b"\x00\xdc" + "\nc\n".encode('utf-16-le'),
+                 ["a\n", "b\ufffd\ufffd\n", "c\n"], {2})]:
+            reader = DecodingReader(BytesIO(data), encoding, blockSize=3)
+            self.assertEqual(list(reader), expected)
+            self.assertEqual(reader.undecodableLines, undecodable)
+
+    def test_importFiles_rejects_undecodable_rows_after_encoding_sample(self):
+        with open(self.paypalfile, 'rb') as stream:
+            data = stream.read()
+        detector = EncodingDetector(sampleSize=400)
+        self.assertGreater(data.index(b'donor2'), 400)
+        s = self.getStore()
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paypal.csv')
+            with open(path, 'wb') as stream:
+                stream.write(data.replace(b'donor1 Lorenz', 'Zoë Müller'.encode('utf-8')).replace(b'"donor2"', b'"donor\xa32"'))
+            [result] = importFiles(s, expandUpload('paypal.csv', path), workers=1, encodingDetector=detector)
+            self.assertEqual((result.added, result.badRows, result.error), (2, 2, None))
+            self.assertEqual(result.badRowReasons["UnicodeDecodeError"], 1)
+            # not recorded in the import ledger, so uploading the file again retries the rejected row
+            with self.assertRaises(StoreNotFound):
+                s.getLedgerEntry(result.sha256)
+            [again] = importFiles(s, expandUpload('paypal.csv', path), workers=1, encodingDetector=detector)
+        self.assertEqual((again.previousImport, again.dupes, again.badRows), (None, 2, 2))
+
+    def test_importFiles_uses_confirmed_encoding_for_ascii_sample(self):
+        with open(self.paypalfile, encoding='utf-8') as csvfile:
+            text = csvfile.read().replace('donor2@', 'René@')
+        self.assertGreater(text.index('René'), 400)
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paypal.csv')
+            with open(path, 'w', encoding='windows-1252', newline='') as csvfile:
+                csvfile.write(text)
+            # confirmed for the provider, or found by the reader once the first non ascii byte does not decode as utf-8
+            for confirmed in ['windows-1252', None]:
+                detector = EncodingDetector(sampleSize=400)
+                if confirmed:
+                    detector.confirm(PaymentProvider.PAYPAL, confirmed)
+                s = self.getStore()
+                [result] = importFiles(s, expandUpload('paypal.csv', path), workers=1, encodingDetector=detector)
+                self.assertEqual((result.added, result.badRows), (3, 1))
+                self.assertNotIn("UnicodeDecodeError", result.badRowReasons)
+                self.assertEqual(s.getLedgerEntry(result.sha256).added, 3)
+                self.assertIn("René@test.com", [donation.donor for donation in s.getDonations(date(2018, 1, 1), date(2019, 12, 31))])
+
+    def test_DecodingReader_changes_encoding_of_ascii_start(self):
+        data = "a,1\nb,2\n".encode('utf-8') + "René,3\n".encode('windows-1252')
+        reader = DecodingReader(BytesIO(data), 'utf-8', blockSize=4, redetect=lambda data: 'windows-1252')
+        self.assertEqual(list(reader), ["a,1\n", "b,2\n", "René,3\n"])
+        self.assertEqual((reader.encoding, reader.undecodableLines), ('windows-1252', set()))
+
+        data = "Zoë,1\n".encode('utf-8') + "René,3\n".encode('windows-1252')
+        reader = DecodingReader(BytesIO(data), 'utf-8', blockSize=4, redetect=lambda data: 'windows-1252')
+        self.assertEqual(list(reader), ["Zoë,1\n", "Ren\ufffd,3\n"])
+        self.assertEqual((reader.encoding, reader.undecodableLines), ('utf-8', {2}))
+
+    def test_importFiles_confirms_encodings_to_shared_detector(self):
+        with open(self.paypalfile, encoding='utf-8') as csvfile:
+            text = csvfile.read().replace('donor1 Lorenz', 'Zoë Müller')
+        detector = EncodingDetector()
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'paypal.csv')
+            with open(path, 'w', encoding='cp1252', newline='') as csvfile:
+                csvfile.write(text)
+            with open(path, 'rb') as stream:
+                encoding = detector.detect(stream, PaymentProvider.PAYPAL)
+            [result] = importFiles(self.getStore(), expandUpload('paypal.csv', path), workers=1, encodingDetector=detector)
+        self.assertEqual(result.added, 3)
+        self.assertEqual(detector.detect(BytesIO('Zoë'.encode('cp1252')), PaymentProvider.PAYPAL), encoding)
+
+    def test_importDonations_counts_added_dupes_and_badRows(self):
+        s = self.getStore()
+        with open(self.paypalfile, 'rb') as stream:
+            result = importDonations(s, PaypalTransactionImporter(DecodingReader(stream, 'utf-8')), 'paypal.csv', chunkSize=2)
+        self.assertEqual((result.added, result.dupes, result.badRows), (3, 0, 1))
+
+        with open(self.paypalfile, 'rb') as stream:
+            result = importDonations(s, PaypalTransactionImporter(DecodingReader(stream, 'utf-8')), 'paypal.csv')
+        self.assertEqual((result.added, result.dupes, result.badRows), (0, 3, 1))
+
+    def test_saveUpload_hashes_content(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'upload')
+            with open(self.paypalfile, 'rb') as stream:
+                sha256 = saveUpload(stream, path)
+            self.assertEqual(sha256, hashFile(expandUpload('paypal.csv', self.paypalfile)[0]))
+            with open(path, 'rb') as saved, open(self.paypalfile, 'rb') as original:
+                self.assertEqual(saved.read(), original.read())
+
+    def test_importDonations_skips_identical_file(self):
+        s = self.getStore()
+        sha256 = hashFile(expandUpload('paypal.csv', self.paypalfile)[0])
+        with open(self.paypalfile, 'rb') as stream:
+            importDonations(s, PaypalTransactionImporter(DecodingReader(stream, 'utf-8')), 'paypal.csv', sha256=sha256)
+        entry = s.getLedgerEntry(sha256)
+        self.assertEqual((entry.paymentProvider, entry.rows, entry.added, entry.badRows), (PaymentProvider.PAYPAL, 4, 3, 1))
+
+        with open(self.paypalfile, 'rb') as stream:
+            result = importDonations(s, PaypalTransactionImporter(DecodingReader(stream, 'utf-8')), 'again.csv', sha256=sha256)
+        self.assertEqual((result.parsed, result.previousImport), (0, 'paypal.csv'))
+
+    def test_importDonations_raises_when_import_cannot_be_recorded(self):
+        s = self.getStore()
+        sha256 = hashFile(expandUpload('paypal.csv', self.paypalfile)[0])
+        with open(self.paypalfile, 'rb') as stream, self.assertRaises(sqlite3.IntegrityError):
+            importDonations(s, PaypalTransactionImporter(DecodingReader(stream, 'utf-8')), None, sha256=sha256)
+        with self.assertRaises(StoreNotFound):
+            s.getLedgerEntry(sha256)
+
+    def test_importFiles_skips_identical_file(self):
+        s = self.getStore()
+        importFiles(s, expandUpload('paypal.csv', self.paypalfile), workers=1)
+        results = importFiles(s, expandUpload('again.csv', self.paypalfile) + expandUpload('stripe.csv', self.stripefile), workers=1)
+        self.assertEqual([(r.filename, r.added, r.previousImport) for r in results], [('again.csv', 0, 'paypal.csv'), ('stripe.csv', 2, None)])
+
+    def paypalFile(self, directory, name, rows):
+        with open(self.paypalfile, newline='', encoding='utf-8') as csvfile:
+            header = csvfile.readline()
+        path = os.path.join(directory, name)
+        with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+            csvfile.write(header)
+            for paymentId, day, status in rows:
+                csvfile.write(f'"{day}","12:00:00","GMT","donor","Donation Payment","{status}","GBP","10","-0.54","9.46","{paymentId}@test.com",'
+                              f'"worldpay@spiked-online.com","{paymentId}","Verified","","Unconfirmed","","","1","","United Kingdom","","","Credit",""\n')
+        return expandUpload(name, path)
+
+    def test_importFiles_adds_donation_completed_inside_earlier_import(self):
+        s = self.getStore()
+        with TemporaryDirectory() as directory:
+            january = self.paypalFile(directory, 'jan.csv', [('T1', '01/01/2019', 'Completed'), ('T2', '15/01/2019', 'Pending'),
+                                                             ('T3', '30/01/2019', 'Completed')])
+            february = self.paypalFile(directory, 'feb.csv', [('T2', '15/01/2019', 'Completed'), ('T4', '02/02/2019', 'Completed')])
+            importFiles(s, january, workers=1)
+            [result] = importFiles(s, february, workers=1)
+        self.assertEqual((result.added, result.dupes), (2, 0))
+        self.assertEqual(sorted(d.paymentId for d in s.getDonations(date(2019, 1, 1), date(2019, 12, 31))), ['T1', 'T2', 'T3', 'T4'])
+
+    def donation(self, paymentId, paymentDate, source=PaymentProvider.GOCARDLESS):
+        return Donation(source, paymentId, 'test@test.com', paymentDate, DonationType.ONEOFF, Money(1, Currency('GBP')))
+
+    def test_DuplicateIndex_splits_known_keys_without_inserting(self):
+        s = self.getStore()
+        s.insertDonation(self.donation('1', date(2019, 1, 31)))
+        s.insertDonation(self.donation('2', date(2019, 2, 1), PaymentProvider.STRIPE))
+
+        new, dupes = DuplicateIndex(s).split([
+            self.donation('1', date(2019, 1, 31)),
+            self.donation('2', date(2019, 2, 1)),
+            self.donation('2', date(2019, 2, 1)),
+            self.donation('2', date(2019, 2, 1), PaymentProvider.STRIPE),
+        ])
+        self.assertEqual([(d.source, d.paymentId) for d in new], [(PaymentProvider.GOCARDLESS, '2')])
+        self.assertEqual(len(dupes), 3)
+        self.assertEqual(len(s.getDonations(date(2019, 1, 1), date(2019, 12, 31))), 2)
+
+    def test_DuplicateIndex_loads_each_month_once(self):
+        s = self.getStore()
+        calls = []
+        getDonationKeys = s.getDonationKeys
+        s.getDonationKeys = lambda *args: calls.append(args) or getDonationKeys(*args)
+        index = DuplicateIndex(s)
+        index.split([self.donation('1', date(2019, 1, 5)), self.donation('2', date(2019, 3, 5))])
+        index.split([self.donation('3', date(2019, 2, 5)), self.donation('4', date(2019, 3, 6))])
+        self.assertEqual(calls, [(PaymentProvider.GOCARDLESS, date(2019, 1, 1), date(2019, 3, 31))])
+
+    def test_paymentProviderFromHeader_recognises_each_provider(self):
+        for path, expected in [(self.paypalfile, PaymentProvider.PAYPAL), (self.stripefile, PaymentProvider.STRIPE),
+                               (self.gocardlessfile, PaymentProvider.GOCARDLESS)]:
+            with open(path, newline='', encoding='utf-8') as csvfile:
+                self.assertEqual(paymentProviderFromHeader(csvfile.readline()), expected)
+        self.assertIsNone(paymentProviderFromHeader("a,b,c"))
+
+    def test_importFiles_memory_does_not_grow_with_files(self):
+        """
+        the keys of the donations added are kept to find duplicates, but no file's donations are held whole
+        """
+        def peak(run):
+            tracemalloc.start()
+            try:
+                result = run()
+                return tracemalloc.get_traced_memory()[1], result
+            finally:
+                tracemalloc.stop()
+
+        def importInto(files):
+            s = StoreFactory(StoreConfig(StoreType.SQLLITE, os.path.join(directory, f'{len(files)}.db')))
+            try:
+                return importFiles(s, files, workers=2, chunkSize=100)
+            finally:
+                s.close()
+
+        def parse(importFile):
+            with importFile.open() as stream:
+                return list(PaypalTransactionImporter(DecodingReader(stream, 'utf-8')))
+
+        with TemporaryDirectory() as directory:
+            files = []
+            for file in range(6):
+                files += self.paypalFile(directory, f'{file}.csv', [(f'T{file}-{row}', f'{1 + row % 28:02}/01/2019', 'Completed') for row in range(1500)])
+            oneFile, _ = peak(lambda: parse(files[0]))
+            fewer, _ = peak(lambda: importInto(files[:2]))
+            more, results = peak(lambda: importInto(files))
+        self.assertEqual([result.added for result in results], [1500] * 6)
+        self.assertLess((more - fewer) / 4, oneFile / 2)
+
+    def test_importFiles_reports_per_file(self):
+        with TemporaryDirectory() as directory:
+            archive = os.path.join(directory, 'upload')
+            with zipfile.ZipFile(archive, 'w') as z:
+                z.write(self.paypalfile, 'month/paypal.csv')
+                z.write(self.stripefile, 'month/stripe.csv')
+                z.writestr('month/readme.txt', 'not a csv')
+            files = expandUpload('month.zip', archive) + expandUpload('gocardless.csv', self.gocardlessfile)
+            self.assertEqual([f.name for f in files], ['month.zip/month/paypal.csv', 'month.zip/month/stripe.csv', 'gocardless.csv'])
+
+            for workers in [1, 2]:
+                results = importFiles(self.getStore(), files, workers=workers)
+                self.assertEqual([(r.filename, r.added, r.dupes, r.badRows, r.error) for r in results], [
+                    ('month.zip/month/paypal.csv', 3, 0, 1, None),
+                    ('month.zip/month/stripe.csv', 2, 0, 2, None),
+                    ('gocardless.csv', 3, 0, 0, None),
+                ])
@@ -0,0 +1,44 @@
+import codecs
+import unittest
+from io import BytesIO
+from domain import PaymentProvider
+from infrastructure import EncodingDetector
+
+
+class Test_EncodingDetector(unittest.TestCase):
+    TEXT = "Date,Name,Gross\n01/01/2019,Zoë Müller,£10\n"
+
+    def test_detect_uses_bom(self):
+        stream = BytesIO(codecs.BOM_UTF16_LE + self.TEXT.encode('utf-16-le'))
+        self.assertEqual(EncodingDetector().detect(stream), 'utf-16')
+        self.assertEqual(stream.tell(), 0)
+
+    def test_detect_utf8_bom(self):
+        stream = BytesIO(codecs.BOM_UTF8 + self.TEXT.encode('utf-8'))
+        self.assertEqual(EncodingDetector().detect(stream), 'utf-8-sig')
+
+    def test_detect_utf8_ignores_multibyte_split_by_sample(self):
+        data = self.TEXT.encode('utf-8')
+        split = data.index('£'.encode('utf-8')) + 1
+        detector = EncodingDetector(sampleSize=split)
+        self.assertEqual(detector.detect(BytesIO(data)), 'utf-8')
+
+    def test_detect_falls_back_to_chardet(self):
+        stream = BytesIO((self.TEXT * 20).encode('cp1252'))
+        self.assertNotEqual(EncodingDetector().detect(stream), 'utf-8')
+        self.assertEqual(stream.tell(), 0)
+
+    def test_detect_uses_confirmed_provider_encoding(self):
+        detector = EncodingDetector()
+        detector.confirm(PaymentProvider.PAYPAL, 'latin-1')
+        stream = BytesIO(self.TEXT.encode('latin-1'))
+        self.assertEqual(detector.detect(stream, PaymentProvider.PAYPAL), 'latin-1')
+        self.assertNotEqual(detector.detect(stream, PaymentProvider.STRIPE), 'latin-1')
+
+    def test_detect_uses_confirmed_provider_encoding_for_ascii_sample(self):
+        detector = EncodingDetector(sampleSize=20)
+        detector.confirm(PaymentProvider.PAYPAL, 'windows-1252')
+        detector.confirm(PaymentProvider.STRIPE, 'utf-16-le')
+        stream = BytesIO(self.TEXT.encode('windows-1252'))
+        self.assertEqual(detector.detect(stream, PaymentProvider.PAYPAL), 'windows-1252')
+        self.assertEqual(detector.detect(stream, PaymentProvider.STRIPE), 'utf-8')
@@ -0,0 +1,96 @@
+import os
+import stat
+import time
+import unittest
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+from domain import ImportJob, ImportJobStatus, PaymentProvider
+from infrastructure import ImportJobRunner, StoreConfig, StoreFactory, StoreNotFound, StoreType, expandUpload, failInterruptedJobs
+
+
+class Test_ImportJobs(unittest.TestCase):
+    directory = os.path.join(os.path.dirname(__file__), 'paymentProviderTransactionFiles')
+    paypalfile = os.path.join(directory, 'paypal.csv')
+    stripefile = os.path.join(directory, 'stripe.csv')
+
+    def getStore(self):
+        s = StoreFactory(StoreConfig(StoreType.SQLLITE, ":memory:"))
+        s.setupStore()
+        return s
+
+    def test_addImportJob_sets_storeId(self):
+        s = self.getStore()
+        job = s.addImportJob(ImportJob(filename="paypal.csv", paymentProvider=PaymentProvider.PAYPAL))
+        self.assertEqual(s.getImportJob(job.storeId), job)
+
+    def test_updateImportJob_updates(self):
+        s = self.getStore()
+        job = s.addImportJob(ImportJob(filename="paypal.csv", paymentProvider=PaymentProvider.PAYPAL))
+        job.status = ImportJobStatus.DONE
+        job.added = 3
+        job.files = [{"filename": "paypal.csv", "added": 3}]
+        s.updateImportJob(job)
+        self.assertEqual(s.getImportJob(job.storeId), job)
+
+    def test_getImportJob_Raises_StoreNotFound(self):
+        with self.assertRaises(StoreNotFound):
+            self.getStore().getImportJob("1")
+
+    def test_getUnfinishedImportJobs_returns_queued_and_running(self):
+        s = self.getStore()
+        jobs = [s.addImportJob(ImportJob(filename=f"{status.name}.csv", paymentProvider=PaymentProvider.PAYPAL)) for status in ImportJobStatus]
+        for job, status in zip(jobs, ImportJobStatus):
+            job.status = status
+            s.updateImportJob(job)
+        self.assertEqual([job.filename for job in s.getUnfinishedImportJobs()], ['QUEUED.csv', 'RUNNING.csv'])
+
+    def test_ImportJobRunner_removes_old_rejects(self):
+        with TemporaryDirectory() as directory:
+            runner = ImportJobRunner(lambda: None, workers=1, rejectsDirectory=directory, rejectsRetention=timedelta(days=7))
+            runner.shutdown()
+            for storeId in ["1", "2"]:
+                os.mkdir(os.path.join(directory, storeId))
+                with open(runner.rejectsPath(storeId, 0), 'w') as csvfile:
+                    csvfile.write("line,reason\n")
+            old = time.time() - timedelta(days=8).total_seconds()
+            os.utime(os.path.join(directory, "1"), (old, old))
+            runner.removeOldRejects()
+            self.assertEqual(os.listdir(directory), ["2"])
+
+    def test_failInterruptedJobs_fails_unfinished_jobs(self):
+        s = self.getStore()
+        running = s.addImportJob(ImportJob(filename="paypal.csv", paymentProvider=PaymentProvider.PAYPAL, status=ImportJobStatus.RUNNING))
+        done = s.addImportJob(ImportJob(filename="stripe.csv", paymentProvider=PaymentProvider.STRIPE, status=ImportJobStatus.DONE))
+        self.assertEqual([job.storeId for job in failInterruptedJobs(s)], [running.storeId])
+        interrupted = s.getImportJob(running.storeId)
+        self.assertEqual(interrupted.status, ImportJobStatus.FAILED)
+        self.assertIsNotNone(interrupted.finished)
+        self.assertIn("interrupted", interrupted.error)
+        self.assertEqual(s.getImportJob(done.storeId), done)
+        self.assertEqual(s.getUnfinishedImportJobs(), [])
+
+    def test_ImportJobRunner_records_progress(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'))
+            s = StoreFactory(config)
+            runner = ImportJobRunner(lambda: StoreFactory(config), workers=1, rejectsDirectory=os.path.join(directory, 'rejects'))
+            single = runner.submit(s, 'paypal.csv', expandUpload('paypal.csv', self.paypalfile), PaymentProvider.PAYPAL)
+            multiple = runner.submit(s, 'paypal.csv, stripe.csv', expandUpload('paypal.csv', self.paypalfile) + expandUpload('stripe.csv', self.stripefile),
+                                     PaymentProvider.PAYPAL)
+            runner.shutdown()
+
+            single = s.getImportJob(single.storeId)
+            self.assertEqual(single.status, ImportJobStatus.DONE)
+            self.assertEqual((single.parsed, single.added, single.dupes, single.badRows), (4, 3, 0, 1))
+            self.assertTrue(single.files[0]["rejects"])
+            self.assertEqual(sum(single.files[0]["badRowReasons"].values()), 1)
+            self.assertTrue(os.path.exists(runner.rejectsPath(single.storeId, 0)))
+
+            multiple = s.getImportJob(multiple.storeId)
+            self.assertEqual(multiple.status, ImportJobStatus.DONE)
+            self.assertEqual((multiple.added, multiple.dupes, multiple.badRows), (2, 0, 2))
+            self.assertEqual([(f["filename"], f["previousImport"]) for f in multiple.files], [('paypal.csv', 'paypal.csv'), ('stripe.csv', None)])
+            self.assertTrue(os.path.exists(runner.rejectsPath(multiple.storeId, 1)))
+            for path in [runner.rejectsDirectory, os.path.dirname(runner.rejectsPath(single.storeId, 0))]:
+                self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+            s.close()
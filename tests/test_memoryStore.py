@@ -0,0 +1,32 @@
+from datetime import date
+from domain import Currency, Donation, DonationType, Money, PaymentProvider
+from infrastructure import StoreConfig, StoreFactory, StoreMemory, StoreType
+from tests import test_sqlliteStore
+
+
+class TestStoreMemory(test_sqlliteStore.TestStoreSqlLite):
+    readsSqlliteTables = False
+
+    @property
+    def config(self):
+        return StoreConfig(StoreType.MEMORY, ":memory:")
+
+    def test_StoreFactory_makes_StoreMemory(self):
+        self.assertIsInstance(self.getStore(), StoreMemory)
+
+    def test_named_stores_share_donations(self):
+        donation = Donation(PaymentProvider.STRIPE, '1', 'test@test.com', date(1990, 11, 11), DonationType.ONEOFF, Money(1, Currency('GBP')))
+        StoreFactory(StoreConfig(StoreType.MEMORY, "test_named_stores_share_donations")).insertDonation(donation)
+        self.assertEqual(StoreFactory(StoreConfig(StoreType.MEMORY, "test_named_stores_share_donations")).getDonation(donation.source, '1'), donation)
+        self.assertEqual(self.getStore().getDonations(date(1990, 11, 11), date(1990, 11, 11)), [])
+
+    def test_getDonations_reads_donations_added_between_reads(self):
+        s = self.getStore()
+        donations = [Donation(PaymentProvider.STRIPE, str(i), 'test@test.com', date(1990, 11, 11 - i % 5), DonationType.ONEOFF,
+                              Money(1, Currency('GBP')))
+                     for i in range(10)]
+        s.insertDonations(donations[:5])
+        self.assertEqual(len(s.getDonations(date(1990, 11, 7), date(1990, 11, 9))), 3)
+        s.insertDonations(donations[5:])
+        result = s.getDonations(date(1990, 11, 7), date(1990, 11, 9))
+        self.assertEqual([d.paymentId for d in result], ['4', '9', '3', '8', '2', '7'])
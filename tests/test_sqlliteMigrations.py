@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import unittest
+from datetime import date
+from tempfile import TemporaryDirectory
+from domain import Benefit, BenefitType, Currency, Delivery, Money, PaymentProvider
+from infrastructure import StoreConfig, StoreFactory, StoreNotFound, StoreType
+from infrastructure.storeSqllite import (CMD_GET_CURRENT_BENEFITS, CMD_GET_DELIVERED_BENEFITS, CMD_GET_DETAIL_DONORS, CMD_GET_DONATIONS,
+                                         CMD_GET_DONATION_KEYS_BY_DATE, CMD_GET_PENDING_BENEFITS, MIGRATIONS, Migration, getQualifyingQuery,
+                                         migrate)
+
+# the schema before migrations, with text dates and float amounts
+LEGACY_DONATIONS = """
+    CREATE TABLE donations(source TEXT NOT NULL, paymentId TEXT NOT NULL, donor TEXT NOT NULL, date TEXT NOT NULL, type TEXT NOT NULL,
+                           amount INT NOT NULL, currency TEXT NOT NULL, PRIMARY KEY(source, paymentId));"""
+LEGACY_BENEFITS = """
+    CREATE TABLE benefits(id INTEGER PRIMARY KEY, type TEXT NOT NULL, reward TEXT NOT NULL, startDate TEXT NOT NULL, endDate TEXT NOT NULL,
+                          delivery TEXT NOT NULL, minAmount FLOAT NULL, minAmountCurrency TEXT NULL, completed INT NOT NULL);"""
+
+
+class TestStoreSqlLiteMigrations(unittest.TestCase):
+    def getStore(self):
+        s = StoreFactory(StoreConfig(StoreType.SQLLITE, ":memory:"))
+        s.setupStore()
+        return s
+
+    def test_setupStore_applies_every_migration(self):
+        self.assertEqual(self.getStore().schemaVersion, MIGRATIONS[-1].version)
+
+    def test_connect_migrates_an_existing_store(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'store.db')
+            connection = sqlite3.connect(path)
+            connection.execute(LEGACY_BENEFITS)
+            connection.execute(LEGACY_DONATIONS)
+            connection.execute("INSERT INTO donations VALUES ('PAYPAL', '1', 'test@test.com', '2019-01-01', 'ONEOFF', 10.29, 'GBP')")
+            connection.execute("INSERT INTO benefits VALUES (1, 'AMOUNT', 'REWARD', '2019-01-01', '2019-02-01', 'ONLINE', 50.0, 'gbp', 0)")
+            connection.commit()
+            connection.close()
+
+            s = StoreFactory(StoreConfig(StoreType.SQLLITE, path))
+            self.assertEqual(s.schemaVersion, MIGRATIONS[-1].version)
+            donations = s.getDonations(date(2019, 1, 1), date(2019, 1, 1))
+            self.assertEqual([d.money for d in donations], [Money("10.29", Currency('GBP'))])
+            self.assertEqual(donations[0].paymentDate, date(2019, 1, 1))
+            benefit = s.getBenefit("1")
+            self.assertEqual((benefit.minAmount, benefit.startDate, benefit.endDate), (Money(50, Currency('GBP')), date(2019, 1, 1), date(2019, 2, 1)))
+            self.assertEqual(s._connection.execute("SELECT typeof(date) FROM donations").fetchone()[0], "integer")
+            with self.assertRaises(StoreNotFound):
+                s.getLedgerEntry('ab12')
+            self.assertEqual([(r.count, r.money) for r in s.getRollups(date(2019, 1, 1), date(2019, 1, 1))], [(1, Money("10.29", Currency('GBP')))])
+            self.assertEqual([(d.donor, d.firstPaymentDate, d.count, d.total) for d in s.getDetailDonors()],
+                             [('test@test.com', date(2019, 1, 1), 1, {Currency('GBP'): Money("10.29", Currency('GBP'))})])
+            s.close()
+
+    def test_connect_keeps_the_order_donations_were_inserted_in(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'store.db')
+            connection = sqlite3.connect(path)
+            connection.execute(LEGACY_BENEFITS)
+            connection.execute(LEGACY_DONATIONS)
+            for paymentId in ['3', '1', '2']:
+                connection.execute("INSERT INTO donations VALUES ('PAYPAL', ?, 'test@test.com', '2019-01-01', 'ONEOFF', 10, 'GBP')", (paymentId,))
+            connection.commit()
+            connection.close()
+
+            s = StoreFactory(StoreConfig(StoreType.SQLLITE, path))
+            self.assertEqual([row[0] for row in s._connection.execute("SELECT paymentId FROM donations ORDER BY rowid")], ['3', '1', '2'])
+            s.close()
+
+    def test_migrate_rolls_back_a_failed_migration(self):
+        s = self.getStore()
+        version = s.schemaVersion
+        failing = Migration(version + 1, "fails", ["CREATE TABLE extra(id INT)", "NOT SQL"])
+        with self.assertRaises(sqlite3.OperationalError):
+            migrate(s._connection, MIGRATIONS + [failing])
+        self.assertEqual(s.schemaVersion, version)
+        self.assertIsNone(s._connection.execute("SELECT 1 FROM sqlite_master WHERE name='extra'").fetchone())
+
+        migrate(s._connection, MIGRATIONS + [Migration(version + 1, "adds a table", ["CREATE TABLE extra(id INT)"])])
+        self.assertEqual(s.schemaVersion, version + 1)
+
+    def assertUsesIndex(self, s, cmd, args=()):
+        plan = [row[3] for row in s._connection.execute("EXPLAIN QUERY PLAN " + cmd, args)]
+        tableReads = [step for step in plan if step.split(' ')[:2][-1].lower() in ('donations', 'benefits', 'donors')]
+        self.assertTrue(tableReads, plan)
+        for step in tableReads:
+            self.assertIn(" USING ", step, plan)
+            self.assertIn("INDEX", step, plan)
+            self.assertNotIn("AUTOMATIC", step, plan)
+
+    def test_queries_use_indexes(self):
+        s = self.getStore()
+        d = date(2019, 1, 1)
+        self.assertUsesIndex(s, CMD_GET_DONATIONS, (d, d))
+        self.assertUsesIndex(s, CMD_GET_DONATION_KEYS_BY_DATE, (PaymentProvider.PAYPAL.name, d, d))
+        self.assertUsesIndex(s, CMD_GET_DETAIL_DONORS)
+        self.assertUsesIndex(s, CMD_GET_CURRENT_BENEFITS, (d,))
+        self.assertUsesIndex(s, CMD_GET_DELIVERED_BENEFITS)
+        self.assertUsesIndex(s, CMD_GET_PENDING_BENEFITS, (d,))
+        for benefitType in BenefitType:
+            benefit = Benefit.Factory(None, benefitType, "REWARD", date(2018, 1, 1), date(2018, 2, 28), Delivery.ONLINE, Money(50, Currency.gbp), False)
+            self.assertUsesIndex(s, *getQualifyingQuery(benefit))
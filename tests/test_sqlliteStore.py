@@ -1,10 +1,27 @@
+import random
 import unittest
-from datetime import date, timedelta
-from domain import Benefit, Currency, Delivery, Donation, DonationType, Money, PaymentProvider, BenefitType
+from datetime import date, datetime, timedelta
+from domain import Benefit, Currency, Delivery, Donation, DonationType, Money, PaymentProvider, BenefitType, ImportLedgerEntry
 from infrastructure import StoreConfig, StoreDuplicate, StoreFactory, StoreNotFound, StoreType
 
 
+def sqlliteOnly(test):
+    """
+    for tests that reach into the sqlite tables, skipped when the suite runs against another backend
+    """
+    def run(self):
+        if not self.readsSqlliteTables:
+            self.skipTest("reads the sqlite tables")
+        test(self)
+    return run
+
+
 class TestStoreSqlLite(unittest.TestCase):
+    """
+    the tests of the Store interface, run against other stores by overriding config or getStore
+    """
+    readsSqlliteTables = True
+
     @property
     def config(self):
         return StoreConfig(StoreType.SQLLITE, ":memory:")
@@ -61,6 +78,84 @@ class TestStoreSqlLite(unittest.TestCase):
         result = s.getDonations(startDate=d-timedelta(days=14), endDate=d-timedelta(days=10))
         self.assertEqual(len(result), 0)
 
+    def test_insertDonations_inserts_all(self):
+        s = self.getStore()
+        donations = [Donation(PaymentProvider.GOCARDLESS, str(i), 'test@test.com', date(1990, 11, 11), DonationType.ONEOFF, Money(1, Currency('GBP')))
+                     for i in range(1200)]
+        added, dupes = s.insertDonations(donations, chunkSize=100)
+        self.assertEqual(len(added), 1200)
+        self.assertEqual(len(dupes), 0)
+        self.assertEqual(len(s.getDonations(date(1990, 11, 11), date(1990, 11, 11))), 1200)
+
+    def test_iterDonations_reads_in_batches(self):
+        s = self.getStore()
+        donations = [Donation(PaymentProvider.GOCARDLESS, str(i), 'test@test.com', date(1990, 11, 11) + timedelta(days=i % 3), DonationType.ONEOFF,
+                              Money(1, Currency('GBP')))
+                     for i in range(25)]
+        s.insertDonations(donations)
+        result = s.iterDonations(date(1990, 11, 11), date(1990, 11, 12), batchSize=4)
+        self.assertEqual(next(result).paymentId, '0')
+        self.assertEqual(sorted(d.paymentId for d in result), sorted(d.paymentId for d in donations[1:] if d.paymentDate <= date(1990, 11, 12)))
+        with self.assertRaises(ValueError):
+            s.iterDonations(date(1990, 11, 12), date(1990, 11, 11))
+
+    def test_insertDonations_reports_dupes(self):
+        s = self.getStore()
+        s.insertDonation(self.donation)
+        other = Donation(PaymentProvider.STRIPE, 'ksdjhf', 'test@test.com', date(1990, 11, 11), DonationType.ANNUAL, Money(1, Currency('GBP')))
+        added, dupes = s.insertDonations([self.donation, other, other])
+        self.assertEqual(added, [other])
+        self.assertEqual(dupes, [self.donation, other])
+
+    def rollupsOf(self, s, startDate, endDate):
+        return sorted((r.paymentDate, r.source.name, r.type.name, r.money.currency.name, r.count, r.money.minor) for r in s.getRollups(startDate, endDate))
+
+    def test_rollups_are_maintained_on_insert(self):
+        s = self.getStore()
+        s.insertDonation(self.donation)
+        donations = [Donation(PaymentProvider.STRIPE, str(i), 'test@test.com', date(1990, 11, 11) + timedelta(days=i % 2), DonationType.ONEOFF,
+                              Money(i, Currency('GBP')))
+                     for i in range(10)]
+        s.insertDonations(donations + [self.donation], chunkSize=3)
+        with self.assertRaises(StoreDuplicate):
+            s.insertDonation(self.donation)
+        self.assertEqual(self.rollupsOf(s, date(1990, 11, 11), date(1990, 11, 12)), [
+            (date(1990, 11, 11), "GOCARDLESS", "ANNUAL", "GBP", 1, 100),
+            (date(1990, 11, 11), "STRIPE", "ONEOFF", "GBP", 5, 2000),
+            (date(1990, 11, 12), "STRIPE", "ONEOFF", "GBP", 5, 2500),
+        ])
+        self.assertEqual(self.rollupsOf(s, date(1990, 11, 12), date(1990, 11, 12))[0][4], 5)
+        with self.assertRaises(ValueError):
+            s.getRollups(date(1990, 11, 12), date(1990, 11, 11))
+
+    @sqlliteOnly
+    def test_rebuildRollups_matches_maintained(self):
+        s = self.getStore()
+        s.insertDonations([Donation(PaymentProvider.PAYPAL, str(i), 'test@test.com', date(1990, 11, 1) + timedelta(days=i % 7), DonationType.MONTHLY,
+                                    Money(i, Currency('USD')))
+                           for i in range(50)])
+        maintained = self.rollupsOf(s, date(1990, 1, 1), date(1990, 12, 31))
+        s._connection.execute("DELETE FROM donationsByDay")
+        s.rebuildRollups()
+        self.assertEqual(self.rollupsOf(s, date(1990, 1, 1), date(1990, 12, 31)), maintained)
+        self.assertEqual(sum(r[4] for r in maintained), 50)
+
+    def ledgerEntry(self, sha256, firstDate):
+        return ImportLedgerEntry(sha256, 'paypal.csv', PaymentProvider.PAYPAL, 4, 3, 0, 1, firstDate, firstDate + timedelta(days=30),
+                                 datetime(2020, 1, 1, 12, 30))
+
+    def test_addLedgerEntry_gets_by_sha256(self):
+        s = self.getStore()
+        entry = self.ledgerEntry('ab12', date(2019, 1, 1))
+        s.addLedgerEntry(entry)
+        self.assertEqual(s.getLedgerEntry('ab12'), entry)
+        with self.assertRaises(StoreDuplicate):
+            s.addLedgerEntry(entry)
+
+    def test_getLedgerEntry_Raises_StoreNotFound(self):
+        with self.assertRaises(StoreNotFound):
+            self.getStore().getLedgerEntry('ab12')
+
     @property
     def BENEFIT_AMOUNT1(self):
         return Benefit.Factory(None, BenefitType.AMOUNT, "REWARD", date(2018, 1, 1), date(2018, 2, 28), Delivery.ONLINE, Money(50, Currency.gbp), False)
@@ -106,6 +201,15 @@ class TestStoreSqlLite(unittest.TestCase):
         result = s.getCurrentBenefits()
         self.assertEqual(0, len(result))
 
+    def test_benefit_ending_today_is_pending(self):
+        s = self.getStore()
+        today = date.today()
+        for reward, endDate in [("ends today", today), ("ends tomorrow", today + timedelta(days=1))]:
+            s.addBenefit(Benefit.Factory(None, BenefitType.AMOUNT, reward, today - timedelta(days=30), endDate, Delivery.ONLINE,
+                                         Money(50, Currency.gbp), False))
+        self.assertEqual([b.reward for b in s.getPendingBenefits()], ["ends today"])
+        self.assertEqual([b.reward for b in s.getCurrentBenefits()], ["ends tomorrow"])
+
     def getQualifyingDonorsResult(self, benefit):
         donations = [
             Donation(
@@ -466,3 +570,118 @@ class TestStoreSqlLite(unittest.TestCase):
         self.assertEqual(details[0].firstPaymentDate, date(1990, 1, 1))
         self.assertEqual(details[0].lastPaymentDate, date(1990, 2, 3))
 
+    def test_getDetailDonors_is_maintained_on_insert(self):
+        s = self.getStore()
+        s.insertDonation(Donation(PaymentProvider.STRIPE, "1", "b@test.com", date(1990, 3, 1), DonationType.ONEOFF, Money.fromString('£10')))
+        s.insertDonations([
+            Donation(PaymentProvider.STRIPE, "2", "b@test.com", date(1990, 1, 1), DonationType.ONEOFF, Money.fromString('£2.50')),
+            Donation(PaymentProvider.STRIPE, "3", "b@test.com", date(1990, 2, 1), DonationType.ONEOFF, Money.fromString('$5')),
+            Donation(PaymentProvider.STRIPE, "4", "a@test.com", date(1990, 2, 1), DonationType.ONEOFF, Money.fromString('£1')),
+            Donation(PaymentProvider.STRIPE, "1", "b@test.com", date(1990, 3, 1), DonationType.ONEOFF, Money.fromString('£10')),
+        ], chunkSize=2)
+        details = s.getDetailDonors()
+        self.assertEqual([tuple(d) for d in details], [("b@test.com", date(1990, 1, 1), date(1990, 3, 1)),
+                                                       ("a@test.com", date(1990, 2, 1), date(1990, 2, 1))])
+        self.assertEqual(details[0].count, 3)
+        self.assertEqual(details[0].total, {Currency('GBP'): Money.fromString('£12.50'), Currency('USD'): Money.fromString('$5')})
+        self.assertEqual(details[1].total.count, 1)
+
+    @sqlliteOnly
+    def test_rebuildDonors_matches_maintained(self):
+        s = self.getStore()
+        s.insertDonations([Donation(PaymentProvider.PAYPAL, str(i), f'{i % 4}@test.com', date(1990, 11, 1) + timedelta(days=i % 7), DonationType.MONTHLY,
+                                    Money(i, Currency('USD')))
+                           for i in range(50)])
+        maintained = s.getDetailDonors()
+        s._connection.execute("DELETE FROM donors")
+        s._connection.execute("DELETE FROM donorTotals")
+        s.rebuildDonors()
+        self.assertEqual(s.getDetailDonors(), maintained)
+        self.assertEqual(sum(d.count for d in maintained), 50)
+
+    def test_getQualifyingDonors_NEWDONOR_ignores_earlier_smaller_donations(self):
+        s = self.getStore()
+        benefit = Benefit.Factory(None, BenefitType.NEWDONOR, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE, Money.fromString("£10"), False)
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "1", "returning@test.com", date(1990, 1, 1), DonationType.ONEOFF, Money.fromString('£1')))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "2", "returning@test.com", date(1990, 2, 2), DonationType.ONEOFF, Money.fromString('£20')))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "3", "new@test.com", date(1990, 2, 2), DonationType.ONEOFF, Money.fromString('£1')))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "4", "new@test.com", date(1990, 2, 3), DonationType.ONEOFF, Money.fromString('£20')))
+        self.assertEqual(s.getQualifyingDonors(benefit), ["new@test.com"])
+
+    def cachedDonors(self, s, benefit):
+        return [row[0] for row in s._connection.execute("SELECT donor FROM benefitDonors WHERE benefitId=?", (int(benefit._storeId),))]
+
+    @sqlliteOnly
+    def test_getQualifyingDonors_is_cached_until_a_donation_arrives_in_the_window(self):
+        s = self.getStore()
+        benefit = s.addBenefit(Benefit.Factory(None, BenefitType.AMOUNT, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE,
+                                               Money.fromString("£10"), False))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "1", "a@test.com", date(1990, 2, 1), DonationType.ONEOFF, Money.fromString('£10')))
+        self.assertEqual(s.getQualifyingDonors(benefit), ["a@test.com"])
+        self.assertEqual(self.cachedDonors(s, benefit), ["a@test.com"])
+
+        # answered from the cache, so a row planted in it is returned
+        s._connection.execute("INSERT INTO benefitDonors VALUES (?, 'planted@test.com')", (int(benefit._storeId),))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "2", "b@test.com", date(1990, 3, 2), DonationType.ONEOFF, Money.fromString('£10')))
+        self.assertEqual(s.getQualifyingDonors(benefit), ["a@test.com", "planted@test.com"])
+
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "3", "c@test.com", date(1990, 3, 1), DonationType.ONEOFF, Money.fromString('£10')))
+        self.assertEqual(s.getQualifyingDonors(benefit), ["a@test.com", "c@test.com"])
+
+    @sqlliteOnly
+    def test_updateBenefit_forgets_cached_donors(self):
+        s = self.getStore()
+        benefit = s.addBenefit(Benefit.Factory(None, BenefitType.AMOUNT, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE,
+                                               Money.fromString("£10"), False))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "1", "a@test.com", date(1990, 2, 1), DonationType.ONEOFF, Money.fromString('£5')))
+        self.assertEqual(s.getQualifyingDonors(benefit), [])
+        updated = Benefit.Factory(benefit._storeId, BenefitType.AMOUNT, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE,
+                                  Money.fromString("£5"), False)
+        s.updateBenefit(updated)
+        self.assertEqual(s.getQualifyingDonors(updated), ["a@test.com"])
+        s.deleteBenefit(benefit._storeId)
+        self.assertEqual(self.cachedDonors(s, benefit), [])
+
+    def test_getQualifyingDonors_NEWDONOR_cache_sees_earlier_donations(self):
+        s = self.getStore()
+        benefit = s.addBenefit(Benefit.Factory(None, BenefitType.NEWDONOR, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE,
+                                               Money.fromString("£1"), False))
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "1", "a@test.com", date(1990, 2, 1), DonationType.ONEOFF, Money.fromString('£10')))
+        self.assertEqual(s.getQualifyingDonors(benefit), ["a@test.com"])
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "2", "a@test.com", date(1989, 1, 1), DonationType.ONEOFF, Money.fromString('£10')))
+        self.assertEqual(s.getQualifyingDonors(benefit), [])
+
+    def test_evaluateBenefits_agrees_with_each_qualifying_query(self):
+        r = random.Random(0)
+        s = self.getStore()
+        s.insertDonations([Donation(r.choice(list(PaymentProvider)), str(i), f"donor{r.randrange(40)}@test.com",
+                                    date(1990, 1, 1) + timedelta(days=r.randrange(200)), DonationType.ONEOFF,
+                                    Money(r.choice([1, 5, 10, 20]), r.choice([Currency('GBP'), Currency('USD')])))
+                           for i in range(2000)])
+        s.insertDonations([Donation(PaymentProvider.STRIPE, f"late{i}", f"late{i % 10}@test.com", date(1990, 6, 1) + timedelta(days=r.randrange(30)),
+                                    DonationType.ONEOFF, Money(r.choice([1, 10]), r.choice([Currency('GBP'), Currency('USD')])))
+                           for i in range(40)])
+        benefits = []
+        for benefitType in BenefitType:
+            for startDay, days, minAmount in [(0, 60, "£20"), (30, 90, "£10"), (150, 40, "$5"), (400, 30, "£1"), (10, 100, "$50")]:
+                start = date(1990, 1, 1) + timedelta(days=startDay)
+                benefits.append(s.addBenefit(Benefit.Factory(None, benefitType, "reward", start, start + timedelta(days=days), Delivery.ONLINE,
+                                                             Money.fromString(minAmount), False)))
+        result = s.evaluateBenefits(benefits)
+        # each benefit's own qualifying query, on a sqlite store holding the same donations
+        reference = StoreFactory(StoreConfig(StoreType.SQLLITE, ":memory:"))
+        reference.setupStore()
+        reference.insertDonations(s.getDonations(date(1990, 1, 1), date(1990, 12, 31)))
+        self.assertEqual(result, {benefit._storeId: reference._findQualifyingDonors(benefit) for benefit in benefits})
+        self.assertTrue(all(any(result[benefit._storeId] for benefit in benefits if benefit.type == benefitType) for benefitType in BenefitType))
+        self.assertEqual(result, s.evaluateBenefits(benefits))
+        self.assertEqual(s.getQualifyingDonors(benefits[0]), result[benefits[0]._storeId])
+
+    def test_evaluateBenefits_leaves_out_benefits_that_are_not_stored(self):
+        s = self.getStore()
+        s.insertDonation(Donation(PaymentProvider.GOCARDLESS, "1", "a@test.com", date(1990, 2, 1), DonationType.ONEOFF, Money.fromString('£10')))
+        stored = s.addBenefit(Benefit.Factory(None, BenefitType.AMOUNT, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE,
+                                              Money.fromString("£5"), False))
+        unsaved = Benefit.Factory(None, BenefitType.AMOUNT, "reward", date(1990, 2, 1), date(1990, 3, 1), Delivery.ONLINE,
+                                  Money.fromString("£1"), False)
+        self.assertEqual(s.evaluateBenefits([unsaved, stored]), {stored._storeId: ["a@test.com"]})
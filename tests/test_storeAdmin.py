@@ -0,0 +1,55 @@
+import os
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from datetime import date
+from tempfile import TemporaryDirectory
+from domain import Currency, Donation, DonationType, ImportJob, ImportJobStatus, Money, PaymentProvider
+from infrastructure import StoreConfig, StoreFactory, StoreType
+from storeAdmin import main
+
+
+class Test_StoreAdmin(unittest.TestCase):
+    def test_rebuild_rollups_regenerates_from_donations(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'))
+            s = StoreFactory(config)
+            s.insertDonation(Donation(PaymentProvider.PAYPAL, '1', 'test@test.com', date(2019, 1, 1), DonationType.ONEOFF, Money(5, Currency('GBP'))))
+            s._connection.execute("DELETE FROM donationsByDay")
+            s._connection.commit()
+            s.close()
+
+            self.assertEqual(main(['--db', config.connnectionString, 'rebuild-rollups']), 0)
+
+            s = StoreFactory(config)
+            self.assertEqual([(r.count, r.money) for r in s.getRollups(date(2019, 1, 1), date(2019, 1, 1))], [(1, Money(5, Currency('GBP')))])
+            s.close()
+
+    def test_backfill_donors_regenerates_from_donations(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'))
+            s = StoreFactory(config)
+            s.insertDonation(Donation(PaymentProvider.PAYPAL, '1', 'test@test.com', date(2019, 1, 1), DonationType.ONEOFF, Money(5, Currency('GBP'))))
+            s._connection.execute("DELETE FROM donors")
+            s._connection.commit()
+            s.close()
+
+            self.assertEqual(main(['--db', config.connnectionString, 'backfill-donors']), 0)
+
+            s = StoreFactory(config)
+            self.assertEqual([tuple(d) for d in s.getDetailDonors()], [('test@test.com', date(2019, 1, 1), date(2019, 1, 1))])
+            s.close()
+
+    def test_fail_interrupted_imports_fails_unfinished_jobs(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'))
+            s = StoreFactory(config)
+            job = s.addImportJob(ImportJob(filename="paypal.csv", paymentProvider=PaymentProvider.PAYPAL, status=ImportJobStatus.RUNNING))
+            s.close()
+
+            with redirect_stdout(StringIO()):
+                self.assertEqual(main(['--db', config.connnectionString, 'fail-interrupted-imports']), 0)
+
+            s = StoreFactory(config)
+            self.assertEqual(s.getImportJob(job.storeId).status, ImportJobStatus.FAILED)
+            s.close()
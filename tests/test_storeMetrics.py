@@ -0,0 +1,101 @@
+import unittest
+from datetime import date
+from domain import Currency, Donation, DonationType, Money, PaymentProvider
+from infrastructure import StoreConfig, StoreMetrics, StoreSqlLite, StoreType
+from infrastructure.storeMetrics import ITERATIONBATCHSIZE, timedMethod
+
+
+class TestStoreMetrics(unittest.TestCase):
+    def getStore(self, **kwargs):
+        self.metrics = StoreMetrics()
+        s = StoreSqlLite(StoreConfig(StoreType.SQLLITE, ":memory:", **kwargs), self.metrics)
+        s.setupStore()
+        self.metrics.reset()
+        return s
+
+    def donations(self, count):
+        return [Donation(PaymentProvider.STRIPE, str(i), f'{i}@test.com', date(2000, 1, 1 + i % 28), DonationType.ONEOFF,
+                         Money(1, Currency('GBP'))) for i in range(count)]
+
+    def test_records_calls_rows_and_decode_time(self):
+        s = self.getStore()
+        s.insertDonations(self.donations(10))
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 31))
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 31))
+        stats = self.metrics.snapshot()["getDonations"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["rows"], 20)
+        self.assertGreater(stats["decodeSeconds"], 0)
+        self.assertLessEqual(stats["decodeSeconds"], stats["seconds"])
+        self.assertEqual(sum(stats["histogram"].values()), 2)
+
+    def test_lazy_reads_are_recorded_once_read(self):
+        s = self.getStore()
+        s.insertDonations(self.donations(10))
+        donations = s.iterDonations(date(2000, 1, 1), date(2000, 1, 31), batchSize=3)
+        self.assertNotIn("iterDonations", self.metrics.snapshot())
+        self.assertEqual(len(list(donations)), 10)
+        stats = self.metrics.snapshot()["iterDonations"]
+        self.assertEqual((stats["calls"], stats["rows"]), (1, 10))
+
+    def test_abandoned_lazy_reads_are_recorded(self):
+        s = self.getStore()
+        s.insertDonations(self.donations(10))
+        donations = s.iterDonations(date(2000, 1, 1), date(2000, 1, 31), batchSize=3)
+        next(donations)
+        donations.close()
+        self.assertEqual(self.metrics.snapshot()["iterDonations"]["rows"], 3)
+
+    def test_calls_between_methods_are_counted_once(self):
+        s = self.getStore()
+        s.insertDonations(self.donations(10))
+        s.getDonations(date(2000, 1, 1), date(2000, 1, 31))
+        self.assertNotIn("iterDonations", self.metrics.snapshot())
+
+    def test_failed_calls_are_recorded(self):
+        s = self.getStore()
+        with self.assertRaises(Exception):
+            s.getDonation(PaymentProvider.STRIPE, "missing")
+        self.assertEqual(self.metrics.snapshot()["getDonation"]["calls"], 1)
+
+    def test_iterated_rows_are_counted(self):
+        s = self.getStore()
+        s.insertDonations(self.donations(ITERATIONBATCHSIZE * 2 + 1))
+        self.metrics.reset()
+
+        def iterate(store):
+            cursor = store._connection.execute("SELECT paymentId FROM donations")
+            return [next(cursor)] + list(cursor)
+        self.assertEqual(len(timedMethod("iterate", iterate)(s)), ITERATIONBATCHSIZE * 2 + 1)
+        self.assertEqual(self.metrics.snapshot()["iterate"]["rows"], ITERATIONBATCHSIZE * 2 + 1)
+
+    def test_slow_queries_are_logged_with_their_plan(self):
+        s = self.getStore(slowQuerySeconds=0)
+        s.insertDonations(self.donations(1))
+        with self.assertLogs(level="WARNING") as logs:
+            s.getDonation(PaymentProvider.STRIPE, "0")
+        output = "\n".join(logs.output)
+        self.assertIn("slow query in getDonation", output)
+        self.assertIn("FROM donations", output)
+        self.assertIn("parameters: 2 (str)", output)
+        self.assertNotIn("'0'", output)
+        self.assertIn("plan:\nSEARCH", output)
+
+    def test_fast_queries_are_not_logged(self):
+        s = self.getStore()
+        s.insertDonations(self.donations(1))
+        with self.assertNoLogs(level="WARNING"):
+            s.getDonation(PaymentProvider.STRIPE, "0")
+
+    def test_snapshot_orders_by_total_time(self):
+        metrics = StoreMetrics()
+        metrics.record("quick", 0.001, 1, 0)
+        metrics.record("slow", 0.3, 1, 0)
+        metrics.record("slow", 3, 1, 0)
+        snapshot = metrics.snapshot()
+        self.assertEqual(list(snapshot), ["slow", "quick"])
+        self.assertEqual(snapshot["slow"]["histogram"]["<=0.5s"], 1)
+        self.assertEqual(snapshot["slow"]["histogram"]["<=5s"], 1)
+        self.assertEqual(snapshot["slow"]["maxSeconds"], 3)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
@@ -0,0 +1,62 @@
+import os
+import unittest
+from datetime import date
+from tempfile import TemporaryDirectory
+from domain import Currency, Donation, DonationType, Money, PaymentProvider
+from infrastructure import StoreConfig, StoreFactory, StorePool, StoreType
+
+
+class TestStorePool(unittest.TestCase):
+    def donation(self, paymentId):
+        return Donation(PaymentProvider.PAYPAL, paymentId, 'test@test.com', date(2019, 1, 1), DonationType.ONEOFF, Money(1, Currency('GBP')))
+
+    def test_acquire_reuses_released_store(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'), poolSize=1)
+            pool = StorePool(lambda: StoreFactory(config), config.poolSize)
+            first = pool.acquire()
+            second = pool.acquire()
+            self.assertIsNot(first, second)
+            pool.release(first)
+            pool.release(second)
+            self.assertIs(pool.acquire(), first)
+            with self.assertRaises(Exception):
+                second.getDonations(date(2019, 1, 1), date(2019, 1, 1))
+            pool.release(first)
+            pool.close()
+
+    def test_release_discards_uncommitted_writes(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'))
+            pool = StorePool(lambda: StoreFactory(config), config.poolSize)
+            with pool.store() as s:
+                s._connection.execute("INSERT INTO donations VALUES ('PAYPAL', '1', 'test@test.com', '2019-01-01', 'ONEOFF', 1, 'GBP')")
+            with pool.store() as s:
+                self.assertEqual(s.getDonations(date(2019, 1, 1), date(2019, 1, 1)), [])
+            pool.close()
+
+    def test_connection_applies_pragmas(self):
+        with TemporaryDirectory() as directory:
+            s = StoreFactory(StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'), cacheSize=-2000, busyTimeout=250))
+            pragma = lambda name: s._connection.execute(f"PRAGMA {name}").fetchone()[0]  # noqa: E731
+            self.assertEqual(pragma("journal_mode"), "wal")
+            self.assertEqual(pragma("synchronous"), 1)
+            self.assertEqual(pragma("cache_size"), -2000)
+            self.assertEqual(pragma("busy_timeout"), 250)
+            s.close()
+
+    def test_writer_commits_while_reader_is_reading(self):
+        with TemporaryDirectory() as directory:
+            config = StoreConfig(StoreType.SQLLITE, os.path.join(directory, 'store.db'), busyTimeout=0)
+            reader = StoreFactory(config)
+            writer = StoreFactory(config)
+            writer.insertDonation(self.donation('1'))
+
+            reader._connection.execute("BEGIN")
+            self.assertEqual(len(reader.getDonations(date(2019, 1, 1), date(2019, 1, 1))), 1)
+            writer.insertDonations([self.donation('2'), self.donation('3')])
+            self.assertEqual(len(reader.getDonations(date(2019, 1, 1), date(2019, 1, 1))), 1)
+            reader._connection.rollback()
+            self.assertEqual(len(reader.getDonations(date(2019, 1, 1), date(2019, 1, 1))), 3)
+            reader.close()
+            writer.close()
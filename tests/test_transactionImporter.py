@@ -1,9 +1,14 @@
 # encoding: utf-8
+import csv
 import os
 import unittest
 from datetime import date
+from io import StringIO
+from tempfile import TemporaryDirectory
 from domain import Donation, DonationType, Money, PaymentProvider
 from infrastructure import GocardlessTransactionImporter, PaypalTransactionImporter, StripeTransactionImporter
+from infrastructure.transactionimporter import parseDayMonthYear, parseDayMonthYearTime
+from benchmarks.transactionFiles import TransactionFileGenerator
 
 
 class Test_TransactionImporter(unittest.TestCase):
@@ -130,3 +135,49 @@ class Test_TransactionImporter(unittest.TestCase):
             for _ in importer:
                 result += 1
             self.assertEqual(2, result)
+
+    def test_parseDayMonthYear_reads_fixed_and_unpadded_formats(self):
+        self.assertEqual(parseDayMonthYear('26/11/2018'), date(2018, 11, 26))
+        self.assertEqual(parseDayMonthYear('1/2/2019'), date(2019, 2, 1))
+        with self.assertRaises(ValueError):
+            parseDayMonthYear('31/02/2019')
+
+    def test_parseDayMonthYearTime_reads_date(self):
+        self.assertEqual(parseDayMonthYearTime('19/02/2019 13:07'), date(2019, 2, 19))
+        with self.assertRaises(ValueError):
+            parseDayMonthYearTime('19/02/2019 25:07')
+
+    def test_PaypalImporter_badRows_writes_line_and_row(self):
+        with TemporaryDirectory() as directory, open(self.paypalBadRows, newline='') as csvfile:
+            rejectsPath = os.path.join(directory, 'rejects.csv')
+            importer = PaypalTransactionImporter(csvfile=csvfile, rejectsPath=rejectsPath)
+            donations = [x for x in importer]
+            self.assertEqual(0, len(donations))
+            with open(rejectsPath, newline='', encoding='utf-8') as rejects:
+                rows = list(csv.DictReader(rejects))
+            self.assertEqual(len(rows), len(importer.badRows))
+            self.assertEqual([row["line"] for row in rows[:2]], ['2', '3'])
+            self.assertEqual(rows[0]["Name"], "baddate")
+            self.assertEqual(sum(importer.badRows.reasons.values()), len(importer.badRows))
+
+    def test_badRows_stops_writing_at_limit(self):
+        with TemporaryDirectory() as directory, open(self.paypalBadRows, newline='') as csvfile:
+            rejectsPath = os.path.join(directory, 'rejects.csv')
+            importer = PaypalTransactionImporter(csvfile=csvfile, rejectsPath=rejectsPath)
+            importer.badRows.limit = 1
+            list(importer)
+            with open(rejectsPath, newline='', encoding='utf-8') as rejects:
+                self.assertEqual(len(list(csv.DictReader(rejects))), 1)
+            self.assertTrue(importer.badRows.truncated)
+            self.assertGreater(len(importer.badRows), 1)
+
+    def test_generated_files_are_importable(self):
+        for paymentProvider, importer in [(PaymentProvider.GOCARDLESS, GocardlessTransactionImporter), (PaymentProvider.PAYPAL, PaypalTransactionImporter),
+                                          (PaymentProvider.STRIPE, StripeTransactionImporter)]:
+            csvfile = StringIO(newline='')
+            TransactionFileGenerator(paymentProvider, refunds=0.1, notCompleted=0.1, badRows=0.1).write(csvfile, 1000)
+            csvfile.seek(0)
+            importer = importer(csvfile)
+            donations = [x for x in importer]
+            self.assertEqual(len(donations) + len(importer.badRows), 1000)
+            self.assertTrue(200 < len(importer.badRows) < 400, paymentProvider)